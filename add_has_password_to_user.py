@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Миграция: Добавление поля has_password в таблицу user
+
+Поле хранит признак наличия пароля (password_hash не пустой), чтобы вход
+не проверял строку хеша. Существующие записи заполняются по password_hash.
+"""
+import sys
+import os
+from sqlalchemy import inspect, text
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+
+def add_has_password_to_user(app):
+    from modules.core import get_db
+
+    with app.app_context():
+        db = get_db()
+        inspector = inspect(db.engine)
+
+        try:
+            columns = [col['name'] for col in inspector.get_columns('user')]
+
+            if 'has_password' not in columns:
+                print("Добавляем поле has_password в таблицу user...")
+                with db.engine.connect() as conn:
+                    if db.engine.name == 'postgresql':
+                        conn.execute(text('ALTER TABLE "user" ADD COLUMN has_password BOOLEAN DEFAULT FALSE NOT NULL'))
+                    else:  # sqlite
+                        conn.execute(text('ALTER TABLE user ADD COLUMN has_password BOOLEAN DEFAULT 0 NOT NULL'))
+                    conn.execute(text(
+                        'UPDATE "user" SET has_password = (password_hash IS NOT NULL AND password_hash <> \'\')'
+                    ))
+                    conn.commit()
+                print("✅ Поле has_password добавлено в таблицу user")
+            else:
+                print("✅ Поле has_password уже существует в таблице user")
+
+        except Exception as e:
+            print(f"❌ Ошибка при добавлении поля has_password: {e}")
+            import traceback
+            traceback.print_exc()
+            return False
+        return True
+
+
+if __name__ == '__main__':
+    from flask import Flask
+    from modules.core import init_app
+
+    flask_app = Flask(__name__)
+    init_app(flask_app)
+    success = add_has_password_to_user(flask_app)
+    sys.exit(0 if success else 1)
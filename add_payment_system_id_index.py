@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+"""
+Скрипт для добавления индекса по полю payment_system_id в таблицу payment
+Индекс нужен для поиска платежа по ID в платёжной системе (статус платежа, вебхуки)
+"""
+
+import sys
+import os
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from modules.core import get_db, get_app
+
+app = get_app()
+db = get_db()
+
+with app.app_context():
+    try:
+        # Проверяем, существует ли уже индекс
+        from sqlalchemy import inspect, text
+        inspector = inspect(db.engine)
+        indexes = [index['name'] for index in inspector.get_indexes('payment')]
+        
+        if 'ix_payment_payment_system_id' in indexes:
+            print("ℹ️  Индекс ix_payment_payment_system_id уже существует в таблице payment")
+        else:
+            # Добавляем индекс
+            db.session.execute(text("""
+                CREATE INDEX IF NOT EXISTS ix_payment_payment_system_id
+                ON payment (payment_system_id)
+            """))
+            db.session.commit()
+            print("✅ Индекс ix_payment_payment_system_id добавлен в таблицу payment")
+    except Exception as e:
+        error_msg = str(e).lower()
+        if 'already exists' in error_msg or 'существует' in error_msg or 'duplicate' in error_msg:
+            print("ℹ️  Индекс ix_payment_payment_system_id уже существует в таблице payment")
+        else:
+            print(f"❌ Ошибка при добавлении индекса: {e}")
+            db.session.rollback()
+            raise
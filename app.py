@@ -29,9 +29,13 @@ app = Flask(__name__,
 
 # Инициализируем центральный модуль
 from modules.core import init_app, get_db
+from modules.cors import init_cors
 init_app(app)
 db = get_db()
 
+# CORS мини-приложений: preflight на уровне WSGI, заголовки ответов в after_request
+init_cors(app)
+
 # ============================================================================
 # ИМПОРТ МОДЕЛЕЙ (для db.create_all())
 # ============================================================================
@@ -65,95 +69,123 @@ from modules.api.bot import routes as bot_routes
 # ADMIN PANEL - Отдача статических файлов админки
 # ============================================================================
 
-@app.route('/payment-success.html')
-def payment_success():
-    """Страница успешной оплаты с автоматическим редиректом в Telegram"""
-    # Пробуем найти payment-success.html в разных местах
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    possible_paths = [
-        # Docker путь (приоритет)
-        '/app/frontend/build/miniapp-v2/payment-success.html',
-        '/app/frontend/build/miniapp/payment-success.html',
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Стандартные пути к сборкам мини-приложений (в порядке приоритета)
+MINIAPP_POSSIBLE_PATHS = {
+    'miniapp': tuple(dict.fromkeys([
+        # Docker путь
+        '/app/frontend/build/miniapp',
         # Абсолютные пути
-        '/opt/remnawave-STEALTHNET-Panel/frontend/build/miniapp-v2/payment-success.html',
-        '/opt/remnawave-STEALTHNET-Panel/frontend/build/miniapp/payment-success.html',
-        '/opt/remnawave-STEALTHNET-panel/frontend/build/miniapp-v2/payment-success.html',
-        '/opt/remnawave-STEALTHNET-panel/frontend/build/miniapp/payment-success.html',
-        '/opt/remnawave-STEALTHNET-PANEL/frontend/build/miniapp-v2/payment-success.html',
-        '/opt/remnawave-STEALTHNET-PANEL/frontend/build/miniapp/payment-success.html',
-        '/opt/admin/frontend/build/miniapp-v2/payment-success.html',
-        '/opt/admin/frontend/build/miniapp/payment-success.html',
+        '/opt/remnawave-STEALTHNET-Panel/frontend/build/miniapp',
+        '/opt/remnawave-STEALTHNET-panel/frontend/build/miniapp',
+        '/opt/remnawave-STEALTHNET-PANEL/frontend/build/miniapp',
+        '/opt/admin/frontend/build/miniapp',
         # Относительные пути
-        os.path.join(base_dir, 'frontend', 'build', 'miniapp-v2', 'payment-success.html'),
-        os.path.join(base_dir, 'frontend', 'build', 'miniapp', 'payment-success.html'),
-        os.path.join(base_dir, 'admin-panel', 'miniapp-v2', 'payment-success.html'),
-        os.path.join(base_dir, 'admin-panel', 'miniapp', 'payment-success.html'),
-        os.path.join(base_dir, 'admin-panel', 'payment-success.html')
-    ]
+        os.path.join(BASE_DIR, 'frontend', 'build', 'miniapp'),
+        os.path.join(BASE_DIR, 'admin-panel', 'miniapp'),
+        os.path.join(BASE_DIR, 'admin-panel', 'build', 'miniapp'),
+        os.path.join(BASE_DIR, 'miniapp'),
+        '/opt/admin/admin-panel/miniapp',
+        '/opt/admin/admin-panel/build/miniapp',
+        '/opt/admin/miniapp',
+        '/var/www/admin-panel/miniapp',
+        '/var/www/admin-panel/build/miniapp'
+    ])),
+    'miniapp-v2': tuple(dict.fromkeys([
+        # Docker путь
+        '/app/frontend/build/miniapp-v2',
+        # Абсолютные пути
+        '/opt/remnawave-STEALTHNET-Panel/frontend/build/miniapp-v2',
+        '/opt/remnawave-STEALTHNET-panel/frontend/build/miniapp-v2',
+        '/opt/remnawave-STEALTHNET-PANEL/frontend/build/miniapp-v2',
+        '/opt/admin/frontend/build/miniapp-v2',
+        # Относительные пути
+        os.path.join(BASE_DIR, 'frontend', 'build', 'miniapp-v2'),
+        os.path.join(BASE_DIR, 'admin-panel', 'miniapp-v2'),
+        os.path.join(BASE_DIR, 'admin-panel', 'build', 'miniapp-v2'),
+        '/opt/admin/admin-panel/miniapp-v2',
+        '/opt/admin/admin-panel/build/miniapp-v2'
+    ]))
+}
+
+# Найденные каталоги мини-приложений и страница оплаты: путь не меняется после
+# запуска, поэтому перебор кандидатов выполняется до первого успешного поиска
+_miniapp_dirs = {}
+
+
+def get_miniapp_dir(name, env_var):
+    """Получить путь к папке мини-приложения (с index.html) или None"""
+    miniapp_dir = _miniapp_dirs.get(name)
+    if miniapp_dir:
+        return miniapp_dir
     
-    for path in possible_paths:
-        if os.path.exists(path):
-            dir_path = os.path.dirname(path)
-            file_name = os.path.basename(path)
-            response = send_from_directory(dir_path, file_name)
-            response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-            response.headers['Pragma'] = 'no-cache'
-            response.headers['Expires'] = '0'
-            return response
+    candidates = (os.getenv(env_var, "").strip(),) + MINIAPP_POSSIBLE_PATHS[name]
+    for p in candidates:
+        if p and os.path.isfile(os.path.join(p, 'index.html')):
+            _miniapp_dirs[name] = p
+            return p
+    
+    # Сборка может появиться позже - не запоминаем отсутствие
+    return None
+
+
+# Пути к странице успешной оплаты (в порядке приоритета)
+PAYMENT_SUCCESS_POSSIBLE_PATHS = tuple(dict.fromkeys([
+    # Docker путь (приоритет)
+    '/app/frontend/build/miniapp-v2/payment-success.html',
+    '/app/frontend/build/miniapp/payment-success.html',
+    # Абсолютные пути
+    '/opt/remnawave-STEALTHNET-Panel/frontend/build/miniapp-v2/payment-success.html',
+    '/opt/remnawave-STEALTHNET-Panel/frontend/build/miniapp/payment-success.html',
+    '/opt/remnawave-STEALTHNET-panel/frontend/build/miniapp-v2/payment-success.html',
+    '/opt/remnawave-STEALTHNET-panel/frontend/build/miniapp/payment-success.html',
+    '/opt/remnawave-STEALTHNET-PANEL/frontend/build/miniapp-v2/payment-success.html',
+    '/opt/remnawave-STEALTHNET-PANEL/frontend/build/miniapp/payment-success.html',
+    '/opt/admin/frontend/build/miniapp-v2/payment-success.html',
+    '/opt/admin/frontend/build/miniapp/payment-success.html',
+    # Относительные пути
+    os.path.join(BASE_DIR, 'frontend', 'build', 'miniapp-v2', 'payment-success.html'),
+    os.path.join(BASE_DIR, 'frontend', 'build', 'miniapp', 'payment-success.html'),
+    os.path.join(BASE_DIR, 'admin-panel', 'miniapp-v2', 'payment-success.html'),
+    os.path.join(BASE_DIR, 'admin-panel', 'miniapp', 'payment-success.html'),
+    os.path.join(BASE_DIR, 'admin-panel', 'payment-success.html')
+]))
+
+
+def get_payment_success_path():
+    """Получить путь к payment-success.html (найденный путь запоминается) или None"""
+    path = _miniapp_dirs.get('payment-success')
+    if path:
+        return path
+    for p in PAYMENT_SUCCESS_POSSIBLE_PATHS:
+        if os.path.isfile(p):
+            _miniapp_dirs['payment-success'] = p
+            return p
+    return None
+
+
+@app.route('/payment-success.html')
+def payment_success():
+    """Страница успешной оплаты с автоматическим редиректом в Telegram"""
+    path = get_payment_success_path()
+    if path:
+        dir_path = os.path.dirname(path)
+        file_name = os.path.basename(path)
+        response = send_from_directory(dir_path, file_name)
+        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+        response.headers['Pragma'] = 'no-cache'
+        response.headers['Expires'] = '0'
+        return response
     
     # Если не найдено, возвращаем 404
     return jsonify({"error": "payment-success.html not found"}), 404
 
-@app.route('/miniapp-v2/', defaults={'path': ''}, methods=['GET', 'HEAD', 'POST', 'OPTIONS'])
-@app.route('/miniapp-v2/<path:path>', methods=['GET', 'HEAD', 'POST', 'OPTIONS'])
+@app.route('/miniapp-v2/', defaults={'path': ''}, methods=['GET', 'HEAD', 'POST'])
+@app.route('/miniapp-v2/<path:path>', methods=['GET', 'HEAD', 'POST'])
 def miniapp_v2_static(path):
     """Отдача статических файлов miniapp-v2 (новая версия)"""
-    # Обработка CORS preflight
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'GET, HEAD, POST, OPTIONS')
-        return response
-    
-    def get_miniapp_v2_path():
-        """Получить путь к папке miniapp-v2"""
-        miniapp_path = os.getenv("MINIAPP_V2_PATH", "")
-        if miniapp_path:
-            miniapp_path = miniapp_path.strip()
-            if miniapp_path and os.path.exists(miniapp_path):
-                index_path = os.path.join(miniapp_path, 'index.html')
-                if os.path.exists(index_path):
-                    return miniapp_path
-        
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        
-        # Стандартные пути (в порядке приоритета)
-        possible_paths = [
-            # Docker путь
-            '/app/frontend/build/miniapp-v2',
-            # Абсолютные пути
-            '/opt/remnawave-STEALTHNET-Panel/frontend/build/miniapp-v2',
-            '/opt/remnawave-STEALTHNET-panel/frontend/build/miniapp-v2',
-            '/opt/remnawave-STEALTHNET-PANEL/frontend/build/miniapp-v2',
-            '/opt/admin/frontend/build/miniapp-v2',
-            # Относительные пути
-            os.path.join(base_dir, 'frontend', 'build', 'miniapp-v2'),
-            os.path.join(base_dir, 'admin-panel', 'miniapp-v2'),
-            os.path.join(base_dir, 'admin-panel', 'build', 'miniapp-v2'),
-            '/opt/admin/admin-panel/miniapp-v2',
-            '/opt/admin/admin-panel/build/miniapp-v2'
-        ]
-        
-        for p in possible_paths:
-            if os.path.exists(p):
-                index_path = os.path.join(p, 'index.html')
-                if os.path.exists(index_path):
-                    return p
-        
-        return None
-    
-    miniapp_dir = get_miniapp_v2_path()
+    miniapp_dir = get_miniapp_dir('miniapp-v2', 'MINIAPP_V2_PATH')
     
     if not miniapp_dir:
         # Возвращаем простой 404 без JSON, так как это может быть нормальной ситуацией
@@ -199,60 +231,11 @@ def miniapp_v2_static(path):
     return jsonify({"error": "File not found"}), 404
 
 
-@app.route('/miniapp/', defaults={'path': ''}, methods=['GET', 'HEAD', 'POST', 'OPTIONS'])
-@app.route('/miniapp/<path:path>', methods=['GET', 'HEAD', 'POST', 'OPTIONS'])
+@app.route('/miniapp/', defaults={'path': ''}, methods=['GET', 'HEAD', 'POST'])
+@app.route('/miniapp/<path:path>', methods=['GET', 'HEAD', 'POST'])
 def miniapp_static(path):
     """Отдача статических файлов miniapp"""
-    # Обработка CORS preflight
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'GET, HEAD, POST, OPTIONS')
-        return response
-    
-    def get_miniapp_path():
-        """Получить путь к папке miniapp"""
-        miniapp_path = os.getenv("MINIAPP_PATH", "")
-        if miniapp_path:
-            miniapp_path = miniapp_path.strip()
-            if miniapp_path and os.path.exists(miniapp_path):
-                index_path = os.path.join(miniapp_path, 'index.html')
-                if os.path.exists(index_path):
-                    return miniapp_path
-        
-        base_dir = os.path.dirname(os.path.abspath(__file__))
-        
-        # Стандартные пути (в порядке приоритета)
-        possible_paths = [
-            # Docker путь
-            '/app/frontend/build/miniapp',
-            # Абсолютные пути
-            '/opt/remnawave-STEALTHNET-Panel/frontend/build/miniapp',
-            '/opt/remnawave-STEALTHNET-panel/frontend/build/miniapp',
-            '/opt/remnawave-STEALTHNET-PANEL/frontend/build/miniapp',
-            '/opt/admin/frontend/build/miniapp',
-            # Относительные пути
-            os.path.join(base_dir, 'frontend', 'build', 'miniapp'),
-            os.path.join(base_dir, 'admin-panel', 'miniapp'),
-            os.path.join(base_dir, 'admin-panel', 'build', 'miniapp'),
-            os.path.join(base_dir, 'miniapp'),
-            '/opt/admin/admin-panel/miniapp',
-            '/opt/admin/admin-panel/build/miniapp',
-            '/opt/admin/miniapp',
-            '/var/www/admin-panel/miniapp',
-            '/var/www/admin-panel/build/miniapp'
-        ]
-        
-        for p in possible_paths:
-            if os.path.exists(p):
-                index_path = os.path.join(p, 'index.html')
-                if os.path.exists(index_path):
-                    return p
-        
-        return None
-    
-    miniapp_dir = get_miniapp_path()
+    miniapp_dir = get_miniapp_dir('miniapp', 'MINIAPP_PATH')
     
     if not miniapp_dir:
         # Возвращаем простой 404 без JSON, так как это может быть нормальной ситуацией
@@ -8,6 +8,7 @@ import os
 import logging
 import requests
 import asyncio
+import time
 from datetime import datetime
 from typing import Optional
 from dotenv import load_dotenv
@@ -63,8 +64,6 @@ def clear_bot_config_cache():
 
 def get_bot_config() -> dict:
     """Получить конфигурацию бота из API с кешированием"""
-    import time
-    
     current_time = time.time()
     
     # Возвращаем из кеша если не истёк
@@ -492,6 +491,24 @@ def get_days_text(days: int, lang: str) -> str:
         return f"{days} {get_text('days', lang)}"
 
 
+# Байт в гигабайте
+BYTES_PER_GB = 1024 ** 3
+
+
+def get_traffic_progress(used_traffic: int, traffic_limit: int) -> tuple:
+    """
+    Прогресс использования трафика для ограниченного тарифа
+
+    Returns:
+        tuple: (цвет, прогресс-бар из 15 блоков, процент, использовано ГБ, лимит ГБ)
+    """
+    percentage = used_traffic / traffic_limit * 100
+    filled = min(int(percentage * 15 / 100), 15)
+    progress_bar = "█" * filled + "░" * (15 - filled)
+    progress_color = "🟢" if percentage < 70 else "🟡" if percentage < 90 else "🔴"
+    return progress_color, progress_bar, percentage, used_traffic / BYTES_PER_GB, traffic_limit / BYTES_PER_GB
+
+
 async def safe_edit_or_send_with_logo(update: Update, context: ContextTypes.DEFAULT_TYPE, text: str, reply_markup=None, parse_mode=None):
     """
     Безопасно редактирует сообщение или отправляет новое с логотипом.
@@ -744,7 +761,7 @@ class ClientBotAPI:
             # Добавляем timestamp для предотвращения кэширования
             url = f"{self.api_url}/api/client/me"
             if force_refresh:
-                url += f"?_t={int(datetime.now().timestamp() * 1000)}"
+                url += f"?_t={time.time_ns() // 1_000_000}"
             
             response = self.session.get(
                 url,
@@ -823,7 +840,7 @@ class ClientBotAPI:
             self._system_settings_cache_time = 0
         
         # Проверяем кэш (1 минута = 60 секунд)
-        current_time = datetime.now().timestamp()
+        current_time = time.time()
         if self._system_settings_cache and (current_time - self._system_settings_cache_time) < 60:
             return self._system_settings_cache
         
@@ -2066,14 +2083,7 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE):
         if traffic_limit == 0:
             welcome_text += f"📈 **{get_text('traffic_title', user_lang)}**  - ♾️ {get_text('unlimited_traffic', user_lang)}\n"
         else:
-            used_gb = used_traffic / (1024 ** 3)
-            limit_gb = traffic_limit / (1024 ** 3)
-            percentage = (used_traffic / traffic_limit * 100) if traffic_limit > 0 else 0
-            
-            filled = int(percentage / (100 / 15))
-            filled = min(filled, 15)
-            progress_bar = "█" * filled + "░" * (15 - filled)
-            progress_color = "🟢" if percentage < 70 else "🟡" if percentage < 90 else "🔴"
+            progress_color, progress_bar, percentage, used_gb, limit_gb = get_traffic_progress(used_traffic, traffic_limit)
             
             welcome_text += f"📈 **{get_text('traffic_title', user_lang)}**  - {progress_color} {progress_bar} {percentage:.0f}% ({used_gb:.2f} / {limit_gb:.2f} GB)\n"
         
@@ -2178,15 +2188,7 @@ async def show_status(update: Update, context: ContextTypes.DEFAULT_TYPE):
     if traffic_limit == 0:
         status_text += f"♾️ {get_text('unlimited_traffic_full', user_lang)}\n\n"
     else:
-        used_gb = used_traffic / (1024 ** 3)
-        limit_gb = traffic_limit / (1024 ** 3)
-        percentage = (used_traffic / traffic_limit * 100) if traffic_limit > 0 else 0
-        
-        # Прогресс-бар (15 блоков)
-        filled = int(percentage / (100 / 15))
-        filled = min(filled, 15)
-        progress_bar = "█" * filled + "░" * (15 - filled)
-        progress_color = "🟢" if percentage < 70 else "🟡" if percentage < 90 else "🔴"
+        progress_color, progress_bar, percentage, used_gb, limit_gb = get_traffic_progress(used_traffic, traffic_limit)
         
         status_text += f"{progress_color} {progress_bar} {percentage:.0f}%\n"
         status_text += f"📥 {used_gb:.2f} / {limit_gb:.2f} GB\n\n"
@@ -3491,14 +3493,7 @@ async def button_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
                     if traffic_limit == 0:
                         welcome_text += f"📈 **{get_text('traffic_title', user_lang)}**  - ♾️ {get_text('unlimited_traffic', user_lang)}\n"
                     else:
-                        used_gb = used_traffic / (1024 ** 3)
-                        limit_gb = traffic_limit / (1024 ** 3)
-                        percentage = (used_traffic / traffic_limit * 100) if traffic_limit > 0 else 0
-                        
-                        filled = int(percentage / (100 / 15))
-                        filled = min(filled, 15)
-                        progress_bar = "█" * filled + "░" * (15 - filled)
-                        progress_color = "🟢" if percentage < 70 else "🟡" if percentage < 90 else "🔴"
+                        progress_color, progress_bar, percentage, used_gb, limit_gb = get_traffic_progress(used_traffic, traffic_limit)
                         
                         welcome_text += f"📈 **{get_text('traffic_title', user_lang)}**  - {progress_color} {progress_bar} {percentage:.0f}% ({used_gb:.2f} / {limit_gb:.2f} GB)\n"
                     
@@ -1,4 +1,11 @@
 """Gunicorn конфигурация для инициализации базы данных в worker процессах"""
+import os
+
+# Запросы к платёжным системам и RemnaWave большую часть времени ждут ответа внешнего API.
+# gthread-воркер обслуживает другие запросы, пока его поток ждёт (без gevent и monkey-patching)
+workers = int(os.getenv('GUNICORN_WORKERS', '2'))
+worker_class = 'gthread'
+threads = int(os.getenv('GUNICORN_THREADS', '16'))
 
 def on_starting(server):
     """Вызывается при старте master процесса"""
@@ -14,7 +21,6 @@ def pre_fork(server, worker):
 
 def post_fork(server, worker):
     """Вызывается после форка worker процесса - здесь инициализируем БД"""
-    import os
     print(f"🚀 [gunicorn] Worker процесс {worker.age} запущен, инициализация БД...")
     print(f"🔍 [gunicorn] Worker {worker.age}: Текущая директория: {os.getcwd()}")
     try:
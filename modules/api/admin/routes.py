@@ -22,8 +22,12 @@ import requests
 import json
 import os
 
-from modules.core import get_app, get_db, get_cache, get_bcrypt
+from modules.core import get_app, get_db, get_cache, get_bcrypt, create_http_session
 from modules.auth import admin_required
+from modules.remnawave import (
+    get_live_users_index, invalidate_user_cache, invalidate_live_data, remnawave_session, ADMIN_HEADERS,
+    LIVE_USERS_INDEX_KEY
+)
 from modules.models.user import User
 from modules.models.payment import Payment, PaymentSetting
 from modules.models.tariff import Tariff
@@ -42,6 +46,9 @@ db = get_db()
 cache = get_cache()
 bcrypt = get_bcrypt()
 
+# API бота (BOT_API_URL из настроек) - другой хост, поэтому отдельный пул соединений от RemnaWave
+bot_api_session = create_http_session(pool_maxsize=4)
+
 
 def get_remnawave_headers():
     """Получить заголовки для RemnaWave API"""
@@ -72,39 +79,25 @@ def get_admin_users(current_admin):
     """Получение списка пользователей"""
     try:
         local_users = User.query.all()
-        live_map = cache.get('all_live_users_map')
+        headers, cookies = get_remnawave_headers()
+        live_index = get_live_users_index(headers, cookies)
+        live_map = live_index['by_uuid']
+        live_map_by_email = live_index['by_email']
+        live_map_by_telegram_id = live_index['by_telegram_id']
         
-        if not live_map:
-            headers, cookies = get_remnawave_headers()
-            try:
-                resp = requests.get(f"{os.getenv('API_URL')}/api/users", headers=headers, cookies=cookies, timeout=10)
-                data = resp.json().get('response', {})
-                users_list = data.get('users', []) if isinstance(data, dict) else (data if isinstance(data, list) else [])
-                # Создаем два индекса: по UUID и по email/username
-                live_map = {u['uuid']: u for u in users_list if isinstance(u, dict) and 'uuid' in u}
-                # Дополнительный индекс по email для поиска, если UUID не совпадает
-                live_map_by_email = {}
-                for u in users_list:
-                    if isinstance(u, dict):
-                        # Пробуем разные поля для email/username
-                        email_key = u.get('email') or u.get('username') or u.get('name')
-                        if email_key:
-                            live_map_by_email[email_key.lower()] = u
-                cache.set('all_live_users_map', live_map, timeout=60)
-                cache.set('all_live_users_map_by_email', live_map_by_email, timeout=60)
-            except Exception as e:
-                print(f"Warning: Could not fetch live users: {e}")
-                live_map = {}
-                live_map_by_email = {}
-        else:
-            live_map_by_email = cache.get('all_live_users_map_by_email') or {}
+        from modules.currency import get_currency_rate
         
-        from modules.currency import convert_from_usd
+        # Курс каждой валюты запрашиваем из БД один раз на весь список, а не для каждого пользователя
+        currency_rates = {}
         
         combined = []
         for u in local_users:
             balance_usd = float(u.balance) if u.balance else 0.0
-            balance_converted = convert_from_usd(balance_usd, u.preferred_currency or 'uah')
+            currency = u.preferred_currency or 'uah'
+            if currency not in currency_rates:
+                currency_rates[currency] = get_currency_rate(currency)
+            rate = currency_rates[currency]
+            balance_converted = balance_usd * rate if rate else balance_usd
             
             # Пытаемся найти пользователя в RemnaWave
             live_data = None
@@ -124,13 +117,20 @@ def get_admin_users(current_admin):
                 ]
                 for email_var in email_variants:
                     if email_var in live_map_by_email:
-                        live_data = live_map_by_email[email_var]
+                        live_data = live_map.get(live_map_by_email[email_var])
                         # Если нашли по email, обновляем UUID в БД (но не коммитим сразу, чтобы не делать много коммитов)
                         if live_data and live_data.get('uuid') and live_data.get('uuid') != u.remnawave_uuid:
-                            print(f"Updating UUID for user {u.email}: {u.remnawave_uuid} -> {live_data.get('uuid')}")
+                            app.logger.debug("Updating UUID for user %s: %s -> %s", u.email, u.remnawave_uuid, live_data.get('uuid'))
                             u.remnawave_uuid = live_data.get('uuid')
                         break
             
+            # Если не нашли по email, пробуем найти по telegram_id (в БД хранится строкой)
+            if not live_data and u.telegram_id:
+                live_data = live_map.get(live_map_by_telegram_id.get(u.telegram_id))
+                if live_data and live_data.get('uuid') != u.remnawave_uuid:
+                    app.logger.debug("Updating UUID for user %s: %s -> %s", u.email, u.remnawave_uuid, live_data.get('uuid'))
+                    u.remnawave_uuid = live_data.get('uuid')
+            
             if u.remnawave_uuid and not live_data:
                 fetch_error = "User not found in RemnaWave"
             
@@ -209,7 +209,7 @@ def delete_user(current_admin, user_id):
         if remnawave_uuid:
             try:
                 headers, cookies = get_remnawave_headers()
-                delete_response = requests.delete(
+                delete_response = remnawave_session.delete(
                     f"{os.getenv('API_URL')}/api/users/{remnawave_uuid}",
                     headers=headers,
                     cookies=cookies,
@@ -225,8 +225,8 @@ def delete_user(current_admin, user_id):
         
         # Очищаем кэш
         if remnawave_uuid:
-            cache.delete(f'live_data_{remnawave_uuid}')
-        cache.delete('all_live_users_map')
+            invalidate_live_data(remnawave_uuid)
+        cache.delete(LIVE_USERS_INDEX_KEY)
         
         # Удаляем пользователя из локальной БД
         db.session.delete(user)
@@ -244,14 +244,16 @@ def delete_user(current_admin, user_id):
         }), 200
     except Exception as e:
         db.session.rollback()
-        import traceback
-        error_trace = traceback.format_exc()
-        print(f"Error deleting user {user_id}: {e}")
-        print(error_trace)
+        app.logger.exception("Error deleting user %s", user_id)
+        # Текст трассировки формируется только для ответа в режиме отладки
+        error_trace = None
+        if os.getenv('FLASK_DEBUG') == 'True':
+            import traceback
+            error_trace = traceback.format_exc()
         return jsonify({
             "message": "Internal Server Error",
             "error": str(e),
-            "trace": error_trace if os.getenv('FLASK_DEBUG') == 'True' else None
+            "trace": error_trace
         }), 500
 
 
@@ -297,8 +299,7 @@ def update_user_balance(current_admin, user_id):
         db.session.commit()
         
         # Очищаем кэш пользователя
-        cache.delete(f'live_data_{u.remnawave_uuid}')
-        cache.delete('all_live_users_map')
+        invalidate_user_cache(u.remnawave_uuid)
         
         # Конвертируем баланс обратно в валюту пользователя для отображения
         balance_display = convert_from_usd(new_balance_usd, u.preferred_currency or 'uah')
@@ -315,9 +316,7 @@ def update_user_balance(current_admin, user_id):
         }), 200
     except Exception as e:
         db.session.rollback()
-        print(f"Error updating balance: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error updating balance")
         return jsonify({"message": "Internal Server Error", "error": str(e)}), 500
 
 
@@ -371,9 +370,7 @@ def update_user_referral_percent(current_admin, user_id):
         }), 200
     except Exception as e:
         db.session.rollback()
-        print(f"Error updating referral percent: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error updating referral percent")
         return jsonify({"message": "Internal Server Error", "error": str(e)}), 500
 
 
@@ -407,8 +404,7 @@ def block_user(current_admin, user_id):
         
     except Exception as e:
         db.session.rollback()
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in block_user")
         return jsonify({"message": "Internal Server Error", "error": str(e)}), 500
 
 
@@ -429,8 +425,8 @@ def unblock_user(current_admin, user_id):
         
         # Очищаем кэш пользователя, чтобы данные обновились
         if user.remnawave_uuid:
-            cache.delete(f'live_data_{user.remnawave_uuid}')
-        cache.delete('all_live_users_map')
+            invalidate_live_data(user.remnawave_uuid)
+        cache.delete(LIVE_USERS_INDEX_KEY)
         
         return jsonify({
             "message": "User unblocked successfully",
@@ -439,8 +435,7 @@ def unblock_user(current_admin, user_id):
         
     except Exception as e:
         db.session.rollback()
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in unblock_user")
         return jsonify({"message": "Internal Server Error", "error": str(e)}), 500
 
 
@@ -469,14 +464,13 @@ def update_user_telegram_id(current_admin, user_id):
         # Обновляем telegramId в RemnaWave, если есть UUID
         if user.remnawave_uuid:
             try:
-                headers = {"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"}
-                requests.patch(
+                remnawave_session.patch(
                     f"{os.getenv('API_URL')}/api/users",
-                    headers=headers,
+                    headers=ADMIN_HEADERS,
                     json={"uuid": user.remnawave_uuid, "telegramId": telegram_id},
                     timeout=10
                 )
-                cache.delete(f'live_data_{user.remnawave_uuid}')
+                invalidate_live_data(user.remnawave_uuid)
             except Exception as e:
                 print(f"Warning: Failed to update telegramId in RemnaWave: {e}")
                 # Не возвращаем ошибку, т.к. локальное обновление уже выполнено
@@ -488,8 +482,7 @@ def update_user_telegram_id(current_admin, user_id):
         
     except Exception as e:
         db.session.rollback()
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in update_user_telegram_id")
         return jsonify({"message": "Internal Server Error", "error": str(e)}), 500
 
 
@@ -521,7 +514,7 @@ def admin_update_user(current_admin, user_id):
             if not tariff:
                 return jsonify({"message": "Tariff not found"}), 404
 
-            resp = requests.get(f"{os.getenv('API_URL')}/api/users/{user.remnawave_uuid}", headers=headers)
+            resp = remnawave_session.get(f"{os.getenv('API_URL')}/api/users/{user.remnawave_uuid}", headers=headers, timeout=10)
             if resp.status_code == 200:
                 user_data = resp.json().get('response', {})
                 current_expire = user_data.get('expireAt')
@@ -530,25 +523,25 @@ def admin_update_user(current_admin, user_id):
                 else:
                     new_expire_dt = datetime.now(timezone.utc) + timedelta(days=days)
                 
-                requests.patch(f"{os.getenv('API_URL')}/api/users", headers=headers,
-                             json={"uuid": user.remnawave_uuid, "expireAt": new_expire_dt.isoformat()})
-                cache.delete(f'live_data_{user.remnawave_uuid}')
+                remnawave_session.patch(f"{os.getenv('API_URL')}/api/users", headers=headers,
+                                        json={"uuid": user.remnawave_uuid, "expireAt": new_expire_dt.isoformat()})
+                invalidate_live_data(user.remnawave_uuid)
                 return jsonify({"message": "Tariff granted successfully"}), 200
             return jsonify({"message": "Failed to get user data"}), 500
 
         elif action == 'grant_trial':
             days = data.get('days', 3)
             new_expire = (datetime.now(timezone.utc) + timedelta(days=days)).isoformat()
-            requests.patch(f"{os.getenv('API_URL')}/api/users", headers=headers,
-                         json={"uuid": user.remnawave_uuid, "expireAt": new_expire})
-            cache.delete(f'live_data_{user.remnawave_uuid}')
+            remnawave_session.patch(f"{os.getenv('API_URL')}/api/users", headers=headers,
+                                    json={"uuid": user.remnawave_uuid, "expireAt": new_expire})
+            invalidate_live_data(user.remnawave_uuid)
             return jsonify({"message": "Trial granted successfully"}), 200
 
         elif action == 'set_device_limit':
             device_limit = data.get('device_limit', 0)
-            requests.patch(f"{os.getenv('API_URL')}/api/users", headers=headers,
-                         json={"uuid": user.remnawave_uuid, "hwidDeviceLimit": device_limit})
-            cache.delete(f'live_data_{user.remnawave_uuid}')
+            remnawave_session.patch(f"{os.getenv('API_URL')}/api/users", headers=headers,
+                                    json={"uuid": user.remnawave_uuid, "hwidDeviceLimit": device_limit})
+            invalidate_live_data(user.remnawave_uuid)
             return jsonify({"message": "Device limit updated successfully"}), 200
 
         return jsonify({"message": "Invalid action"}), 400
@@ -635,9 +628,7 @@ def get_statistics(current_admin):
         }), 200
 
     except Exception as e:
-        print(f"Error in get_statistics: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in get_statistics")
         return jsonify({"message": "Internal Server Error"}), 500
 
 
@@ -719,9 +710,7 @@ def get_sales(current_admin):
         
         return jsonify(sales_list), 200
     except Exception as e:
-        print(f"Error getting sales: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error getting sales")
         return jsonify({"error": "Failed to get sales", "message": str(e)}), 500
 
 
@@ -734,8 +723,7 @@ def get_sales(current_admin):
 def get_squads(current_admin):
     """Получить список сквадов"""
     try:
-        headers = {"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"}
-        resp = requests.get(f"{os.getenv('API_URL')}/api/internal-squads", headers=headers, timeout=10)
+        resp = remnawave_session.get(f"{os.getenv('API_URL')}/api/internal-squads", headers=ADMIN_HEADERS, timeout=10)
         resp.raise_for_status()
         
         data = resp.json()
@@ -772,8 +760,7 @@ def get_internal_squads(current_admin):
 def get_nodes(current_admin):
     """Получить список нод"""
     try:
-        headers = {"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"}
-        resp = requests.get(f"{os.getenv('API_URL')}/api/nodes", headers=headers, timeout=10)
+        resp = remnawave_session.get(f"{os.getenv('API_URL')}/api/nodes", headers=ADMIN_HEADERS, timeout=10)
         resp.raise_for_status()
         
         data = resp.json()
@@ -797,7 +784,7 @@ def restart_node(current_admin, uuid):
     """Перезапустить ноду"""
     try:
         headers, cookies = get_remnawave_headers()
-        requests.post(f"{os.getenv('API_URL')}/api/nodes/{uuid}/restart", headers=headers, cookies=cookies)
+        remnawave_session.post(f"{os.getenv('API_URL')}/api/nodes/{uuid}/restart", headers=headers, cookies=cookies, timeout=30)
         return jsonify({"message": "Node restart initiated"}), 200
     except Exception:
         return jsonify({"message": "Failed to restart node"}), 500
@@ -809,7 +796,7 @@ def restart_all_nodes(current_admin):
     """Перезапустить все ноды"""
     try:
         headers, cookies = get_remnawave_headers()
-        requests.post(f"{os.getenv('API_URL')}/api/nodes/restart-all", headers=headers, cookies=cookies)
+        remnawave_session.post(f"{os.getenv('API_URL')}/api/nodes/restart-all", headers=headers, cookies=cookies, timeout=30)
         return jsonify({"message": "All nodes restart initiated"}), 200
     except Exception:
         return jsonify({"message": "Failed to restart all nodes"}), 500
@@ -820,10 +807,9 @@ def restart_all_nodes(current_admin):
 def enable_node(current_admin, uuid):
     """Включить конкретную ноду"""
     try:
-        headers = {"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"}
-        resp = requests.post(
+        resp = remnawave_session.post(
             f"{os.getenv('API_URL')}/api/nodes/{uuid}/actions/enable",
-            headers=headers,
+            headers=ADMIN_HEADERS,
             timeout=30
         )
         resp.raise_for_status()
@@ -844,10 +830,9 @@ def enable_node(current_admin, uuid):
 def disable_node(current_admin, uuid):
     """Отключить конкретную ноду"""
     try:
-        headers = {"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"}
-        resp = requests.post(
+        resp = remnawave_session.post(
             f"{os.getenv('API_URL')}/api/nodes/{uuid}/actions/disable",
-            headers=headers,
+            headers=ADMIN_HEADERS,
             timeout=30
         )
         resp.raise_for_status()
@@ -999,8 +984,7 @@ def system_settings(current_admin):
 
     except Exception as e:
         db.session.rollback()
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in system_settings")
         return jsonify({"message": f"Internal Server Error: {str(e)}"}), 500
 
 
@@ -1140,9 +1124,7 @@ def admin_branding_settings(current_admin):
         return jsonify({"message": "Branding settings updated successfully"}), 200
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f"Error updating branding: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error updating branding")
         return jsonify({"message": f"Internal Server Error: {str(e)}"}), 500
 
 
@@ -1281,9 +1263,7 @@ def admin_tariffs(current_admin):
             result.append(tariff_data)
         return jsonify(result), 200
     except Exception as e:
-        print(f"[TARIFF] Error in admin_tariffs: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("[TARIFF] Error in admin_tariffs")
         return jsonify({"message": f"Internal Server Error: {str(e)}"}), 500
 
 
@@ -1343,9 +1323,7 @@ def create_tariff(current_admin):
         return jsonify({"message": "Tariff created", "tariff_id": tariff.id}), 201
     except Exception as e:
         db.session.rollback()
-        print(f"[TARIFF] Error creating tariff: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("[TARIFF] Error creating tariff")
         return jsonify({"message": f"Internal Server Error: {str(e)}"}), 500
 
 
@@ -1405,9 +1383,7 @@ def update_tariff(current_admin, tariff_id=None, id=None):
         return jsonify({"message": "Tariff updated successfully"}), 200
     except Exception as e:
         db.session.rollback()
-        print(f"[TARIFF] Error updating tariff {tariff_id}: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("[TARIFF] Error updating tariff %s", tariff_id)
         return jsonify({"message": f"Internal Server Error: {str(e)}"}), 500
 
 
@@ -1481,9 +1457,7 @@ def ref_settings(current_admin):
         db.session.commit()
         return jsonify({"message": "Referral settings updated"}), 200
     except Exception as e:
-        print(f"Error updating referral settings: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error updating referral settings")
         return jsonify({"message": "Failed to update referral settings"}), 500
 
 
@@ -1598,8 +1572,7 @@ def currency_rates(current_admin):
         return jsonify({"message": "Currency rates updated"}), 200
     except Exception as e:
         db.session.rollback()
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in currency_rates")
         return jsonify({"message": f"Failed to update currency rates: {str(e)}"}), 500
 
 
@@ -1872,8 +1845,7 @@ def send_broadcast(current_admin):
         return jsonify(result), 200
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in send_broadcast")
         return jsonify({"message": f"Failed to send broadcast: {str(e)}"}), 500
 
 
@@ -1891,7 +1863,7 @@ def sync_bot_users(current_admin):
             return jsonify({"message": "Bot API not configured"}), 400
 
         headers = {"Authorization": f"Bearer {bot_config.bot_api_token}"}
-        resp = requests.get(f"{bot_config.bot_api_url}/users", headers=headers)
+        resp = bot_api_session.get(f"{bot_config.bot_api_url}/users", headers=headers, timeout=30)
 
         if resp.status_code != 200:
             return jsonify({"message": "Failed to fetch bot users"}), 500
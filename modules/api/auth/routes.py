@@ -16,12 +16,18 @@ import string
 import threading
 import requests
 import json
+import logging
 import os
+from sqlalchemy.exc import IntegrityError
 
-from modules.core import get_app, get_db, get_bcrypt, get_fernet, get_mail, get_cache, get_limiter
+from modules.core import get_app, get_db, get_bcrypt, get_fernet, get_mail, get_cache, get_limiter, create_http_session
 from modules.auth import create_local_jwt
+from modules.cors import with_cors
+from modules.remnawave import (
+    get_live_users_index, remnawave_session, invalidate_live_data
+)
 from modules.models.user import User
-from modules.models.system import SystemSetting
+from modules.models.system import get_system_defaults
 from modules.models.referral import ReferralSetting
 
 app = get_app()
@@ -32,6 +38,13 @@ mail = get_mail()
 cache = get_cache()
 limiter = get_limiter()
 
+# Хеш для проверки пароля несуществующего пользователя: время ответа на вход
+# не должно зависеть от того, зарегистрирован ли email
+_DUMMY_PASSWORD_HASH = bcrypt.generate_password_hash(os.urandom(16).hex()).decode('utf-8')
+
+# Пул соединений к Bot API для фонового разрешения Telegram-пользователей
+bot_api_session = create_http_session(pool_maxsize=8)
+
 
 def generate_referral_code(user_id):
     """Генерация реферального кода"""
@@ -86,22 +99,59 @@ def send_email_in_background(app_context, recipient, subject, html_body):
             print(f"[EMAIL] ❌ Error: {e}")
 
 
-def get_system_settings():
-    """Получить системные настройки"""
-    return SystemSetting.query.first()
+def get_referral_settings():
+    """Получить настройки рефералов"""
+    return ReferralSetting.query.first()
 
 
-def create_system_settings():
-    """Создать настройки по умолчанию"""
-    settings = SystemSetting(default_language='ru', default_currency='uah')
-    db.session.add(settings)
-    db.session.commit()
-    return settings
+def get_bcrypt_rounds(password_hash):
+    """Cost factor из bcrypt-хеша вида $2b$12$..."""
+    try:
+        return int(password_hash.split('$')[2])
+    except (IndexError, ValueError):
+        return None
 
 
-def get_referral_settings():
-    """Получить настройки рефералов"""
-    return ReferralSetting.query.first()
+class BotAPIError(Exception):
+    """Bot API недоступен или ответил ошибкой сервера"""
+
+
+def lookup_bot_remnawave_uuid(telegram_id_str):
+    """
+    remnawave_uuid пользователя по telegram_id через Bot API (None - в боте не найден)
+
+    Найденное соответствие и отсутствие пользователя кэшируются, повторные входы
+    не обращаются к боту. Ошибки подключения и 5xx поднимают BotAPIError.
+    """
+    uuid_cache_key = f'tg_uuid_{telegram_id_str}'
+    missing_cache_key = f'tg_bot_missing_{telegram_id_str}'
+    remnawave_uuid = cache.get(uuid_cache_key)
+    if remnawave_uuid:
+        return remnawave_uuid
+    if cache.get(missing_cache_key):
+        return None
+
+    bot_api_url = os.getenv("BOT_API_URL", "").rstrip('/')
+    headers = {"X-API-Key": os.getenv("BOT_API_TOKEN", "")}
+    try:
+        # Отдельный таймаут на подключение: недоступный Bot API не держит воркер 10 секунд
+        bot_resp = bot_api_session.get(f"{bot_api_url}/users/{telegram_id_str}", headers=headers, timeout=(3, 10))
+    except requests.RequestException as e:
+        raise BotAPIError(str(e)) from e
+    if bot_resp.status_code >= 500:
+        raise BotAPIError(f"HTTP {bot_resp.status_code}")
+
+    if bot_resp.status_code == 200:
+        bot_data = app.json.loads(bot_resp.content)
+        bot_user = bot_data.get('response', {}) if 'response' in bot_data else bot_data
+        remnawave_uuid = bot_user.get('remnawave_uuid') or bot_user.get('uuid')
+        if remnawave_uuid:
+            cache.set(uuid_cache_key, remnawave_uuid, timeout=3600)
+            return remnawave_uuid
+
+    cache.set(missing_cache_key, True, timeout=300)
+    app.logger.info("[TG RESOLVE] User %s not found in bot", telegram_id_str)
+    return None
 
 
 # ============================================================================
@@ -155,7 +205,7 @@ def public_register():
 
     try:
         headers, cookies = get_remnawave_headers()
-        resp = requests.post(f"{os.getenv('API_URL')}/api/users", headers=headers, cookies=cookies, json=payload_create)
+        resp = remnawave_session.post(f"{os.getenv('API_URL')}/api/users", headers=headers, cookies=cookies, json=payload_create)
         resp.raise_for_status()
         remnawave_uuid = resp.json().get('response', {}).get('uuid')
 
@@ -163,15 +213,15 @@ def public_register():
             return jsonify({"message": "Provider Error"}), 500
 
         verif_token = ''.join(random.choices(string.ascii_letters + string.digits, k=50))
-        sys_settings = get_system_settings() or create_system_settings()
+        default_lang, default_currency = get_system_defaults()
 
         new_user = User(
             email=email, password_hash=hashed_password, remnawave_uuid=remnawave_uuid,
             telegram_id=str(telegram_id) if telegram_id else None,  # Связываем с Telegram, если указан
             referrer_id=referrer.id if referrer else None, is_verified=False,
             verification_token=verif_token, created_at=datetime.now(timezone.utc),
-            preferred_lang=sys_settings.default_language,
-            preferred_currency=sys_settings.default_currency
+            preferred_lang=default_lang,
+            preferred_currency=default_currency
         )
         db.session.add(new_user)
         db.session.flush()
@@ -203,15 +253,15 @@ def public_register():
             s = get_referral_settings()
             days = s.referrer_bonus_days if s else 7
             headers, cookies = get_remnawave_headers()
-            resp = requests.get(f"{os.getenv('API_URL')}/api/users/{referrer.remnawave_uuid}", headers=headers, cookies=cookies)
+            resp = remnawave_session.get(f"{os.getenv('API_URL')}/api/users/{referrer.remnawave_uuid}", headers=headers, cookies=cookies)
             if resp.ok:
                 live_data = resp.json().get('response', {})
                 curr = datetime.fromisoformat(live_data.get('expireAt'))
                 new_exp = max(datetime.now(timezone.utc), curr) + timedelta(days=days)
-                requests.patch(f"{os.getenv('API_URL')}/api/users",
+                remnawave_session.patch(f"{os.getenv('API_URL')}/api/users",
                             headers={"Content-Type": "application/json", **headers},
                             json={"uuid": referrer.remnawave_uuid, "expireAt": new_exp.isoformat()})
-                cache.delete(f'live_data_{referrer.remnawave_uuid}')
+                invalidate_live_data(referrer.remnawave_uuid)
 
         return jsonify({"message": "Регистрация прошла успешно. Проверьте email."}), 201
 
@@ -234,13 +284,16 @@ def client_login():
         return jsonify({"message": "Invalid input"}), 400
 
     try:
-        user = User.query.filter_by(email=email).first()
+        # Путь входа только читает пользователя - flush сессии здесь не нужен
+        with db.session.no_autoflush:
+            user = User.query.filter_by(email=email).first()
         if not user:
+            bcrypt.check_password_hash(_DUMMY_PASSWORD_HASH, password)
             return jsonify({"message": "Invalid credentials"}), 401
         
         # Если password_hash пустой, но есть telegram_id, это пользователь из бота
         # Разрешаем вход, но рекомендуем использовать Telegram Login Widget
-        if not user.password_hash or user.password_hash == '':
+        if not user.has_password:
             if user.telegram_id:
                 # Пользователь зарегистрирован через бота, но может войти на сайте
                 # (например, через Telegram Login Widget или если пароль был установлен позже)
@@ -254,6 +307,11 @@ def client_login():
         
         if not bcrypt.check_password_hash(user.password_hash, password):
             return jsonify({"message": "Invalid credentials"}), 401
+        
+        # Пароль известен только сейчас - переводим хеш на текущий BCRYPT_LOG_ROUNDS
+        if get_bcrypt_rounds(user.password_hash) != app.config['BCRYPT_LOG_ROUNDS']:
+            user.password_hash = bcrypt.generate_password_hash(password).decode('utf-8')
+            db.session.commit()
         if not user.is_verified:
             return jsonify({"message": "Email не подтверждён", "code": "NOT_VERIFIED"}), 403
         
@@ -267,22 +325,16 @@ def client_login():
             }), 403
 
         return jsonify({"token": create_local_jwt(user.id), "role": user.role}), 200
-    except Exception as e:
-        print(f"Login Error: {e}")
+    except Exception:
+        app.logger.exception("[LOGIN] Login error")
         return jsonify({"message": "Internal Server Error"}), 500
 
 
 @app.route('/api/public/forgot-password', methods=['POST', 'OPTIONS'])
 @limiter.limit("5 per hour")
+@with_cors
 def forgot_password():
     """Восстановление пароля"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        return response, 200
-
     try:
         data = request.json or {}
         email = data.get('email', '').strip().lower()
@@ -341,8 +393,8 @@ def forgot_password():
 
         return jsonify({"message": "If this email exists, a password reset link has been sent"}), 200
 
-    except Exception as e:
-        print(f"Forgot password error: {e}")
+    except Exception:
+        app.logger.exception("[FORGOT PASSWORD] Forgot password error")
         return jsonify({"message": "If this email exists, a password reset link has been sent"}), 200
 
 
@@ -422,13 +474,18 @@ def telegram_login():
             pass
 
     if not telegram_id or not hash_value:
-        print(f"Telegram login error: missing data. telegram_id={telegram_id}, hash={bool(hash_value)}, data_keys={list(data.keys()) if data else 'no data'}")
+        if app.logger.isEnabledFor(logging.WARNING):
+            app.logger.warning(
+                "Telegram login error: missing data. telegram_id=%s, hash=%s, data_keys=%s",
+                telegram_id, bool(hash_value), list(data.keys()) if data else 'no data'
+            )
         return jsonify({"message": "Invalid Telegram data: missing id/telegram_id or hash"}), 400
 
     try:
         # Конвертируем telegram_id в строку для поиска в БД (в модели хранится как строка)
         telegram_id_str = str(telegram_id)
-        user = User.query.filter_by(telegram_id=telegram_id_str).first()
+        with db.session.no_autoflush:
+            user = User.query.filter_by(telegram_id=telegram_id_str).first()
         
         # Проверяем блокировку аккаунта
         if user and getattr(user, 'is_blocked', False):
@@ -440,63 +497,63 @@ def telegram_login():
             }), 403
 
         if not user:
-            BOT_API_URL = os.getenv("BOT_API_URL", "")
-            BOT_API_TOKEN = os.getenv("BOT_API_TOKEN", "")
-
-            if BOT_API_URL and BOT_API_TOKEN:
+            # UUID известен без запроса к Bot API, если он уже разрешался ранее
+            # или telegram_id есть в закэшированном списке RemnaWave (сам список здесь не загружаем)
+            remnawave_uuid = cache.get(f'tg_uuid_{telegram_id_str}')
+            live_index = get_live_users_index(fetch=False)
+            if not remnawave_uuid and live_index:
+                remnawave_uuid = live_index['by_telegram_id'].get(telegram_id_str)
+
+            if not remnawave_uuid:
+                if not os.getenv("BOT_API_URL") or not os.getenv("BOT_API_TOKEN"):
+                    return jsonify({"message": "Bot API not configured"}), 500
                 try:
-                    bot_api_url = BOT_API_URL.rstrip('/')
-                    headers = {"X-API-Key": BOT_API_TOKEN}
-                    
-                    bot_resp = requests.get(f"{bot_api_url}/users/{telegram_id}", headers=headers, timeout=10)
-
-                    if bot_resp.status_code == 200:
-                        bot_data = bot_resp.json()
-                        bot_user = bot_data.get('response', {}) if 'response' in bot_data else bot_data
-                        remnawave_uuid = bot_user.get('remnawave_uuid') or bot_user.get('uuid')
-
-                        if remnawave_uuid:
-                            existing_user = User.query.filter_by(remnawave_uuid=remnawave_uuid).first()
-                            if existing_user:
-                                existing_user.telegram_id = telegram_id_str
-                                existing_user.telegram_username = username
-                                db.session.commit()
-                                user = existing_user
-                            else:
-                                sys_settings = get_system_settings() or create_system_settings()
-                                user = User(
-                                    telegram_id=telegram_id_str,
-                                    telegram_username=username,
-                                    email=f"tg_{telegram_id}@telegram.local",
-                                    password_hash='',
-                                    remnawave_uuid=remnawave_uuid,
-                                    is_verified=True,
-                                    preferred_lang=sys_settings.default_language,
-                                    preferred_currency=sys_settings.default_currency
-                                )
-                                db.session.add(user)
-                                db.session.flush()
-                                user.referral_code = generate_referral_code(user.id)
-                                db.session.commit()
-                        else:
-                            return jsonify({"message": "User not found in bot"}), 404
-                    else:
-                        return jsonify({"message": "User not found"}), 404
-                except Exception as e:
-                    print(f"Bot API Error: {e}")
+                    remnawave_uuid = lookup_bot_remnawave_uuid(telegram_id_str)
+                except BotAPIError as e:
+                    app.logger.error("[TG RESOLVE] ❌ Bot API Error for %s: %s", telegram_id_str, e)
                     return jsonify({"message": "Bot API error"}), 500
+                if not remnawave_uuid:
+                    return jsonify({"message": "User not found"}), 404
+
+            existing_user = User.query.filter(User.remnawave_uuid == remnawave_uuid).first()
+            if existing_user:
+                # Аккаунт уже есть (например, регистрация на сайте) - привязываем telegram_id к нему
+                existing_user.telegram_id = telegram_id_str
+                existing_user.telegram_username = username
+                db.session.commit()
+                user = existing_user
             else:
-                return jsonify({"message": "Bot API not configured"}), 500
+                default_lang, default_currency = get_system_defaults()
+                user = User(
+                    telegram_id=telegram_id_str,
+                    telegram_username=username,
+                    email=f"tg_{telegram_id}@telegram.local",
+                    password_hash='',
+                    remnawave_uuid=remnawave_uuid,
+                    is_verified=True,
+                    preferred_lang=default_lang,
+                    preferred_currency=default_currency
+                )
+                db.session.add(user)
+                try:
+                    db.session.flush()
+                    user.referral_code = generate_referral_code(user.id)
+                    db.session.commit()
+                except IntegrityError:
+                    # Параллельный вход уже создал запись для этого telegram_id
+                    db.session.rollback()
+                    user = User.query.filter_by(telegram_id=telegram_id_str).first()
+                    if not user:
+                        raise
+            app.logger.info("[TG RESOLVE] ✓ %s -> %s", telegram_id_str, remnawave_uuid)
 
         if username and user.telegram_username != username:
             user.telegram_username = username
             db.session.commit()
 
-        cache.delete(f'live_data_{user.remnawave_uuid}')
+        invalidate_live_data(user.remnawave_uuid)
         return jsonify({"token": create_local_jwt(user.id), "role": user.role}), 200
 
-    except Exception as e:
-        print(f"Telegram Login Error: {e}")
-        import traceback
-        traceback.print_exc()
+    except Exception:
+        app.logger.exception("[TELEGRAM LOGIN] Telegram login error")
         return jsonify({"message": "Internal Server Error"}), 500
@@ -12,6 +12,7 @@ import string
 import os
 
 from modules.core import get_app, get_db
+from modules.remnawave import remnawave_session
 from modules.auth import create_local_jwt
 from modules.models.user import User
 from modules.models.system import SystemSetting
@@ -176,7 +177,7 @@ def bot_register():
             
             print(f"Creating user in RemnaWave with payload: {payload_create}")
             
-            resp = requests.post(
+            resp = remnawave_session.post(
                 f"{API_URL}/api/users",
                 headers={"Authorization": f"Bearer {ADMIN_TOKEN}"},
                 json=payload_create,
@@ -202,11 +203,7 @@ def bot_register():
         except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
             # Обработка сетевых ошибок (DNS, таймауты, недоступность сервера)
             error_msg = str(e)
-            print(f"Error creating user in RemnaWave (Network Error): {error_msg}")
-            print(f"API_URL: {API_URL}")
-            print(f"Payload was: {payload_create}")
-            import traceback
-            traceback.print_exc()
+            app.logger.exception("Error creating user in RemnaWave (Network Error), API_URL: %s", API_URL)
             return jsonify({
                 "message": "Не удалось подключиться к RemnaWave API. Проверьте настройки API_URL и доступность сервера.",
                 "error": error_msg,
@@ -229,9 +226,7 @@ def bot_register():
                 "error": error_detail
             }), 500
         except Exception as e:
-            print(f"Error creating user in RemnaWave: {e}")
-            import traceback
-            traceback.print_exc()
+            app.logger.exception("Error creating user in RemnaWave")
             return jsonify({
                 "message": "Failed to create user in RemnaWave",
                 "error": str(e)
@@ -304,9 +299,7 @@ def bot_register():
 
     except Exception as e:
         db.session.rollback()
-        print(f"Error in bot_register: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in bot_register")
         return jsonify({"message": "Internal Server Error"}), 500
 
 
@@ -374,7 +367,5 @@ def bot_get_credentials():
         return jsonify(response), 200
 
     except Exception as e:
-        print(f"Error in bot_get_credentials: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in bot_get_credentials")
         return jsonify({"message": "Internal Server Error"}), 500
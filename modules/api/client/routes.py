@@ -19,17 +19,37 @@ import time
 
 from modules.core import get_app, get_db, get_cache, get_limiter, get_bcrypt
 from modules.auth import get_user_from_token
+from modules.remnawave import (
+    resolve_short_uuid, is_full_uuid, remnawave_session, invalidate_user_cache, extract_response,
+    set_live_data, get_cached_live_data, invalidate_live_data
+)
 from modules.models.user import User
 from modules.models.promo import PromoCode
-from modules.models.referral import ReferralSetting
+from modules.models.referral import ReferralSetting, get_referral_config
 from modules.currency import convert_from_usd, convert_to_usd, parse_iso_datetime, convert_to_usd, parse_iso_datetime
-from modules.models.tariff import Tariff
+from modules.models.tariff import Tariff, CURRENCY_CODES
 from modules.models.payment import Payment, PaymentSetting
 from modules.core import get_fernet
-from modules.api.payments.base import decrypt_key, get_return_url
+from modules.api.payments.base import get_return_url, get_decrypted_payment_settings, post_json
+from modules.api.payments.monobank import MONOBANK_CCY
 
 app = get_app()
 
+# Валюты, которые принимает Freekassa, и валюта Tribute по валюте тарифа
+FREEKASSA_CURRENCIES = frozenset(("RUB", "USD", "EUR", "UAH", "KZT"))
+TRIBUTE_CURRENCIES = {'RUB': 'rub', 'UAH': 'rub', 'USD': 'eur'}
+
+# Адрес сайта для ссылок возврата и вебхуков платёжных систем: окружение не меняется
+# во время работы, поэтому URL собираются один раз при импорте
+SITE_URL = os.getenv("YOUR_SERVER_IP", "https://panel.stealthnet.app")
+if not SITE_URL.startswith(('http://', 'https://')):
+    SITE_URL = f"https://{SITE_URL}"
+SUBSCRIPTION_PAGE_URL = f"{SITE_URL}/dashboard/subscription"
+WEBHOOK_URLS = {
+    provider: f"{SITE_URL}/api/webhook/{provider}"
+    for provider in ('crystalpay', 'heleket', 'monobank', 'platega')
+}
+
 # Глобальная сессия для Platega (сохранение cookies для обхода DDoS-Guard)
 _platega_session = None
 _platega_cookies_initialized = False
@@ -183,9 +203,7 @@ def get_client_referrals_info():
         }), 200
         
     except Exception as e:
-        print(f"Error in get_client_referrals_info: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in get_client_referrals_info")
         return jsonify({"message": "Internal Error"}), 500
 
 
@@ -193,6 +211,40 @@ def get_client_referrals_info():
 # USER DATA
 # ============================================================================
 
+# Фронтенд проверяет только непустоту поля password_hash (статус «пароль задан»,
+# окно установки пароля), поэтому вместо самого хеша отдаётся маркер
+PASSWORD_SET_MARKER = '********'
+
+
+def password_fields(user):
+    """Поля has_password и password_hash (маркер) для ответа /api/client/me"""
+    return {
+        'has_password': bool(user.has_password),
+        'password_hash': PASSWORD_SET_MARKER if user.has_password else ''
+    }
+
+
+def with_user_overlay(data, user):
+    """
+    Наложить локальные поля пользователя (реферальный код, язык, баланс, наличие пароля)
+    на данные RemnaWave. Исходный словарь (например, из кэша) не изменяется.
+    """
+    if not isinstance(data, dict):
+        return data
+    balance_usd = float(user.balance) if user.balance else 0.0
+    overlay = {
+        'referral_code': user.referral_code,
+        'preferred_lang': user.preferred_lang,
+        'preferred_currency': user.preferred_currency,
+        'telegram_id': user.telegram_id,
+        'telegram_username': user.telegram_username,
+        'balance_usd': balance_usd,
+        'balance': convert_from_usd(balance_usd, user.preferred_currency),
+        **password_fields(user)
+    }
+    return {**data, **overlay}
+
+
 @app.route('/api/client/me', methods=['GET'])
 def get_client_me():
     """Получение данных текущего пользователя"""
@@ -210,54 +262,40 @@ def get_client_me():
         }), 403
 
     current_uuid = user.remnawave_uuid
-    
-    # Проверка на короткий UUID
-    is_short_uuid = (not current_uuid or '-' not in current_uuid or len(current_uuid) < 36)
+
+    # Проверка на короткий UUID (полный UUID уже сохранён - поиск не нужен)
+    is_short_uuid = not is_full_uuid(current_uuid)
 
     if is_short_uuid and current_uuid:
         # Попытка найти полный UUID
         if os.getenv("API_URL") and os.getenv("ADMIN_TOKEN"):
             try:
-                resp = requests.get(
-                    f"{os.getenv('API_URL')}/api/users/by-short-uuid/{current_uuid}",
-                    headers={"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"},
-                    timeout=10
+                found_uuid, user_data = resolve_short_uuid(
+                    current_uuid, {"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"}
                 )
-                if resp.status_code == 200:
-                    data = resp.json()
-                    user_data = data.get('response', {}) if isinstance(data, dict) and 'response' in data else data
-                    found_uuid = user_data.get('uuid') if isinstance(user_data, dict) else None
-                    
-                    if found_uuid and '-' in found_uuid and len(found_uuid) >= 36:
-                        old_uuid = user.remnawave_uuid
-                        user.remnawave_uuid = found_uuid
-                        db.session.commit()
-                        current_uuid = found_uuid
-                        if old_uuid:
-                            cache.delete(f'live_data_{old_uuid}')
+                if found_uuid:
+                    old_uuid = user.remnawave_uuid
+                    user.remnawave_uuid = found_uuid
+                    db.session.commit()
+                    current_uuid = found_uuid
+                    is_short_uuid = False
+                    if old_uuid:
+                        invalidate_live_data(old_uuid)
+                    # Данные пользователя уже получены при поиске,
+                    # повторный GET /api/users/{uuid} не нужен
+                    if user_data:
+                        set_live_data(found_uuid, user_data)
             except Exception as e:
+                db.session.rollback()
                 print(f"Error searching for user by shortUUID: {e}")
 
-    cache_key = f'live_data_{current_uuid}'
+    rw_headers = {"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"}
     force_refresh = request.args.get('force_refresh', 'false').lower() == 'true'
 
     if not force_refresh:
-        cached = cache.get(cache_key)
+        cached = get_cached_live_data(current_uuid, rw_headers)
         if cached:
-            if isinstance(cached, dict):
-                cached = cached.copy()
-                balance_usd = float(user.balance) if user.balance else 0.0
-                balance_converted = convert_from_usd(balance_usd, user.preferred_currency)
-                cached.update({
-                    'referral_code': user.referral_code,
-                    'preferred_lang': user.preferred_lang,
-                    'preferred_currency': user.preferred_currency,
-                    'telegram_id': user.telegram_id,
-                    'telegram_username': user.telegram_username,
-                    'balance_usd': balance_usd,
-                    'balance': balance_converted
-                })
-            return jsonify({"response": cached}), 200
+            return jsonify({"response": with_user_overlay(cached, user)}), 200
 
     try:
         if is_short_uuid and current_uuid:
@@ -266,30 +304,18 @@ def get_client_me():
                 "error": "INVALID_UUID_FORMAT"
             }), 400
 
-        resp = requests.get(
+        resp = remnawave_session.get(
             f"{os.getenv('API_URL')}/api/users/{current_uuid}",
-            headers={"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"},
+            headers=rw_headers,
             timeout=10
         )
 
         if resp.status_code != 200:
             if resp.status_code == 404:
                 # Если пользователь не найден в RemnaWave, проверяем кэш
-                cached = cache.get(cache_key)
+                cached = get_cached_live_data(current_uuid)
                 if cached:
-                    if isinstance(cached, dict):
-                        cached = cached.copy()
-                        balance_usd = float(user.balance) if user.balance else 0.0
-                        cached.update({
-                            'referral_code': user.referral_code,
-                            'preferred_lang': user.preferred_lang,
-                            'preferred_currency': user.preferred_currency,
-                            'telegram_id': user.telegram_id,
-                            'telegram_username': user.telegram_username,
-                            'balance_usd': balance_usd,
-                            'balance': convert_from_usd(balance_usd, user.preferred_currency)
-                        })
-                    return jsonify({"response": cached}), 200
+                    return jsonify({"response": with_user_overlay(cached, user)}), 200
                 
                 # Если кэша нет, возвращаем базовую информацию из нашей БД
                 balance_usd = float(user.balance) if user.balance else 0.0
@@ -304,7 +330,7 @@ def get_client_me():
                     'preferred_currency': user.preferred_currency,
                     'telegram_id': user.telegram_id,
                     'telegram_username': user.telegram_username,
-                    'password_hash': user.password_hash if user.password_hash else '',  # Добавляем password_hash
+                    **password_fields(user),
                     'balance_usd': balance_usd,
                     'balance': balance_converted,
                     'subscription': None,  # Нет подписки, т.к. пользователь не найден в RemnaWave
@@ -314,49 +340,23 @@ def get_client_me():
                 return jsonify({"response": basic_data}), 200
             return jsonify({"message": f"Ошибка RemnaWave: {resp.status_code}"}), 500
 
-        response_data = resp.json()
-        data = response_data.get('response', {}) if isinstance(response_data, dict) else response_data
-
-        if isinstance(data, dict):
-            balance_usd = float(user.balance) if user.balance else 0.0
-            balance_converted = convert_from_usd(balance_usd, user.preferred_currency)
-            data.update({
-                'referral_code': user.referral_code,
-                'preferred_lang': user.preferred_lang,
-                'preferred_currency': user.preferred_currency,
-                'telegram_id': user.telegram_id,
-                'telegram_username': user.telegram_username,
-                'password_hash': user.password_hash if user.password_hash else '',  # Добавляем password_hash
-                'balance_usd': balance_usd,
-                'balance': balance_converted
-            })
-
-        cache.set(cache_key, data, timeout=300)
-        return jsonify({"response": data}), 200
+        data = extract_response(app.json.loads(resp.content))
+
+        # В кэше хранятся данные RemnaWave без изменений (как и в мини-приложении),
+        # локальные поля пользователя накладываются при формировании ответа
+        set_live_data(current_uuid, data, delta=resp.elapsed.total_seconds())
+        return jsonify({"response": with_user_overlay(data, user)}), 200
         
     except requests.RequestException as e:
-        cached = cache.get(cache_key)
+        cached = get_cached_live_data(current_uuid)
         if cached:
-            if isinstance(cached, dict):
-                cached = cached.copy()
-                balance_usd = float(user.balance) if user.balance else 0.0
-                cached.update({
-                    'referral_code': user.referral_code,
-                    'preferred_lang': user.preferred_lang,
-                    'preferred_currency': user.preferred_currency,
-                    'telegram_id': user.telegram_id,
-                    'telegram_username': user.telegram_username,
-                    'password_hash': user.password_hash if user.password_hash else '',  # Добавляем password_hash
-                    'balance_usd': balance_usd,
-                    'balance': convert_from_usd(balance_usd, user.preferred_currency)
-                })
-            return jsonify({"response": cached}), 200
+            return jsonify({"response": with_user_overlay(cached, user)}), 200
         return jsonify({"message": f"Ошибка подключения: {str(e)}"}), 500
     except Exception as e:
-        print(f"Error in get_client_me: {e}")
-        cached = cache.get(cache_key)
+        app.logger.exception("Error in get_client_me")
+        cached = get_cached_live_data(current_uuid)
         if cached:
-            return jsonify({"response": cached}), 200
+            return jsonify({"response": with_user_overlay(cached, user)}), 200
         return jsonify({"message": "Internal Error"}), 500
 
 
@@ -366,22 +366,19 @@ def activate_trial():
     user = get_user_from_token()
     if not user:
         return jsonify({"message": "Ошибка аутентификации"}), 401
+    if not user.remnawave_uuid:
+        return jsonify({"message": "Пользователь не привязан к RemnaWave"}), 400
     
     try:
         new_exp = (datetime.now(timezone.utc) + timedelta(days=3)).isoformat()
 
-        referral_settings = get_referral_settings()
-        trial_squad_id = os.getenv("DEFAULT_SQUAD_ID")
-        if referral_settings and referral_settings.trial_squad_id:
-            trial_squad_id = referral_settings.trial_squad_id
+        trial_squad_id = get_referral_config().get('trial_squad_id') or os.getenv("DEFAULT_SQUAD_ID")
 
         headers, cookies = get_remnawave_headers()
-        requests.patch(f"{os.getenv('API_URL')}/api/users", headers=headers, cookies=cookies,
-                    json={"uuid": user.remnawave_uuid, "expireAt": new_exp, "activeInternalSquads": [trial_squad_id]})
+        remnawave_session.patch(f"{os.getenv('API_URL')}/api/users", headers=headers, cookies=cookies,
+                    json={"uuid": user.remnawave_uuid, "expireAt": new_exp, "activeInternalSquads": [trial_squad_id]}, timeout=10)
         
-        cache.delete(f'live_data_{user.remnawave_uuid}')
-        cache.delete('all_live_users_map')
-        cache.delete(f'nodes_{user.remnawave_uuid}')
+        invalidate_user_cache(user.remnawave_uuid, nodes=True)
         
         return jsonify({"message": "Trial activated"}), 200
     except Exception as e:
@@ -414,12 +411,10 @@ def set_settings():
         
         db.session.commit()
         # Очищаем кэш пользователя при изменении настроек
-        cache.delete(f'live_data_{user.remnawave_uuid}')
-        cache.delete('all_live_users_map')
+        invalidate_user_cache(user.remnawave_uuid)
         return jsonify({"message": "Settings updated", "preferred_currency": user.preferred_currency}), 200
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in set_settings")
         return jsonify({"message": "Failed to update settings", "error": str(e)}), 500
 
 
@@ -532,7 +527,7 @@ def get_client_nodes():
     
     try:
         headers, cookies = get_remnawave_headers()
-        resp = requests.get(
+        resp = remnawave_session.get(
             f"{os.getenv('API_URL')}/api/users/{user.remnawave_uuid}/accessible-nodes",
             headers=headers,
             cookies=cookies,
@@ -612,9 +607,7 @@ def check_promocode():
             }), 400
 
     except Exception as e:
-        import traceback
-        print(f"[PROMO] Error checking promo code: {e}")
-        print(traceback.format_exc())
+        app.logger.exception("[PROMO] Error checking promo code")
         return jsonify({"message": "Internal Error"}), 500
 
 
@@ -641,7 +634,7 @@ def activate_promocode():
 
         if promo.promo_type == 'DAYS':
             headers = {"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"}
-            resp = requests.get(f"{os.getenv('API_URL')}/api/users/{user.remnawave_uuid}", headers=headers)
+            resp = remnawave_session.get(f"{os.getenv('API_URL')}/api/users/{user.remnawave_uuid}", headers=headers, timeout=10)
 
             if resp.status_code == 200:
                 user_data = resp.json().get('response', {})
@@ -652,16 +645,17 @@ def activate_promocode():
                 else:
                     new_expire_dt = datetime.now(timezone.utc) + timedelta(days=promo.value)
 
-                update_resp = requests.patch(
+                update_resp = remnawave_session.patch(
                     f"{os.getenv('API_URL')}/api/users",
                     headers=headers,
-                    json={"uuid": user.remnawave_uuid, "expireAt": new_expire_dt.isoformat()}
+                    json={"uuid": user.remnawave_uuid, "expireAt": new_expire_dt.isoformat()},
+                    timeout=10
                 )
 
                 if update_resp.status_code == 200:
                     promo.uses_left -= 1
                     db.session.commit()
-                    cache.delete(f'live_data_{user.remnawave_uuid}')
+                    invalidate_live_data(user.remnawave_uuid)
                     return jsonify({
                         "message": f"Promo activated! +{promo.value} days",
                         "new_expire_date": new_expire_dt.isoformat()
@@ -675,18 +669,6 @@ def activate_promocode():
         return jsonify({"message": "Internal Error"}), 500
 
 
-def decrypt_key(key):
-    """Расшифровка ключа"""
-    from modules.core import get_fernet
-    fernet = get_fernet()
-    if not key or not fernet:
-        return ""
-    try:
-        return fernet.decrypt(key).decode('utf-8')
-    except:
-        return ""
-
-
 # ============================================================================
 # PURCHASE WITH BALANCE
 # ============================================================================
@@ -714,42 +696,31 @@ def purchase_with_balance():
             return jsonify({"message": "Тариф не найден"}), 404
         
         # Определяем цену в валюте пользователя
-        price_map = {"uah": {"a": t.price_uah, "c": "UAH"}, "rub": {"a": t.price_rub, "c": "RUB"}, "usd": {"a": t.price_usd, "c": "USD"}}
-        info = price_map.get(user.preferred_currency, price_map['uah'])
+        price, price_currency = t.get_price(user.preferred_currency, 'uah')
         
         # Применяем промокод, если указан
         promo_code_obj = None
-        final_amount = info['a']
+        final_amount = price
         if promo_code_str:
             promo = PromoCode.query.filter_by(code=promo_code_str).first()
             if not promo:
                 return jsonify({"message": "Неверный промокод"}), 400
             if promo.uses_left <= 0:
                 return jsonify({"message": "Промокод больше не действителен"}), 400
-            if promo.promo_type == 'PERCENT':
-                discount = (promo.value / 100.0) * final_amount
-                final_amount = final_amount - discount
-                if final_amount < 0:
-                    final_amount = 0
-                promo_code_obj = promo
-            elif promo.promo_type == 'FIXED':
-                # Фиксированная скидка
-                discount = float(promo.value)
-                final_amount = final_amount - discount
-                if final_amount < 0:
-                    final_amount = 0
+            if promo.promo_type in ('PERCENT', 'FIXED'):
+                final_amount = promo.apply_discount(final_amount)
                 promo_code_obj = promo
             elif promo.promo_type == 'DAYS':
                 return jsonify({"message": "Промокод на бесплатные дни активируется отдельно"}), 400
         
         # Проверяем баланс пользователя
         current_balance_usd = float(user.balance) if user.balance else 0.0
-        final_amount_usd = convert_to_usd(final_amount, info['c'])
+        final_amount_usd = convert_to_usd(final_amount, price_currency)
         
         if current_balance_usd < final_amount_usd:
             current_balance_display = convert_from_usd(current_balance_usd, user.preferred_currency)
             return jsonify({
-                "message": f"Недостаточно средств на балансе. Требуется: {final_amount:.2f} {info['c']}, доступно: {current_balance_display:.2f} {info['c']}"
+                "message": f"Недостаточно средств на балансе. Требуется: {final_amount:.2f} {price_currency}, доступно: {current_balance_display:.2f} {price_currency}"
             }), 400
         
         # Списываем средства с баланса
@@ -759,7 +730,7 @@ def purchase_with_balance():
         API_URL = os.getenv('API_URL')
         DEFAULT_SQUAD_ID = os.getenv('DEFAULT_SQUAD_ID')
         h, c = get_remnawave_headers()
-        live = requests.get(f"{API_URL}/api/users/{user.remnawave_uuid}", headers=h, cookies=c, timeout=10).json().get('response', {})
+        live = remnawave_session.get(f"{API_URL}/api/users/{user.remnawave_uuid}", headers=h, cookies=c, timeout=10).json().get('response', {})
         curr_exp = parse_iso_datetime(live.get('expireAt'))
         if not curr_exp:
             curr_exp = datetime.now(timezone.utc)
@@ -794,7 +765,7 @@ def purchase_with_balance():
             patch_payload["trafficLimitStrategy"] = "NO_RESET"
         
         h, c = get_remnawave_headers({"Content-Type": "application/json"})
-        patch_resp = requests.patch(f"{API_URL}/api/users", headers=h, cookies=c, json=patch_payload, timeout=10)
+        patch_resp = remnawave_session.patch(f"{API_URL}/api/users", headers=h, cookies=c, json=patch_payload, timeout=10)
         if not patch_resp.ok:
             user.balance = current_balance_usd
             db.session.rollback()
@@ -806,14 +777,14 @@ def purchase_with_balance():
                 promo_code_obj.uses_left -= 1
         
         # Создаем запись о платеже
-        order_id = f"u{user.id}-t{t.id}-balance-{int(datetime.now().timestamp())}"
+        order_id = f"u{user.id}-t{t.id}-balance-{int(time.time())}"
         new_p = Payment(
             order_id=order_id,
             user_id=user.id,
             tariff_id=t.id,
             status='PAID',
             amount=final_amount,
-            currency=info['c'],
+            currency=price_currency,
             promo_code_id=promo_code_obj.id if promo_code_obj else None
         )
         db.session.add(new_p)
@@ -824,9 +795,7 @@ def purchase_with_balance():
         add_referral_commission(user, final_amount_usd, is_tariff_purchase=True)
         db.session.commit()
         
-        cache.delete(f'live_data_{user.remnawave_uuid}')
-        cache.delete(f'nodes_{user.remnawave_uuid}')
-        cache.delete('all_live_users_map')
+        invalidate_user_cache(user.remnawave_uuid, nodes=True)
         
         return jsonify({
             "message": "Тариф успешно активирован",
@@ -836,8 +805,7 @@ def purchase_with_balance():
         
     except Exception as e:
         db.session.rollback()
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in purchase_with_balance")
         return jsonify({"message": "Internal Error"}), 500
 
 
@@ -865,22 +833,17 @@ def create_payment():
             if not amount or amount <= 0:
                 return jsonify({"message": "Неверная сумма"}), 400
             
-            from modules.models.payment import PaymentSetting, Payment
-            s = PaymentSetting.query.first()
-            order_id = f"u{user.id}-balance-{int(datetime.now().timestamp())}"
+            # Ключи уже расшифрованы в кэше настроек процесса
+            s = get_decrypted_payment_settings()
+            order_id = f"u{user.id}-balance-{int(time.time())}"
             payment_url = None
             payment_system_id = None
             
-            YOUR_SERVER_IP_OR_DOMAIN = os.getenv("YOUR_SERVER_IP", "https://panel.stealthnet.app")
-            if not YOUR_SERVER_IP_OR_DOMAIN.startswith(('http://', 'https://')):
-                YOUR_SERVER_IP_OR_DOMAIN = f"https://{YOUR_SERVER_IP_OR_DOMAIN}"
-            
-            currency_code_map = {"uah": "UAH", "rub": "RUB", "usd": "USD"}
-            cp_currency = currency_code_map.get(currency.lower(), "UAH")
+            cp_currency = CURRENCY_CODES.get(currency.lower(), "UAH")
             
             if payment_provider == 'crystalpay':
-                crystalpay_key = decrypt_key(s.crystalpay_api_key) if s else None
-                crystalpay_secret = decrypt_key(s.crystalpay_api_secret) if s else None
+                crystalpay_key = s.crystalpay_api_key if s else None
+                crystalpay_secret = s.crystalpay_api_secret if s else None
                 if not crystalpay_key or crystalpay_key == "DECRYPTION_ERROR" or not crystalpay_secret or crystalpay_secret == "DECRYPTION_ERROR":
                     return jsonify({"message": "CrystalPay не настроен"}), 500
                 
@@ -896,11 +859,11 @@ def create_payment():
                     "currency": cp_currency,
                     "lifetime": 60,
                     "extra": order_id,
-                    "callback_url": f"{YOUR_SERVER_IP_OR_DOMAIN}/api/webhook/crystalpay",
+                    "callback_url": WEBHOOK_URLS['crystalpay'],
                     "redirect_url": redirect_url
                 }
                 
-                resp = requests.post("https://api.crystalpay.io/v3/invoice/create/", json=payload, timeout=10)
+                resp = post_json("https://api.crystalpay.io/v3/invoice/create/", payload)
                 if resp.ok:
                     data = resp.json()
                     if not data.get('errors'):
@@ -912,7 +875,7 @@ def create_payment():
                     print(f"CrystalPay API Error: {resp.status_code} - {resp.text}")
             
             elif payment_provider == 'heleket':
-                heleket_key = decrypt_key(s.heleket_api_key) if s else None
+                heleket_key = s.heleket_api_key if s else None
                 if not heleket_key or heleket_key == "DECRYPTION_ERROR":
                     return jsonify({"message": "Heleket API key not configured"}), 500
                 
@@ -934,7 +897,7 @@ def create_payment():
                     "currency": heleket_currency,
                     "order_id": order_id,
                     "url_return": redirect_url,
-                    "url_callback": f"{YOUR_SERVER_IP_OR_DOMAIN}/api/webhook/heleket"
+                    "url_callback": WEBHOOK_URLS['heleket']
                 }
                 
                 if to_currency:
@@ -945,7 +908,7 @@ def create_payment():
                     "Content-Type": "application/json"
                 }
                 
-                resp = requests.post("https://api.heleket.com/v1/payment", json=payload, headers=headers, timeout=10)
+                resp = post_json("https://api.heleket.com/v1/payment", payload, headers)
                 if resp.ok:
                     data = resp.json()
                     if data.get('state') == 0 and data.get('result'):
@@ -980,7 +943,7 @@ def create_payment():
                     return jsonify({"message": error_msg}), 500
             
             elif payment_provider == 'telegram_stars':
-                bot_token = decrypt_key(s.telegram_bot_token) if s else None
+                bot_token = s.telegram_bot_token if s else None
                 if not bot_token or bot_token == "DECRYPTION_ERROR":
                     return jsonify({"message": "Telegram Bot Token not configured"}), 500
                 
@@ -1009,12 +972,7 @@ def create_payment():
                     ]
                 }
                 
-                resp = requests.post(
-                    f"https://api.telegram.org/bot{bot_token}/createInvoiceLink",
-                    json=invoice_payload,
-                    headers={"Content-Type": "application/json"},
-                    timeout=10
-                )
+                resp = post_json(f"https://api.telegram.org/bot{bot_token}/createInvoiceLink", invoice_payload)
                 if resp.ok:
                     data = resp.json()
                     if data.get('ok'):
@@ -1026,16 +984,15 @@ def create_payment():
                     print(f"Telegram Stars API Error: {resp.status_code} - {resp.text}")
             
             elif payment_provider == 'freekassa':
-                freekassa_shop_id = decrypt_key(s.freekassa_shop_id) if s else None
-                freekassa_secret = decrypt_key(s.freekassa_secret) if s else None
+                freekassa_shop_id = s.freekassa_shop_id if s else None
+                freekassa_secret = s.freekassa_secret if s else None
                 if not freekassa_shop_id or not freekassa_secret or freekassa_shop_id == "DECRYPTION_ERROR" or freekassa_secret == "DECRYPTION_ERROR":
                     return jsonify({"message": "Freekassa credentials not configured"}), 500
                 
                 import hashlib
                 merchant_id = freekassa_shop_id
                 secret = freekassa_secret
-                freekassa_currency_map = {"RUB": "RUB", "USD": "USD", "EUR": "EUR", "UAH": "UAH", "KZT": "KZT"}
-                freekassa_currency = freekassa_currency_map.get(cp_currency, "RUB")
+                freekassa_currency = cp_currency if cp_currency in FREEKASSA_CURRENCIES else "RUB"
                 
                 sign_str = f"{merchant_id}:{float(amount)}:{secret}:{order_id}"
                 sign = hashlib.md5(sign_str.encode()).hexdigest()
@@ -1044,8 +1001,8 @@ def create_payment():
                 payment_system_id = order_id
             
             elif payment_provider == 'robokassa':
-                robokassa_login = decrypt_key(getattr(s, 'robokassa_merchant_login', None)) if s else None
-                robokassa_password1 = decrypt_key(getattr(s, 'robokassa_password1', None)) if s else None
+                robokassa_login = s.robokassa_merchant_login if s else None
+                robokassa_password1 = s.robokassa_password1 if s else None
                 if not robokassa_login or not robokassa_password1 or robokassa_login == "DECRYPTION_ERROR" or robokassa_password1 == "DECRYPTION_ERROR":
                     return jsonify({"message": "Robokassa credentials not configured"}), 500
                 
@@ -1059,8 +1016,8 @@ def create_payment():
             elif payment_provider == 'platega':
                 import uuid
                 import re
-                platega_key = decrypt_key(getattr(s, 'platega_api_key', None)) if s else None
-                platega_merchant_raw = decrypt_key(getattr(s, 'platega_merchant_id', None)) if s else None
+                platega_key = s.platega_api_key if s else None
+                platega_merchant_raw = s.platega_merchant_id if s else None
                 if not platega_key or not platega_merchant_raw or platega_key == "DECRYPTION_ERROR" or platega_merchant_raw == "DECRYPTION_ERROR":
                     print(f"Platega credentials error: key={bool(platega_key)}, merchant={bool(platega_merchant_raw)}")
                     return jsonify({"message": "Platega credentials not configured"}), 500
@@ -1105,9 +1062,9 @@ def create_payment():
                         "currency": cp_currency
                     },
                     "description": f"Balance topup {order_id}",
-                    "return": f"{YOUR_SERVER_IP_OR_DOMAIN}/miniapp/payment-success.html?order_id={order_id}",
-                    "failedUrl": f"{YOUR_SERVER_IP_OR_DOMAIN}/dashboard/subscription",
-                    "callbackUrl": f"{YOUR_SERVER_IP_OR_DOMAIN}/api/webhook/platega"
+                    "return": f"{SITE_URL}/miniapp/payment-success.html?order_id={order_id}",
+                    "failedUrl": SUBSCRIPTION_PAGE_URL,
+                    "callbackUrl": WEBHOOK_URLS['platega']
                 }
                 
                 headers = {
@@ -1227,7 +1184,7 @@ def create_payment():
                 tariff_id=None,
                 status='PENDING',
                 amount=float(amount),
-                currency=currency_code_map.get(currency.lower(), "UAH"),
+                currency=CURRENCY_CODES.get(currency.lower(), "UAH"),
                 payment_system_id=str(payment_system_id) if payment_system_id else order_id,
                 payment_provider=payment_provider
             )
@@ -1255,48 +1212,33 @@ def create_payment():
             if not t:
                 return jsonify({"message": "Not found"}), 404
             
-            price_map = {"uah": {"a": t.price_uah, "c": "UAH"}, "rub": {"a": t.price_rub, "c": "RUB"}, "usd": {"a": t.price_usd, "c": "USD"}}
-            info = price_map.get(user.preferred_currency, price_map['uah'])
+            price, price_currency = t.get_price(user.preferred_currency, 'uah')
             
             # Применяем промокод со скидкой, если указан
             promo_code_obj = None
-            final_amount = info['a']
+            final_amount = price
             if promo_code_str:
                 promo = PromoCode.query.filter_by(code=promo_code_str).first()
                 if not promo:
                     return jsonify({"message": "Неверный промокод"}), 400
                 if promo.uses_left <= 0:
                     return jsonify({"message": "Промокод больше не действителен"}), 400
-                if promo.promo_type == 'PERCENT':
-                    discount = (promo.value / 100.0) * final_amount
-                    final_amount = final_amount - discount
-                    if final_amount < 0:
-                        final_amount = 0
-                    promo_code_obj = promo
-                elif promo.promo_type == 'FIXED':
-                    # Фиксированная скидка
-                    discount = float(promo.value)
-                    final_amount = final_amount - discount
-                    if final_amount < 0:
-                        final_amount = 0
+                if promo.promo_type in ('PERCENT', 'FIXED'):
+                    final_amount = promo.apply_discount(final_amount)
                     promo_code_obj = promo
                 elif promo.promo_type == 'DAYS':
                     return jsonify({"message": "Промокод на бесплатные дни активируется отдельно"}), 400
             
-            from modules.models.payment import PaymentSetting, Payment
-            s = PaymentSetting.query.first()
-            order_id = f"u{user.id}-t{t.id}-{int(datetime.now().timestamp())}"
+            # Ключи уже расшифрованы в кэше настроек процесса
+            s = get_decrypted_payment_settings()
+            order_id = f"u{user.id}-t{t.id}-{int(time.time())}"
             payment_url = None
             payment_system_id = None
             
-            YOUR_SERVER_IP_OR_DOMAIN = os.getenv("YOUR_SERVER_IP", "https://panel.stealthnet.app")
-            if not YOUR_SERVER_IP_OR_DOMAIN.startswith(('http://', 'https://')):
-                YOUR_SERVER_IP_OR_DOMAIN = f"https://{YOUR_SERVER_IP_OR_DOMAIN}"
-            
             # CrystalPay
             if payment_provider == 'crystalpay':
-                crystalpay_key = decrypt_key(s.crystalpay_api_key) if s else None
-                crystalpay_secret = decrypt_key(s.crystalpay_api_secret) if s else None
+                crystalpay_key = s.crystalpay_api_key if s else None
+                crystalpay_secret = s.crystalpay_api_secret if s else None
                 if not crystalpay_key or crystalpay_key == "DECRYPTION_ERROR" or not crystalpay_secret or crystalpay_secret == "DECRYPTION_ERROR":
                     return jsonify({"message": "CrystalPay не настроен"}), 500
                 
@@ -1309,14 +1251,14 @@ def create_payment():
                     "auth_secret": crystalpay_secret,
                     "amount": f"{final_amount:.2f}",
                     "type": "purchase",
-                    "currency": info['c'],
+                    "currency": price_currency,
                     "lifetime": 60,
                     "extra": order_id,
-                    "callback_url": f"{YOUR_SERVER_IP_OR_DOMAIN}/api/webhook/crystalpay",
+                    "callback_url": WEBHOOK_URLS['crystalpay'],
                     "redirect_url": redirect_url
                 }
                 
-                resp = requests.post("https://api.crystalpay.io/v3/invoice/create/", json=payload, timeout=10)
+                resp = post_json("https://api.crystalpay.io/v3/invoice/create/", payload)
                 if resp.ok:
                     data = resp.json()
                     if not data.get('errors'):
@@ -1329,14 +1271,14 @@ def create_payment():
             
             # Heleket
             elif payment_provider == 'heleket':
-                heleket_key = decrypt_key(s.heleket_api_key) if s else None
+                heleket_key = s.heleket_api_key if s else None
                 if not heleket_key or heleket_key == "DECRYPTION_ERROR":
                     return jsonify({"message": "Heleket API key not configured"}), 500
                 
-                heleket_currency = info['c']
+                heleket_currency = price_currency
                 to_currency = None
                 
-                if info['c'] == 'USD':
+                if price_currency == 'USD':
                     heleket_currency = "USD"
                 else:
                     heleket_currency = "USD"
@@ -1346,8 +1288,8 @@ def create_payment():
                     "amount": f"{final_amount:.2f}",
                     "currency": heleket_currency,
                     "order_id": order_id,
-                    "url_return": f"{YOUR_SERVER_IP_OR_DOMAIN}/dashboard/subscription",
-                    "url_callback": f"{YOUR_SERVER_IP_OR_DOMAIN}/api/webhook/heleket"
+                    "url_return": SUBSCRIPTION_PAGE_URL,
+                    "url_callback": WEBHOOK_URLS['heleket']
                 }
                 
                 if to_currency:
@@ -1358,7 +1300,7 @@ def create_payment():
                     "Content-Type": "application/json"
                 }
                 
-                resp = requests.post("https://api.heleket.com/v1/payment", json=payload, headers=headers, timeout=10)
+                resp = post_json("https://api.heleket.com/v1/payment", payload, headers)
                 resp_data = resp.json()
                 if resp_data.get('state') != 0 or not resp_data.get('result'):
                     error_msg = resp_data.get('message', 'Payment Provider Error')
@@ -1371,7 +1313,7 @@ def create_payment():
             
             # YooKassa
             elif payment_provider == 'yookassa':
-                if info['c'] != 'RUB':
+                if price_currency != 'RUB':
                     return jsonify({"message": "YooKassa supports only RUB currency"}), 400
                 
                 # Используем универсальную функцию создания платежа
@@ -1393,16 +1335,16 @@ def create_payment():
             
             # Telegram Stars
             elif payment_provider == 'telegram_stars':
-                bot_token = decrypt_key(s.telegram_bot_token) if s else None
+                bot_token = s.telegram_bot_token if s else None
                 if not bot_token or bot_token == "DECRYPTION_ERROR":
                     return jsonify({"message": "Telegram Bot Token not configured"}), 500
                 
                 stars_amount = int(final_amount * 100)
-                if info['c'] == 'UAH':
+                if price_currency == 'UAH':
                     stars_amount = int(final_amount * 2.7)
-                elif info['c'] == 'RUB':
+                elif price_currency == 'RUB':
                     stars_amount = int(final_amount * 1.1)
-                elif info['c'] == 'USD':
+                elif price_currency == 'USD':
                     stars_amount = int(final_amount * 100)
                 
                 if stars_amount < 1:
@@ -1422,11 +1364,7 @@ def create_payment():
                     ]
                 }
                 
-                resp = requests.post(
-                    f"https://api.telegram.org/bot{bot_token}/createInvoiceLink",
-                    json=invoice_payload,
-                    headers={"Content-Type": "application/json"}
-                ).json()
+                resp = post_json(f"https://api.telegram.org/bot{bot_token}/createInvoiceLink", invoice_payload).json()
                 
                 if not resp.get('ok'):
                     error_msg = resp.get('description', 'Telegram Bot API Error')
@@ -1438,8 +1376,8 @@ def create_payment():
             
             # FreeKassa
             elif payment_provider == 'freekassa':
-                freekassa_shop_id = decrypt_key(s.freekassa_shop_id) if s else None
-                freekassa_secret = decrypt_key(s.freekassa_secret) if s else None
+                freekassa_shop_id = s.freekassa_shop_id if s else None
+                freekassa_secret = s.freekassa_secret if s else None
                 if not freekassa_shop_id or not freekassa_secret or freekassa_shop_id == "DECRYPTION_ERROR" or freekassa_secret == "DECRYPTION_ERROR":
                     return jsonify({"message": "FreeKassa credentials not configured"}), 500
                 
@@ -1447,8 +1385,7 @@ def create_payment():
                 merchant_id = freekassa_shop_id
                 secret = freekassa_secret
                 amount = final_amount
-                currency_map = {'RUB': 'RUB', 'UAH': 'UAH', 'USD': 'USD'}
-                currency = currency_map.get(info['c'], 'RUB')
+                currency = price_currency
                 
                 # Формируем подпись
                 sign_str = f"{merchant_id}:{amount}:{secret}:{order_id}"
@@ -1459,8 +1396,8 @@ def create_payment():
             
             # Robokassa
             elif payment_provider == 'robokassa':
-                robokassa_login = decrypt_key(getattr(s, 'robokassa_merchant_login', None)) if s else None
-                robokassa_password1 = decrypt_key(getattr(s, 'robokassa_password1', None)) if s else None
+                robokassa_login = s.robokassa_merchant_login if s else None
+                robokassa_password1 = s.robokassa_password1 if s else None
                 if not robokassa_login or not robokassa_password1 or robokassa_login == "DECRYPTION_ERROR" or robokassa_password1 == "DECRYPTION_ERROR":
                     return jsonify({"message": "Robokassa credentials not configured"}), 500
                 
@@ -1468,8 +1405,7 @@ def create_payment():
                 merchant_login = robokassa_login
                 password1 = robokassa_password1
                 amount = final_amount
-                currency_map = {'RUB': 'RUB', 'UAH': 'UAH', 'USD': 'USD'}
-                currency = currency_map.get(info['c'], 'RUB')
+                currency = price_currency
                 
                 # Формируем подпись
                 sign_str = f"{merchant_login}:{amount}:{order_id}:{password1}"
@@ -1480,16 +1416,16 @@ def create_payment():
             
             # CryptoBot
             elif payment_provider == 'cryptobot':
-                cryptobot_key = decrypt_key(s.cryptobot_api_key) if s else None
+                cryptobot_key = s.cryptobot_api_key if s else None
                 if not cryptobot_key or cryptobot_key == "DECRYPTION_ERROR":
                     return jsonify({"message": "CryptoBot API key not configured"}), 500
                 
                 payload = {
                     "amount": final_amount,
-                    "currency_code": info['c'],
+                    "currency_code": price_currency,
                     "description": f"Подписка StealthNET - {t.name}",
                     "paid_btn_name": "callback",
-                    "paid_btn_url": f"{YOUR_SERVER_IP_OR_DOMAIN}/dashboard/subscription"
+                    "paid_btn_url": SUBSCRIPTION_PAGE_URL
                 }
                 
                 headers = {
@@ -1497,7 +1433,7 @@ def create_payment():
                     "Content-Type": "application/json"
                 }
                 
-                resp = requests.post("https://pay.crypt.bot/api/createInvoice", json=payload, headers=headers, timeout=10)
+                resp = post_json("https://pay.crypt.bot/api/createInvoice", payload, headers)
                 if resp.ok:
                     data = resp.json()
                     if data.get('ok'):
@@ -1511,37 +1447,25 @@ def create_payment():
             
             # Monobank
             elif payment_provider == 'monobank':
-                monobank_token = decrypt_key(getattr(s, 'monobank_token', None)) if s else None
+                monobank_token = s.monobank_token if s else None
                 if not monobank_token or monobank_token == "DECRYPTION_ERROR":
                     return jsonify({"message": "Monobank token not configured"}), 500
                 
-                amount_in_kopecks = int(final_amount * 100)
-                currency_code = 980  # UAH
-                if info['c'] == 'RUB':
-                    currency_code = 643
-                elif info['c'] == 'USD':
-                    currency_code = 840
-                
                 payload = {
-                    "amount": amount_in_kopecks,
-                    "ccy": currency_code,
+                    "amount": round(final_amount * 100),
+                    "ccy": MONOBANK_CCY.get(price_currency, MONOBANK_CCY['UAH']),
                     "merchantPaymInfo": {
                         "reference": order_id,
                         "destination": f"Подписка StealthNET - {t.name}",
                         "comment": f"Подписка на {t.duration_days} дней"
                     },
                     "redirectUrl": get_return_url(source='website'),
-                    "webHookUrl": f"{YOUR_SERVER_IP_OR_DOMAIN}/api/webhook/monobank",
+                    "webHookUrl": WEBHOOK_URLS['monobank'],
                     "validity": 3600,
                     "paymentType": "debit"
                 }
                 
-                headers = {
-                    "X-Token": monobank_token,
-                    "Content-Type": "application/json"
-                }
-                
-                resp = requests.post("https://api.monobank.ua/api/merchant/invoice/create", json=payload, headers=headers, timeout=30)
+                resp = post_json("https://api.monobank.ua/api/merchant/invoice/create", payload, {"X-Token": monobank_token})
                 if resp.ok:
                     data = resp.json()
                     payment_url = data.get('pageUrl')
@@ -1553,8 +1477,8 @@ def create_payment():
             elif payment_provider == 'platega':
                 import uuid
                 import re
-                platega_key = decrypt_key(getattr(s, 'platega_api_key', None)) if s else None
-                platega_merchant_raw = decrypt_key(getattr(s, 'platega_merchant_id', None)) if s else None
+                platega_key = s.platega_api_key if s else None
+                platega_merchant_raw = s.platega_merchant_id if s else None
                 if not platega_key or not platega_merchant_raw or platega_key == "DECRYPTION_ERROR" or platega_merchant_raw == "DECRYPTION_ERROR":
                     print(f"Platega credentials error: key={bool(platega_key)}, merchant={bool(platega_merchant_raw)}")
                     return jsonify({"message": "Platega credentials not configured"}), 500
@@ -1599,12 +1523,12 @@ def create_payment():
                     "paymentMethod": 2,
                     "paymentDetails": {
                         "amount": float(final_amount),  # Должно быть float, не int
-                        "currency": info['c']
+                        "currency": price_currency
                     },
                     "description": f"Payment for order {transaction_uuid}",
-                    "return": f"{YOUR_SERVER_IP_OR_DOMAIN}/dashboard/subscription",
-                    "failedUrl": f"{YOUR_SERVER_IP_OR_DOMAIN}/dashboard/subscription",
-                    "callbackUrl": f"{YOUR_SERVER_IP_OR_DOMAIN}/api/webhook/platega"
+                    "return": SUBSCRIPTION_PAGE_URL,
+                    "failedUrl": SUBSCRIPTION_PAGE_URL,
+                    "callbackUrl": WEBHOOK_URLS['platega']
                 }
                 
                 headers = {
@@ -1752,14 +1676,13 @@ def create_payment():
             
             # Mulenpay
             elif payment_provider == 'mulenpay':
-                mulenpay_key = decrypt_key(getattr(s, 'mulenpay_api_key', None)) if s else None
-                mulenpay_secret = decrypt_key(getattr(s, 'mulenpay_secret_key', None)) if s else None
-                mulenpay_shop = decrypt_key(getattr(s, 'mulenpay_shop_id', None)) if s else None
+                mulenpay_key = s.mulenpay_api_key if s else None
+                mulenpay_secret = s.mulenpay_secret_key if s else None
+                mulenpay_shop = s.mulenpay_shop_id if s else None
                 if not mulenpay_key or not mulenpay_secret or not mulenpay_shop or mulenpay_key == "DECRYPTION_ERROR" or mulenpay_secret == "DECRYPTION_ERROR" or mulenpay_shop == "DECRYPTION_ERROR":
                     return jsonify({"message": "Mulenpay credentials not configured"}), 500
                 
-                currency_map = {'RUB': 'rub', 'UAH': 'uah', 'USD': 'usd'}
-                mulenpay_currency = currency_map.get(info['c'], info['c'].lower())
+                mulenpay_currency = price_currency.lower()
                 
                 try:
                     shop_id_int = int(mulenpay_shop)
@@ -1776,17 +1699,13 @@ def create_payment():
                     "holdTime": None
                 }
                 
-                import base64
-                auth_string = f"{mulenpay_key}:{mulenpay_secret}"
-                auth_b64 = base64.b64encode(auth_string.encode('ascii')).decode('ascii')
-                
                 headers = {
-                    "Authorization": f"Basic {auth_b64}",
+                    "Authorization": s.mulenpay_basic_auth,
                     "Content-Type": "application/json"
                 }
                 
                 try:
-                    resp = requests.post("https://api.mulenpay.ru/v2/payments", json=payload, headers=headers, timeout=30)
+                    resp = post_json("https://api.mulenpay.ru/v2/payments", payload, headers)
                     resp.raise_for_status()
                     payment_data = resp.json()
                     
@@ -1809,14 +1728,13 @@ def create_payment():
             
             # UrlPay
             elif payment_provider == 'urlpay':
-                urlpay_key = decrypt_key(getattr(s, 'urlpay_api_key', None)) if s else None
-                urlpay_secret = decrypt_key(getattr(s, 'urlpay_secret_key', None)) if s else None
-                urlpay_shop = decrypt_key(getattr(s, 'urlpay_shop_id', None)) if s else None
+                urlpay_key = s.urlpay_api_key if s else None
+                urlpay_secret = s.urlpay_secret_key if s else None
+                urlpay_shop = s.urlpay_shop_id if s else None
                 if not urlpay_key or not urlpay_secret or not urlpay_shop or urlpay_key == "DECRYPTION_ERROR" or urlpay_secret == "DECRYPTION_ERROR" or urlpay_shop == "DECRYPTION_ERROR":
                     return jsonify({"message": "UrlPay credentials not configured"}), 500
                 
-                currency_map = {'RUB': 'rub', 'UAH': 'uah', 'USD': 'usd'}
-                urlpay_currency = currency_map.get(info['c'], info['c'].lower())
+                urlpay_currency = price_currency.lower()
                 
                 try:
                     shop_id_int = int(urlpay_shop)
@@ -1833,17 +1751,13 @@ def create_payment():
                     "holdTime": None
                 }
                 
-                import base64
-                auth_string = f"{urlpay_key}:{urlpay_secret}"
-                auth_b64 = base64.b64encode(auth_string.encode('ascii')).decode('ascii')
-                
                 headers = {
-                    "Authorization": f"Basic {auth_b64}",
+                    "Authorization": s.urlpay_basic_auth,
                     "Content-Type": "application/json"
                 }
                 
                 try:
-                    resp = requests.post("https://api.urlpay.io/v2/payments", json=payload, headers=headers, timeout=30)
+                    resp = post_json("https://api.urlpay.io/v2/payments", payload, headers)
                     resp.raise_for_status()
                     payment_data = resp.json()
                     
@@ -1866,9 +1780,9 @@ def create_payment():
             
             # BTCPayServer
             elif payment_provider == 'btcpayserver':
-                btcpayserver_url = decrypt_key(getattr(s, 'btcpayserver_url', None)) if s else None
-                btcpayserver_api_key = decrypt_key(getattr(s, 'btcpayserver_api_key', None)) if s else None
-                btcpayserver_store_id = decrypt_key(getattr(s, 'btcpayserver_store_id', None)) if s else None
+                btcpayserver_url = s.btcpayserver_url if s else None
+                btcpayserver_api_key = s.btcpayserver_api_key if s else None
+                btcpayserver_store_id = s.btcpayserver_store_id if s else None
                 if not btcpayserver_url or not btcpayserver_api_key or not btcpayserver_store_id or btcpayserver_url == "DECRYPTION_ERROR" or btcpayserver_api_key == "DECRYPTION_ERROR" or btcpayserver_store_id == "DECRYPTION_ERROR":
                     return jsonify({"message": "BTCPayServer credentials not configured"}), 500
                 
@@ -1886,7 +1800,7 @@ def create_payment():
                 
                 payload = {
                     "amount": f"{final_amount:.2f}",
-                    "currency": info['c'],
+                    "currency": price_currency,
                     "metadata": metadata,
                     "checkout": checkout_options
                 }
@@ -1899,7 +1813,7 @@ def create_payment():
                 }
                 
                 try:
-                    resp = requests.post(invoice_url, json=payload, headers=headers, timeout=30)
+                    resp = post_json(invoice_url, payload, headers)
                     resp.raise_for_status()
                     invoice_data = resp.json()
                     
@@ -1920,12 +1834,11 @@ def create_payment():
             
             # Tribute
             elif payment_provider == 'tribute':
-                tribute_api_key = decrypt_key(getattr(s, 'tribute_api_key', None)) if s else None
+                tribute_api_key = s.tribute_api_key if s else None
                 if not tribute_api_key or tribute_api_key == "DECRYPTION_ERROR":
                     return jsonify({"message": "Tribute API key not configured"}), 500
                 
-                currency_map = {'RUB': 'rub', 'UAH': 'rub', 'USD': 'eur'}
-                tribute_currency = currency_map.get(info['c'], 'rub')
+                tribute_currency = TRIBUTE_CURRENCIES.get(price_currency, 'rub')
                 
                 amount_in_cents = int(final_amount * 100)
                 
@@ -1934,8 +1847,8 @@ def create_payment():
                     "currency": tribute_currency,
                     "title": f"VPN Subscription - {t.name}"[:100],
                     "description": f"VPN subscription for {t.duration_days} days"[:300],
-                    "successUrl": f"{YOUR_SERVER_IP_OR_DOMAIN}/dashboard/subscription",
-                    "failUrl": f"{YOUR_SERVER_IP_OR_DOMAIN}/dashboard/subscription"
+                    "successUrl": SUBSCRIPTION_PAGE_URL,
+                    "failUrl": SUBSCRIPTION_PAGE_URL
                 }
                 
                 if user.email:
@@ -1947,7 +1860,7 @@ def create_payment():
                 }
                 
                 try:
-                    resp = requests.post("https://tribute.tg/api/v1/shop/orders", json=payload, headers=headers, timeout=30)
+                    resp = post_json("https://tribute.tg/api/v1/shop/orders", payload, headers)
                     resp.raise_for_status()
                     order_data = resp.json()
                     
@@ -1968,8 +1881,8 @@ def create_payment():
             
             # CrystalPay по умолчанию
             else:
-                crystalpay_key = decrypt_key(s.crystalpay_api_key) if s else None
-                crystalpay_secret = decrypt_key(s.crystalpay_api_secret) if s else None
+                crystalpay_key = s.crystalpay_api_key if s else None
+                crystalpay_secret = s.crystalpay_api_secret if s else None
                 if not crystalpay_key or not crystalpay_secret or crystalpay_key == "DECRYPTION_ERROR" or crystalpay_secret == "DECRYPTION_ERROR":
                     return jsonify({"message": "CrystalPay credentials not configured"}), 500
                 
@@ -1982,14 +1895,14 @@ def create_payment():
                     "auth_secret": crystalpay_secret,
                     "amount": f"{final_amount:.2f}",
                     "type": "purchase",
-                    "currency": info['c'],
+                    "currency": price_currency,
                     "lifetime": 60,
                     "extra": order_id,
-                    "callback_url": f"{YOUR_SERVER_IP_OR_DOMAIN}/api/webhook/crystalpay",
+                    "callback_url": WEBHOOK_URLS['crystalpay'],
                     "redirect_url": redirect_url
                 }
                 
-                resp = requests.post("https://api.crystalpay.io/v3/invoice/create/", json=payload, timeout=10)
+                resp = post_json("https://api.crystalpay.io/v3/invoice/create/", payload)
                 if resp.ok:
                     data = resp.json()
                     if not data.get('errors'):
@@ -2010,7 +1923,7 @@ def create_payment():
                 tariff_id=t.id,
                 status='PENDING',
                 amount=final_amount,
-                currency=info['c'],
+                currency=price_currency,
                 payment_system_id=str(payment_system_id) if payment_system_id else order_id,
                 payment_provider=payment_provider,
                 promo_code_id=promo_code_obj.id if promo_code_obj else None
@@ -2021,8 +1934,7 @@ def create_payment():
         
     except Exception as e:
         db.session.rollback()
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in create_payment")
         return jsonify({"message": "Internal Error"}), 500
 
 
@@ -2042,17 +1954,16 @@ def get_subscription_config():
         subscription_url = None
         
         # Пробуем получить из кэша
-        cache_key = f'live_data_{user.remnawave_uuid}'
-        cached = cache.get(cache_key)
+        headers, cookies = get_remnawave_headers()
+        cached = get_cached_live_data(user.remnawave_uuid, headers, cookies)
         
         if cached:
             subscription_url = cached.get('subscriptionUrl')
         else:
             # Получаем из RemnaWave API
             API_URL = os.getenv('API_URL')
-            headers, cookies = get_remnawave_headers()
             try:
-                resp = requests.get(
+                resp = remnawave_session.get(
                     f"{API_URL}/api/users/{user.remnawave_uuid}",
                     headers=headers,
                     cookies=cookies,
@@ -2061,7 +1972,7 @@ def get_subscription_config():
                 if resp.status_code == 200:
                     data = resp.json().get('response', {})
                     subscription_url = data.get('subscriptionUrl')
-                    cache.set(cache_key, data, timeout=300)
+                    set_live_data(user.remnawave_uuid, data, delta=resp.elapsed.total_seconds())
             except Exception as e:
                 print(f"Error fetching subscription URL: {e}")
         
@@ -2070,7 +1981,7 @@ def get_subscription_config():
         
         # Получаем содержимое subscription URL
         try:
-            resp = requests.get(subscription_url, timeout=10)
+            resp = remnawave_session.get(subscription_url, timeout=10)
             if resp.status_code == 200:
                 config_content = resp.text
                 return jsonify({
@@ -2084,6 +1995,5 @@ def get_subscription_config():
             return jsonify({"message": "Ошибка при получении конфигурации"}), 500
             
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in get_subscription_config")
         return jsonify({"message": "Internal Error"}), 500
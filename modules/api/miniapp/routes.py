@@ -10,70 +10,176 @@ API эндпоинты Telegram Mini App
 """
 
 from flask import request, jsonify
+from functools import lru_cache, wraps
+from types import MappingProxyType
 from datetime import datetime, timezone, timedelta
 import requests
 import json
+import hashlib
+import hmac
 import os
 import urllib.parse
 import re
+import threading
+import time
 import uuid
-
-from modules.core import get_app, get_db, get_cache, get_limiter, get_fernet
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select, or_
+from sqlalchemy.orm import load_only
+
+from modules.core import get_app, get_db, get_cache, get_limiter, get_bcrypt, get_fernet
+from modules.local_limiter import local_limit
+from modules.cors import with_cors
+from modules.currency import convert_from_usd, parse_iso_datetime
+from modules.remnawave import (
+    invalidate_user_cache, set_live_data, get_cached_live_data, get_live_user, remnawave_session,
+    extract_response, ADMIN_HEADERS
+)
 from modules.models.user import User
-from modules.models.tariff import Tariff
+from modules.models.tariff import Tariff, CURRENCY_CODES, get_tariffs_list
 from modules.models.promo import PromoCode
-from modules.models.payment import Payment, PaymentSetting
-from modules.models.referral import ReferralSetting
-from modules.models.branding import BrandingSetting
+from modules.models.payment import Payment, get_configured_payment_fields
+from modules.api.payments import PAYMENT_PROVIDERS
+from modules.api.payments.base import get_decrypted_payment_settings, payment_session
+from modules.models.referral import ReferralSetting, get_referral_config
+from modules.models.branding import BrandingSetting, get_branding_config
+from modules.models.system import SystemSetting
+from modules.models.ticket import Ticket, TicketMessage
+from modules.api.webhooks.routes import process_successful_payment
+from modules.api.admin.routes import send_telegram_message
+from modules.notifications import notify_support_ticket
 
 app = get_app()
 db = get_db()
 cache = get_cache()
 limiter = get_limiter()
+bcrypt = get_bcrypt()
+
+# Запросы к RemnaWave, выполняемые параллельно с обращениями к БД
+live_data_executor = ThreadPoolExecutor(max_workers=8)
+
+
+# Проверка подписи initData: секретные ключи считаются один раз по токенам клиентских ботов.
+# MINIAPP_VERIFY_INIT_DATA=false отключает проверку
+VERIFY_INIT_DATA = os.getenv("MINIAPP_VERIFY_INIT_DATA", "true").lower() != "false"
+_INIT_DATA_SECRET_KEYS = [
+    hmac.new(b"WebAppData", token.encode(), hashlib.sha256).digest()
+    for token in dict.fromkeys(filter(None, (os.getenv("CLIENT_BOT_TOKEN"), os.getenv("CLIENT_BOT_V2_TOKEN"))))
+]
+# Максимальный возраст initData (auth_date) в секундах; 0 - без ограничения
+INIT_DATA_MAX_AGE = int(os.getenv("MINIAPP_INIT_DATA_MAX_AGE", "86400"))
+
+
+def find_init_data_field(init_data, name):
+    """Значение поля из строки initData (как parse_qs: первое вхождение, декодированное)"""
+    prefix = name + '='
+    if init_data.startswith(prefix):
+        start = len(prefix)
+    else:
+        pos = init_data.find('&' + prefix)
+        if pos == -1:
+            return None
+        start = pos + 1 + len(prefix)
+    end = init_data.find('&', start)
+    raw = init_data[start:] if end == -1 else init_data[start:end]
+    return urllib.parse.unquote_plus(raw) if raw else None
+
+
+def verify_init_data(init_data):
+    """
+    Проверить подпись initData одним из клиентских ботов
 
-
-def decrypt_key(key):
-    fernet = get_fernet()
-    if not key or not fernet:
-        return ""
+    hash = HMAC-SHA256(data-check-string, HMAC-SHA256(bot_token, "WebAppData")),
+    где data-check-string - все поля кроме hash, отсортированные по ключу, через \\n.
+    """
+    received_hash = None
+    fields = []
+    for part in init_data.split('&'):
+        key, _, value = part.partition('=')
+        if key == 'hash':
+            received_hash = value
+        elif key:
+            fields.append((key, urllib.parse.unquote_plus(value)))
+    if not received_hash:
+        return False
+    data_check_string = '\n'.join(f"{key}={value}" for key, value in sorted(fields)).encode()
+    return any(
+        hmac.compare_digest(hmac.new(secret_key, data_check_string, hashlib.sha256).hexdigest(), received_hash)
+        for secret_key in _INIT_DATA_SECRET_KEYS
+    )
+
+
+def is_init_data_fresh(init_data):
+    """auth_date из initData не старше INIT_DATA_MAX_AGE (подлинность поля проверяет подпись)"""
+    if INIT_DATA_MAX_AGE <= 0:
+        return True
     try:
-        return fernet.decrypt(key).decode('utf-8')
-    except:
-        return ""
+        auth_date = int(find_init_data_field(init_data, 'auth_date') or 0)
+    except ValueError:
+        return False
+    return time.time() - auth_date <= INIT_DATA_MAX_AGE
 
 
 def parse_telegram_init_data(init_data):
-    """Парсит initData из Telegram"""
+    """Парсит initData из Telegram (с проверкой подписи, если заданы токены ботов)"""
     if not init_data:
         return None, None
+    if isinstance(init_data, str):
+        # Срок проверяется при каждом запросе: результат разбора ниже кэшируется
+        if VERIFY_INIT_DATA and _INIT_DATA_SECRET_KEYS and not is_init_data_fresh(init_data):
+            return None, None
+        return _parse_init_data_string(init_data)
+    if not isinstance(init_data, dict):
+        return None, None
     
     try:
-        if isinstance(init_data, dict):
-            parsed_data = init_data
-        else:
-            parsed_data = urllib.parse.parse_qs(init_data)
-        
-        user_str = parsed_data.get('user', [''])[0] if isinstance(parsed_data.get('user'), list) else parsed_data.get('user')
+        # Подпись словаря проверить нельзя
+        if VERIFY_INIT_DATA and _INIT_DATA_SECRET_KEYS:
+            return None, None
+        user_str = init_data.get('user', [''])[0] if isinstance(init_data.get('user'), list) else init_data.get('user')
         
         if not user_str:
             return None, None
         
         if isinstance(user_str, str):
-            user_data = json.loads(urllib.parse.unquote(user_str))
+            user_data = app.json.loads(urllib.parse.unquote_to_bytes(user_str))
         else:
             user_data = user_str
         
         return user_data.get('id'), user_data
-    except:
+    except (ValueError, TypeError, AttributeError):
         return None, None
 
 
-def get_referral_settings():
-    return ReferralSetting.query.first()
+@lru_cache(maxsize=4096)
+def _parse_init_data_string(init_data):
+    """
+    Проверка подписи и разбор строки initData
+
+    Строка initData не меняется в течение сессии мини-приложения, поэтому
+    результат кэшируется; данные пользователя отдаются только для чтения.
+    """
+    try:
+        if VERIFY_INIT_DATA and _INIT_DATA_SECRET_KEYS and not verify_init_data(init_data):
+            return None, None
+        # Нужно только поле user - ищем его напрямую, без разбора всей строки через parse_qs
+        user_str = find_init_data_field(init_data, 'user')
+        if not user_str:
+            return None, None
+        # unquote_to_bytes + orjson (app.json): без промежуточной декодированной строки
+        user_data = app.json.loads(urllib.parse.unquote_to_bytes(user_str))
+        return user_data.get('id'), MappingProxyType(user_data)
+    except (ValueError, TypeError, AttributeError):
+        return None, None
 
 
-def get_branding_settings():
-    return BrandingSetting.query.first()
+def is_valid_telegram_id(telegram_id):
+    """Telegram ID из initData - положительное целое (bool не считается)"""
+    return isinstance(telegram_id, int) and not isinstance(telegram_id, bool) and telegram_id > 0
+
+
+def get_referral_settings():
+    return ReferralSetting.query.first()
 
 
 def get_remnawave_headers():
@@ -95,130 +201,171 @@ def get_remnawave_headers():
     return headers, cookies
 
 
+def get_request_data():
+    """Тело запроса мини-приложения: JSON (в том числе без Content-Type) или форма"""
+    # Тело разбирается один раз (результат кэшируется в request) провайдером app.json
+    data = request.get_json(force=True, silent=True)
+    if isinstance(data, dict):
+        return data
+    return request.form.to_dict()
+
+
+def get_request_telegram_id(data):
+    """
+    Telegram ID из initData запроса: (telegram_id, передан ли initData)
+
+    initData ищется в теле, заголовках X-Telegram-Init-Data / X-Init-Data и query.
+    Без него берётся initDataUnsafe - как словарь он проходит через
+    parse_telegram_init_data и принимается только при отключённой проверке подписи.
+    """
+    init_data = (data.get('initData') or request.headers.get('X-Telegram-Init-Data')
+                 or request.headers.get('X-Init-Data') or request.args.get('initData'))
+    if not init_data:
+        unsafe = data.get('initDataUnsafe')
+        if not isinstance(unsafe, dict) or not unsafe.get('user'):
+            return None, False
+        init_data = unsafe
+    telegram_id, _ = parse_telegram_init_data(init_data)
+    return telegram_id, True
+
+
 # ============================================================================
 # SUBSCRIPTION
 # ============================================================================
 
+def adapt_data_for_miniapp(data_dict, user_obj):
+    """
+    Ответ /miniapp/subscription из данных RemnaWave и локального пользователя
+
+    Исходный словарь (данные из кэша) не изменяется, поэтому копия не нужна.
+    """
+    expire_at = data_dict.get('expireAt')
+    has_active = False
+    if expire_at:
+        try:
+            expire_dt = datetime.fromisoformat(expire_at) if isinstance(expire_at, str) else expire_at
+            has_active = expire_dt > datetime.now(timezone.utc)
+        except:
+            pass
+
+    balance_usd = float(user_obj.balance) if user_obj.balance else 0.0
+    currency = user_obj.preferred_currency or 'uah'
+    balance_display = convert_from_usd(balance_usd, currency)
+    
+    # Каждое поле RemnaWave читается из словаря один раз
+    remnawave_uuid = data_dict.get('uuid') or user_obj.remnawave_uuid
+    active_squads = data_dict.get('activeInternalSquads', [])
+    
+    # Формируем данные пользователя (совместимо со старым мини-апп)
+    user_data = {
+        'id': user_obj.telegram_id,
+        'telegram_id': user_obj.telegram_id,
+        'username': user_obj.telegram_username or f"user_{user_obj.telegram_id}",
+        'email': user_obj.email,
+        'uuid': remnawave_uuid,
+        'has_active_subscription': has_active,
+        'subscription_status': 'active' if has_active else 'inactive',
+        'expireAt': expire_at,
+        'referral_code': user_obj.referral_code,
+        'traffic_used': data_dict.get('usedTrafficBytes', 0),
+        'traffic_limit': data_dict.get('trafficLimitBytes', 0),
+        'balance': balance_display,
+        'balance_usd': balance_usd,
+        'currency': currency,
+        'preferred_currency': currency,
+        'activeInternalSquads': active_squads  # Для старого мини-апп
+    }
+    
+    # Возвращаем в формате, совместимом со старым мини-апп
+    # Старый мини-апп ожидает: subscriptionData.response || subscriptionData
+    # И проверяет userData.activeInternalSquads
+    return {
+        'response': user_data,  # Для совместимости со старым мини-апп
+        'user': user_data,  # Для нового мини-апп
+        'subscription_url': data_dict.get('subscriptionUrl'),
+        'subscription_missing': not has_active,
+        'uuid': remnawave_uuid,
+        'expireAt': expire_at,
+        'activeInternalSquads': active_squads  # Для совместимости
+    }
+
+
 @app.route('/miniapp/subscription', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_subscription():
     """Данные подписки пользователя"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        return response
-
     try:
-        data = {}
-        if request.is_json:
-            data = request.json or {}
-        elif request.form:
-            data = dict(request.form)
-        elif request.data:
-            try:
-                data = json.loads(request.data.decode('utf-8'))
-            except:
-                pass
+        data = get_request_data()
 
         init_data = data.get('initData') or data.get('init_data') or ''
         telegram_id, _ = parse_telegram_init_data(init_data)
 
-        if not telegram_id:
-            print(f"[MINIAPP] Missing or invalid initData: {init_data[:100] if init_data else 'None'}")
+        # Некорректный ID отсекается до обращений к кэшу и БД
+        if not is_valid_telegram_id(telegram_id):
+            app.logger.warning("[MINIAPP] Missing or invalid initData (%d chars)", len(init_data) if init_data else 0)
             return jsonify({
                 "detail": {"title": "Authorization Error", "message": "Missing or invalid initData"}
             }), 401
 
-        # Ищем пользователя по telegram_id (как строка)
         telegram_id_str = str(telegram_id)
+        rw_headers = ADMIN_HEADERS
+
+        # Если UUID известен по telegram_id, а данных в кэше нет, запрос к RemnaWave
+        # выполняется параллельно с поиском пользователя в БД
+        live_future = None
+        known_uuid = cache.get(f'tg_uuid_{telegram_id_str}')
+        cached = get_cached_live_data(known_uuid, rw_headers) if known_uuid else None
+        if known_uuid and not cached:
+            live_future = live_data_executor.submit(
+                remnawave_session.get,
+                f"{os.getenv('API_URL')}/api/users/{known_uuid}",
+                headers=rw_headers,
+                timeout=10
+            )
+
+        # Ищем пользователя по telegram_id (как строка)
         user = User.query.filter_by(telegram_id=telegram_id_str).first()
         if not user:
-            print(f"[MINIAPP] User not found for telegram_id: {telegram_id_str}")
+            app.logger.info("[MINIAPP] User not found for telegram_id: %s", telegram_id_str)
             # Возвращаем 404, чтобы старый мини-апп показал сообщение о регистрации
             return jsonify({
                 "detail": {"title": "User Not Found", "message": "Please register in the bot first"}
             }), 404
         
-        print(f"[MINIAPP] User found: id={user.id}, telegram_id={user.telegram_id}, email={user.email}")
-
-        # Получаем данные из кэша
-        cache_key = f'live_data_{user.remnawave_uuid}'
-        cached = cache.get(cache_key)
-
-        def adapt_data(data_dict, user_obj):
-            expire_at = data_dict.get('expireAt')
-            has_active = False
-            if expire_at:
-                try:
-                    expire_dt = datetime.fromisoformat(expire_at) if isinstance(expire_at, str) else expire_at
-                    has_active = expire_dt > datetime.now(timezone.utc)
-                except:
-                    pass
+        app.logger.debug("[MINIAPP] User found: id=%s, telegram_id=%s", user.id, user.telegram_id)
 
-            from modules.currency import convert_from_usd
-            balance_display = convert_from_usd(float(user_obj.balance) if user_obj.balance else 0.0, user_obj.preferred_currency or 'uah')
-            
-            # Получаем активные сквады из данных RemnaWave
-            active_squads = data_dict.get('activeInternalSquads', [])
-            
-            # Формируем данные пользователя (совместимо со старым мини-апп)
-            user_data = {
-                'id': user_obj.telegram_id,
-                'telegram_id': user_obj.telegram_id,
-                'username': user_obj.telegram_username or f"user_{user_obj.telegram_id}",
-                'email': user_obj.email,
-                'uuid': data_dict.get('uuid') or user_obj.remnawave_uuid,
-                'has_active_subscription': has_active,
-                'subscription_status': 'active' if has_active else 'inactive',
-                'expireAt': expire_at,
-                'referral_code': user_obj.referral_code,
-                'traffic_used': data_dict.get('usedTrafficBytes', 0),
-                'traffic_limit': data_dict.get('trafficLimitBytes', 0),
-                'balance': balance_display,
-                'balance_usd': float(user_obj.balance) if user_obj.balance else 0.0,
-                'currency': user_obj.preferred_currency or 'uah',
-                'preferred_currency': user_obj.preferred_currency or 'uah',
-                'activeInternalSquads': active_squads  # Для старого мини-апп
-            }
-            
-            # Возвращаем в формате, совместимом со старым мини-апп
-            # Старый мини-апп ожидает: subscriptionData.response || subscriptionData
-            # И проверяет userData.activeInternalSquads
-            return {
-                'response': user_data,  # Для совместимости со старым мини-апп
-                'user': user_data,  # Для нового мини-апп
-                'subscription_url': data_dict.get('subscriptionUrl'),
-                'subscription_missing': not has_active,
-                'uuid': data_dict.get('uuid') or user_obj.remnawave_uuid,
-                'expireAt': expire_at,
-                'activeInternalSquads': active_squads  # Для совместимости
-            }
+        if user.remnawave_uuid != known_uuid:
+            # UUID в кэше устарел или отсутствует - предзагрузка не подходит
+            live_future = None
+            cached = get_cached_live_data(user.remnawave_uuid, rw_headers)
+            if user.remnawave_uuid:
+                cache.set(f'tg_uuid_{telegram_id_str}', user.remnawave_uuid, timeout=3600)
 
         if cached:
-            response = jsonify(adapt_data(cached.copy(), user))
-            response.headers.add('Access-Control-Allow-Origin', '*')
+            response = jsonify(adapt_data_for_miniapp(cached, user))
             return response, 200
 
-        # Запрос к RemnaWave
+        # Запрос к RemnaWave (или результат уже запущенного)
         try:
-            resp = requests.get(
-                f"{os.getenv('API_URL')}/api/users/{user.remnawave_uuid}",
-                headers={"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"},
-                timeout=10
-            )
+            if live_future is not None:
+                resp = live_future.result()
+            else:
+                resp = remnawave_session.get(
+                    f"{os.getenv('API_URL')}/api/users/{user.remnawave_uuid}",
+                    headers=rw_headers,
+                    timeout=10
+                )
 
             if resp.status_code != 200:
                 return jsonify({
                     "detail": {"title": "Error", "message": f"Failed to fetch data: {resp.status_code}"}
                 }), 500
 
-            data = resp.json().get('response', {})
-            cache.set(cache_key, data, timeout=300)
+            data = extract_response(app.json.loads(resp.content))
+            set_live_data(user.remnawave_uuid, data, delta=resp.elapsed.total_seconds())
 
-            response = jsonify(adapt_data(data, user))
-            response.headers.add('Access-Control-Allow-Origin', '*')
+            response = jsonify(adapt_data_for_miniapp(data, user))
             return response, 200
 
         except Exception as e:
@@ -233,43 +380,39 @@ def miniapp_subscription():
 
 
 @app.route('/miniapp/maintenance/status', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_maintenance_status():
     """Статус техобслуживания"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response
-    
     return jsonify({"isActive": False, "is_active": False, "message": None}), 200
 
 
 @app.route('/miniapp/subscription/trial', methods=['POST'])
-@limiter.limit("10 per minute")
+@limiter.exempt
+@local_limit("10 per minute")
 def miniapp_activate_trial():
     """Активация триала"""
     try:
-        data = request.json or {}
+        data = get_request_data()
         init_data = data.get('initData', '')
         telegram_id, _ = parse_telegram_init_data(init_data)
 
-        if not telegram_id:
+        if not is_valid_telegram_id(telegram_id):
             return jsonify({"success": False, "message": "Missing initData"}), 401
 
         user = User.query.filter_by(telegram_id=str(telegram_id)).first()
         if not user:
             return jsonify({"success": False, "message": "User not registered"}), 404
+        if not user.remnawave_uuid:
+            return jsonify({"success": False, "message": "User is not linked to RemnaWave"}), 400
 
         new_exp = (datetime.now(timezone.utc) + timedelta(days=3)).isoformat()
 
-        referral_settings = get_referral_settings()
-        trial_squad_id = os.getenv("DEFAULT_SQUAD_ID")
-        if referral_settings and referral_settings.trial_squad_id:
-            trial_squad_id = referral_settings.trial_squad_id
+        trial_squad_id = get_referral_config().get('trial_squad_id') or os.getenv("DEFAULT_SQUAD_ID")
 
-        resp = requests.patch(
+        resp = remnawave_session.patch(
             f"{os.getenv('API_URL')}/api/users",
-            headers={"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"},
+            headers=ADMIN_HEADERS,
             json={"uuid": user.remnawave_uuid, "expireAt": new_exp, "activeInternalSquads": [trial_squad_id]},
             timeout=10
         )
@@ -277,7 +420,7 @@ def miniapp_activate_trial():
         if resp.status_code != 200:
             return jsonify({"success": False, "message": "Failed to activate trial"}), 500
 
-        cache.delete(f'live_data_{user.remnawave_uuid}')
+        invalidate_user_cache(user.remnawave_uuid, nodes=True)
         return jsonify({"success": True, "message": "Trial activated! +3 days"}), 200
 
     except Exception as e:
@@ -288,85 +431,63 @@ def miniapp_activate_trial():
 # PAYMENTS
 # ============================================================================
 
+# Поле настроек, наличие которого включает метод оплаты, и описание метода
+PAYMENT_METHODS = (
+    ('crystalpay_api_key', {"id": "crystalpay", "name": "CrystalPay", "type": "redirect"}),
+    ('heleket_api_key', {"id": "heleket", "name": "Heleket (Крипто)", "type": "crypto"}),
+    ('yookassa_shop_id', {"id": "yookassa", "name": "YooKassa", "type": "redirect"}),
+    ('telegram_bot_token', {"id": "telegram_stars", "name": "Telegram Stars", "type": "telegram"}),
+    ('platega_api_key', {"id": "platega", "name": "Platega", "type": "redirect"}),
+    ('monobank_token', {"id": "monobank", "name": "Monobank", "type": "card"}),
+    ('freekassa_shop_id', {"id": "freekassa", "name": "Freekassa", "type": "redirect"}),
+    ('robokassa_merchant_login', {"id": "robokassa", "name": "Robokassa", "type": "redirect"}),
+    ('mulenpay_api_key', {"id": "mulenpay", "name": "MulenPay", "type": "redirect"}),
+    ('urlpay_api_key', {"id": "urlpay", "name": "UrlPay", "type": "redirect"}),
+    ('tribute_api_key', {"id": "tribute", "name": "Tribute", "type": "redirect"}),
+    ('btcpayserver_api_key', {"id": "btcpayserver", "name": "BTCPay (Bitcoin)", "type": "crypto"}),
+)
+
+# Готовое тело ответа /miniapp/payments/methods для последнего набора заполненных полей
+_payment_methods_body = (None, None)
+
+
+def get_payment_methods_body():
+    """Сериализованный JSON со списком доступных методов оплаты (без расшифровки ключей)"""
+    global _payment_methods_body
+    configured = get_configured_payment_fields()
+    fields, body = _payment_methods_body
+    if fields != configured:
+        available = [method for field, method in PAYMENT_METHODS if field in configured]
+        body = app.json.dumps({"methods": available}).encode('utf-8')
+        _payment_methods_body = (configured, body)
+    return body
+
+
 @app.route('/miniapp/payments/methods', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_payment_methods():
     """Методы оплаты"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response
-
     try:
-        s = PaymentSetting.query.first()
-        if not s:
-            return jsonify({"methods": []}), 200
-
-        available = []
-
-        if s.crystalpay_api_key and decrypt_key(s.crystalpay_api_key):
-            available.append({"id": "crystalpay", "name": "CrystalPay", "type": "redirect"})
-        if s.heleket_api_key and decrypt_key(s.heleket_api_key):
-            available.append({"id": "heleket", "name": "Heleket (Крипто)", "type": "crypto"})
-        if s.yookassa_shop_id and decrypt_key(s.yookassa_shop_id):
-            available.append({"id": "yookassa", "name": "YooKassa", "type": "redirect"})
-        if s.telegram_bot_token and decrypt_key(s.telegram_bot_token):
-            available.append({"id": "telegram_stars", "name": "Telegram Stars", "type": "telegram"})
-        if getattr(s, 'platega_api_key', None) and decrypt_key(s.platega_api_key):
-            available.append({"id": "platega", "name": "Platega", "type": "redirect"})
-        if getattr(s, 'monobank_token', None) and decrypt_key(s.monobank_token):
-            available.append({"id": "monobank", "name": "Monobank", "type": "card"})
-        if getattr(s, 'freekassa_shop_id', None) and decrypt_key(s.freekassa_shop_id):
-            available.append({"id": "freekassa", "name": "Freekassa", "type": "redirect"})
-        if getattr(s, 'robokassa_merchant_login', None) and decrypt_key(s.robokassa_merchant_login):
-            available.append({"id": "robokassa", "name": "Robokassa", "type": "redirect"})
-        if getattr(s, 'mulenpay_api_key', None) and decrypt_key(s.mulenpay_api_key):
-            available.append({"id": "mulenpay", "name": "MulenPay", "type": "redirect"})
-        if getattr(s, 'urlpay_api_key', None) and decrypt_key(s.urlpay_api_key):
-            available.append({"id": "urlpay", "name": "UrlPay", "type": "redirect"})
-        if getattr(s, 'tribute_api_key', None) and decrypt_key(s.tribute_api_key):
-            available.append({"id": "tribute", "name": "Tribute", "type": "redirect"})
-        if getattr(s, 'btcpayserver_api_key', None) and decrypt_key(s.btcpayserver_api_key):
-            available.append({"id": "btcpayserver", "name": "BTCPay (Bitcoin)", "type": "crypto"})
-
-        response = jsonify({"methods": available})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response, 200
+        return app.response_class(get_payment_methods_body(), mimetype='application/json'), 200
     except Exception as e:
         return jsonify({"methods": []}), 200
 
 
 @app.route('/miniapp/payments/create', methods=['POST', 'OPTIONS'])
-@limiter.limit("10 per minute")
+@limiter.exempt
+@local_limit("10 per minute")
 def miniapp_create_payment():
     """Создание платежа"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response
-
     try:
-        data = request.json or {}
-        init_data = data.get('initData') or ''
-        telegram_id, _ = parse_telegram_init_data(init_data)
-
-        if not telegram_id:
-            # Попробуем initDataUnsafe
-            unsafe = data.get('initDataUnsafe', {})
-            if isinstance(unsafe, dict) and unsafe.get('user'):
-                telegram_id = unsafe['user'].get('id')
+        data = get_request_data()
+        telegram_id, _ = get_request_telegram_id(data)
 
         if not telegram_id:
             return jsonify({
                 "detail": {"title": "Authorization Error", "message": "Missing initData"}
             }), 401
 
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
-            return jsonify({
-                "detail": {"title": "User Not Found", "message": "Please register first"}
-            }), 404
-
         tariff_id = data.get('tariff_id') or data.get('tariffId')
         amount = data.get('amount')  # Для пополнения баланса
         payment_provider = data.get('payment_provider') or data.get('paymentProvider', 'crystalpay')
@@ -374,6 +495,44 @@ def miniapp_create_payment():
         # Обработка промокода - опциональный параметр
         promo_code_raw = data.get('promo_code') or data.get('promoCode') or ''
         promo_code_str = promo_code_raw.strip().upper() if promo_code_raw and promo_code_raw.strip() else None
+
+        # Провайдер выбирается по таблице до обращений к БД и записи платежа
+        create_provider_payment = PAYMENT_PROVIDERS.get(payment_provider)
+        if not create_provider_payment:
+            return jsonify({
+                "detail": {"title": "Invalid Request", "message": f"Unknown payment provider: {payment_provider}"}
+            }), 400
+
+        # tariff_id приводится к int до запроса: нечисловое значение - ошибка клиента
+        if tariff_id:
+            try:
+                tariff_id = int(tariff_id)
+            except (ValueError, TypeError):
+                return jsonify({
+                    "detail": {"title": "Invalid Request", "message": "Invalid tariff_id"}
+                }), 400
+
+        # Пользователь, тариф и промокод загружаются одним запросом (тариф и промокод - через LEFT JOIN);
+        # у пользователя и тарифа читаются только нужные здесь колонки
+        row = db.session.execute(
+            select(User, Tariff, PromoCode)
+            .select_from(User)
+            .outerjoin(Tariff, Tariff.id == (tariff_id or None))
+            .outerjoin(PromoCode, PromoCode.code == promo_code_str)
+            .where(User.telegram_id == str(telegram_id))
+            .options(
+                load_only(User.id, User.email, User.preferred_currency),
+                load_only(Tariff.id, Tariff.price_uah, Tariff.price_rub, Tariff.price_usd),
+            )
+            .limit(1)
+        ).first()
+        if not row:
+            return jsonify({
+                "detail": {"title": "User Not Found", "message": "Please register first"}
+            }), 404
+        user, tariff, promo = row
+        # После commit объект пользователя истекает; email нужен провайдеру уже после записи платежа
+        user_email = user.email
         
         currency = data.get('currency') or user.preferred_currency or 'rub'
 
@@ -399,14 +558,12 @@ def miniapp_create_payment():
                 }), 400
             
             # Определяем валюту
-            currency_map = {"uah": "UAH", "rub": "RUB", "usd": "USD"}
-            currency_code = currency_map.get(currency, currency_map.get(user.preferred_currency, "RUB"))
+            currency_code = CURRENCY_CODES.get(currency) or CURRENCY_CODES.get(user.preferred_currency, "RUB")
             
-            # Создаем запись о платеже на пополнение баланса
-            import uuid
+            # Данные записи о платеже на пополнение баланса
             order_id = f"SN-{uuid.uuid4().hex[:12].upper()}"
             
-            payment_db = Payment(
+            payment_values = dict(
                 order_id=order_id,
                 user_id=user.id,
                 tariff_id=None,
@@ -416,27 +573,19 @@ def miniapp_create_payment():
                 promo_code_id=None,
                 status='PENDING'
             )
-            
-            db.session.add(payment_db)
-            db.session.commit()
         else:
             # Покупка тарифа
-            tariff = db.session.get(Tariff, int(tariff_id))
             if not tariff:
                 return jsonify({
                     "detail": {"title": "Not Found", "message": "Tariff not found"}
                 }), 404
 
             # Определяем цену (используем валюту из запроса или preferred_currency пользователя)
-            price_map = {"uah": {"a": tariff.price_uah, "c": "UAH"}, "rub": {"a": tariff.price_rub, "c": "RUB"}, "usd": {"a": tariff.price_usd, "c": "USD"}}
-            info = price_map.get(currency, price_map.get(user.preferred_currency, price_map['rub']))
-
-            final_amount = info['a']
+            final_amount, currency_code = tariff.get_price(currency, user.preferred_currency, 'rub')
             promo_code_obj = None
 
             # Промокод
             if promo_code_str:
-                promo = PromoCode.query.filter_by(code=promo_code_str).first()
                 if not promo:
                     return jsonify({
                         "detail": {"title": "Invalid Promo Code", "message": "Invalid or expired promo code"}
@@ -448,15 +597,9 @@ def miniapp_create_payment():
                     }), 400
                 
                 # Применяем промокод в зависимости от типа
-                if promo.promo_type == 'PERCENT':
-                    # Процентная скидка
-                    discount = (promo.value / 100.0) * final_amount
-                    final_amount = max(0, final_amount - discount)
-                    promo_code_obj = promo
-                elif promo.promo_type == 'FIXED':
-                    # Фиксированная скидка
-                    discount = float(promo.value)
-                    final_amount = max(0, final_amount - discount)
+                if promo.promo_type in ('PERCENT', 'FIXED'):
+                    # Процентная или фиксированная скидка
+                    final_amount = promo.apply_discount(final_amount)
                     promo_code_obj = promo
                 elif promo.promo_type == 'DAYS':
                     # Промокод на бесплатные дни - не применяется к цене
@@ -469,34 +612,32 @@ def miniapp_create_payment():
                         "detail": {"title": "Invalid Promo Code", "message": "Unknown promo code type"}
                     }), 400
 
-            # Создаем запись о платеже в БД
-            import uuid
+            # Данные записи о платеже в БД
             order_id = f"SN-{uuid.uuid4().hex[:12].upper()}"
             
-            payment_db = Payment(
+            payment_values = dict(
                 order_id=order_id,
                 user_id=user.id,
                 tariff_id=tariff.id,
                 amount=final_amount,
-                currency=info['c'],
+                currency=currency_code,
                 payment_provider=payment_provider,
                 promo_code_id=promo_code_obj.id if promo_code_obj else None,
                 status='PENDING'
             )
-            
-            db.session.add(payment_db)
-            db.session.commit()
-            currency_code = info['c']
+
+        # Запись о платеже сохраняется до обращения к провайдеру: счёт провайдера
+        # не должен остаться без строки в БД, если запись не удастся
+        payment_db = Payment(**payment_values)
+        db.session.add(payment_db)
+        db.session.commit()
 
         # Создаем платеж через провайдера
-        from modules.api.payments import create_payment as create_payment_provider
-        
-        payment_url, payment_system_id = create_payment_provider(
-            provider=payment_provider,
+        payment_url, payment_system_id = create_provider_payment(
             amount=final_amount,
-            currency=currency_code if is_balance_topup else info['c'],
+            currency=currency_code,
             order_id=order_id,
-            user_email=user.email,
+            user_email=user_email,
             source='miniapp',
             miniapp_type='v1'  # Старый мини-апп использует /miniapp/
         )
@@ -508,7 +649,7 @@ def miniapp_create_payment():
             }), 500
 
         # Обновляем payment_system_id в БД
-        if payment_db and payment_system_id:
+        if payment_system_id:
             payment_db.payment_system_id = payment_system_id
             db.session.commit()
 
@@ -517,19 +658,13 @@ def miniapp_create_payment():
             "payment_system_id": payment_system_id,
             "order_id": order_id
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
         return response, 200
 
     except Exception as e:
-        print(f"Error in miniapp_create_payment: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_create_payment")
         response = jsonify({
             "detail": {"title": "Payment Error", "message": "Internal server error"}
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
 
@@ -539,11 +674,9 @@ def miniapp_create_payment():
 
 @app.route('/miniapp/app-config.json', methods=['GET'])
 @app.route('/app-config.json', methods=['GET'])
+@with_cors
 def miniapp_app_config():
     """Конфигурация приложения"""
-    import json
-    from modules.models.system import SystemSetting
-    
     # Получаем активные языки из настроек
     active_languages = ["ru", "ua", "en", "cn"]
     try:
@@ -581,17 +714,15 @@ def miniapp_app_config():
     }
 
     try:
-        branding = get_branding_settings()
+        branding = get_branding_config()
         if branding:
-            config_data['config']['branding']['name'] = branding.site_name or "StealthNET"
-            if branding.logo_url:
-                config_data['config']['branding']['logoUrl'] = branding.logo_url
+            config_data['config']['branding']['name'] = branding.get('site_name') or "StealthNET"
+            if branding.get('logo_url'):
+                config_data['config']['branding']['logoUrl'] = branding['logo_url']
     except:
         pass
 
     response = jsonify(config_data)
-    response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Content-Type', 'application/json')
     return response
 
 
@@ -600,27 +731,12 @@ def miniapp_app_config():
 # ============================================================================
 
 @app.route('/miniapp/payments/status', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_payment_status():
     """Получить статус платежа для miniapp"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        return response
-    
     try:
-        data = {}
-        if request.is_json:
-            data = request.json or {}
-        elif request.form:
-            data = dict(request.form)
-        elif request.data:
-            try:
-                data = json.loads(request.data.decode('utf-8'))
-            except:
-                pass
+        data = get_request_data()
         
         payment_id = data.get('payment_id') or data.get('paymentId') or data.get('order_id') or data.get('orderId')
         
@@ -631,33 +747,28 @@ def miniapp_payment_status():
                     "message": "payment_id is required"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 400
         
-        # Находим платеж
-        p = Payment.query.filter_by(order_id=payment_id).first()
-        if not p:
-            p = Payment.query.filter_by(payment_system_id=payment_id).first()
+        # Находим платеж по order_id или ID в платёжной системе одним запросом (оба поля индексированы)
+        p = Payment.query.options(load_only(
+            Payment.order_id, Payment.status, Payment.amount, Payment.currency,
+            Payment.payment_provider, Payment.payment_system_id
+        )).filter(or_(Payment.order_id == payment_id, Payment.payment_system_id == payment_id)).first()
         
         if not p:
             response = jsonify({
                 "status": "not_found",
                 "paid": False
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 200
         
         # Если платеж Platega со статусом PENDING, проверяем статус через API
         if p.payment_provider == 'platega' and p.status == 'PENDING' and p.payment_system_id:
             try:
-                from modules.models.payment import PaymentSetting, decrypt_key
-                import requests
-                import re
-                
-                settings = PaymentSetting.query.first()
+                settings = get_decrypted_payment_settings()
                 if settings:
-                    platega_key = decrypt_key(settings.platega_api_key) if settings.platega_api_key else None
-                    platega_merchant_raw = decrypt_key(settings.platega_merchant_id) if settings.platega_merchant_id else None
+                    platega_key = settings.platega_api_key or None
+                    platega_merchant_raw = settings.platega_merchant_id or None
                     
                     if platega_key and platega_merchant_raw:
                         # Обработка Merchant ID
@@ -677,16 +788,13 @@ def miniapp_payment_status():
                             "Content-Type": "application/json"
                         }
                         
-                        resp = requests.get(api_url, headers=headers, timeout=10)
+                        resp = payment_session.get(api_url, headers=headers, timeout=10)
                         if resp.status_code == 200:
                             api_data = resp.json()
                             api_status = api_data.get('status', '').upper()
                             
                             # Если статус CONFIRMED, обрабатываем платеж
                             if api_status == 'CONFIRMED' and p.status != 'PAID':
-                                from modules.models.user import User
-                                from modules.models.tariff import Tariff
-                                
                                 user = db.session.get(User, p.user_id)
                                 tariff = db.session.get(Tariff, p.tariff_id) if p.tariff_id else None
                                 
@@ -695,16 +803,15 @@ def miniapp_payment_status():
                                     # Если это пополнение баланса
                                     if not tariff:
                                         user.balance = (user.balance or 0) + float(p.amount)
-                                        print(f"[PLATEGA] Auto-processed balance topup {p.order_id}, new balance: {user.balance}")
+                                        app.logger.info("[PLATEGA] Auto-processed balance topup %s, new balance: %s", p.order_id, user.balance)
                                     else:
                                         # Обрабатываем покупку тарифа
-                                        from modules.api.webhooks.routes import process_successful_payment
                                         process_successful_payment(p, user, tariff)
-                                        print(f"[PLATEGA] Auto-processed tariff purchase {p.order_id}")
+                                        app.logger.info("[PLATEGA] Auto-processed tariff purchase %s", p.order_id)
                                     
                                     db.session.commit()
             except Exception as e:
-                print(f"[PLATEGA] Error checking status via API: {e}")
+                app.logger.warning("[PLATEGA] Error checking status via API: %s", e)
         
         response = jsonify({
             "status": p.status.lower(),
@@ -713,19 +820,14 @@ def miniapp_payment_status():
             "amount": p.amount,
             "currency": p.currency
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
         return response, 200
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_payment_status")
         response = jsonify({
             "status": "error",
             "paid": False
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 200
 
 
@@ -734,47 +836,24 @@ def miniapp_payment_status():
 # ============================================================================
 
 @app.route('/miniapp/promo-codes/activate', methods=['POST', 'OPTIONS'])
-@limiter.limit("10 per minute")
+@limiter.exempt
+@local_limit("10 per minute")
 def miniapp_activate_promocode():
     """Активировать промокод через miniapp"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        return response
-    
     try:
         # Парсим initData
-        data = {}
-        if request.is_json:
-            data = request.json or {}
-        elif request.form:
-            data = dict(request.form)
-        elif request.data:
-            try:
-                data = json.loads(request.data.decode('utf-8'))
-            except:
-                pass
+        data = get_request_data()
         
-        init_data = data.get('initData') or request.headers.get('X-Telegram-Init-Data') or request.headers.get('X-Init-Data') or request.args.get('initData')
+        telegram_id, has_init_data = get_request_telegram_id(data)
         
-        if not init_data:
-            init_data_unsafe = data.get('initDataUnsafe', {})
-            if isinstance(init_data_unsafe, dict) and init_data_unsafe.get('user'):
-                user_data = init_data_unsafe['user']
-                telegram_id = user_data.get('id')
-            else:
-                response = jsonify({
-                    "detail": {
-                        "title": "Authorization Error",
-                        "message": "Missing initData. Please open the mini app from Telegram."
-                    }
-                })
-                response.headers.add('Access-Control-Allow-Origin', '*')
-                return response, 401
-        else:
-            telegram_id, _ = parse_telegram_init_data(init_data)
+        if not has_init_data:
+            response = jsonify({
+                "detail": {
+                    "title": "Authorization Error",
+                    "message": "Missing initData. Please open the mini app from Telegram."
+                }
+            })
+            return response, 401
         
         if not telegram_id:
             response = jsonify({
@@ -783,7 +862,6 @@ def miniapp_activate_promocode():
                     "message": "Telegram ID not found in initData."
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 401
         
         # Находим пользователя
@@ -795,7 +873,6 @@ def miniapp_activate_promocode():
                     "message": "User not registered. Please register in the bot first."
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 404
         
         # Получаем промокод
@@ -807,7 +884,6 @@ def miniapp_activate_promocode():
                     "message": "promo_code is required"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 400
         
         # Активируем промокод
@@ -819,7 +895,6 @@ def miniapp_activate_promocode():
                     "message": "Неверный промокод"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 400
         
         if promo.uses_left <= 0:
@@ -829,26 +904,33 @@ def miniapp_activate_promocode():
                     "message": "Промокод больше не действителен"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 400
         
         # Применяем промокод (упрощенная версия - только для DAYS)
         if promo.promo_type == 'DAYS':
-            API_URL = os.getenv('API_URL')
-            headers, cookies = get_remnawave_headers()
-            
+            if not user.remnawave_uuid:
+                response = jsonify({
+                    "detail": {
+                        "title": "Invalid Request",
+                        "message": "User is not linked to RemnaWave"
+                    }
+                })
+                return response, 400
             try:
-                live = requests.get(f"{API_URL}/api/users/{user.remnawave_uuid}", headers=headers, cookies=cookies, timeout=10).json().get('response', {})
-                curr_exp_str = live.get('expireAt')
-                if curr_exp_str:
-                    try:
-                        curr_exp = datetime.fromisoformat(curr_exp_str.replace('Z', '+00:00'))
-                    except:
-                        curr_exp = datetime.now(timezone.utc)
-                else:
-                    curr_exp = datetime.now(timezone.utc)
+                # Данные пользователя в RemnaWave запрашиваются только для действующего
+                # DAYS-промокода: неверный код не должен приводить к запросу в RemnaWave
+                API_URL = os.getenv('API_URL')
+                headers, cookies = get_remnawave_headers()
+                live = get_cached_live_data(user.remnawave_uuid)
+                if not live:
+                    live = get_live_user(user.remnawave_uuid, headers, cookies)
+                if live is None:
+                    raise RuntimeError("Failed to fetch user data from RemnaWave")
+                # Текущее время берётся один раз; пустой или некорректный expireAt считается истёкшим
+                now = datetime.now(timezone.utc)
+                curr_exp = parse_iso_datetime(live.get('expireAt')) or now
                 
-                new_exp = max(datetime.now(timezone.utc), curr_exp) + timedelta(days=promo.value)
+                new_exp = max(now, curr_exp) + timedelta(days=promo.value)
                 
                 # Проверяем наличие сквада у пользователя
                 user_squads = live.get('activeInternalSquads', [])
@@ -865,7 +947,7 @@ def miniapp_activate_promocode():
                     patch_payload["activeInternalSquads"] = [promo.squad_id]
                 # Если у пользователя уже есть сквад - просто добавляем дни (не меняем сквад)
                 
-                patch_resp = requests.patch(
+                patch_resp = remnawave_session.patch(
                     f"{API_URL}/api/users",
                     headers={"Content-Type": "application/json", **headers},
                     json=patch_payload,
@@ -879,32 +961,27 @@ def miniapp_activate_promocode():
                             "message": "Failed to activate promo code"
                         }
                     })
-                    response.headers.add('Access-Control-Allow-Origin', '*')
                     return response, 500
                 
                 # Списываем использование промокода
                 promo.uses_left -= 1
                 db.session.commit()
                 
-                cache.delete(f'live_data_{user.remnawave_uuid}')
-                cache.delete('all_live_users_map')
+                invalidate_user_cache(user.remnawave_uuid)
                 
                 response = jsonify({
                     "message": "Промокод активирован",
                     "days_added": promo.value
                 })
-                response.headers.add('Access-Control-Allow-Origin', '*')
                 return response, 200
             except Exception as e:
-                import traceback
-                traceback.print_exc()
+                app.logger.exception("Error in miniapp_activate_promocode")
                 response = jsonify({
                     "detail": {
                         "title": "Internal Server Error",
                         "message": str(e)
                     }
                 })
-                response.headers.add('Access-Control-Allow-Origin', '*')
                 return response, 500
         else:
             response = jsonify({
@@ -913,19 +990,16 @@ def miniapp_activate_promocode():
                     "message": "Неподдерживаемый тип промокода"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 400
             
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_activate_promocode")
         response = jsonify({
             "detail": {
                 "title": "Internal Server Error",
                 "message": str(e)
             }
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
 
@@ -934,18 +1008,12 @@ def miniapp_activate_promocode():
 # ============================================================================
 
 @app.route('/miniapp/nodes', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_nodes():
     """Получить список серверов для miniapp"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        return response
-    
     try:
-        data = request.json or {}
+        data = get_request_data()
         init_data = data.get('initData') or data.get('init_data') or data.get('data') or ''
         
         if not init_data:
@@ -955,7 +1023,6 @@ def miniapp_nodes():
                     "message": "Missing initData"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 401
         
         telegram_id, _ = parse_telegram_init_data(init_data)
@@ -967,7 +1034,6 @@ def miniapp_nodes():
                     "message": "Invalid initData format"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 401
         
         # Находим пользователя
@@ -979,18 +1045,16 @@ def miniapp_nodes():
                     "message": "User not registered"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 404
         
         # Получаем серверы
         API_URL = os.getenv('API_URL')
         headers, cookies = get_remnawave_headers()
-        resp = requests.get(f"{API_URL}/api/users/{user.remnawave_uuid}/accessible-nodes", headers=headers, cookies=cookies, timeout=10)
+        resp = remnawave_session.get(f"{API_URL}/api/users/{user.remnawave_uuid}/accessible-nodes", headers=headers, cookies=cookies, timeout=10)
         
         if resp.status_code == 200:
             nodes_data = resp.json()
             response = jsonify(nodes_data)
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 200
         else:
             response = jsonify({
@@ -999,19 +1063,16 @@ def miniapp_nodes():
                     "message": "Failed to fetch nodes"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 500
             
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_nodes")
         response = jsonify({
             "detail": {
                 "title": "Error",
                 "message": str(e)
             }
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
 
@@ -1020,45 +1081,31 @@ def miniapp_nodes():
 # ============================================================================
 
 @app.route('/miniapp/tariffs', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_tariffs():
     """Получить список тарифов для miniapp"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        return response
-    
     try:
-        tariffs = Tariff.query.all()
-        tariffs_list = []
-        for t in tariffs:
-            tariff_data = {
-                "id": t.id, 
-                "name": t.name, 
-                "duration_days": t.duration_days, 
-                "price_uah": t.price_uah, 
-                "price_rub": t.price_rub, 
-                "price_usd": t.price_usd,
-                "squad_id": t.squad_id,  # Для обратной совместимости
-                "squad_ids": t.get_squad_ids() if hasattr(t, 'get_squad_ids') else (t.squad_ids if hasattr(t, 'squad_ids') else None),
-                "traffic_limit_bytes": t.traffic_limit_bytes or 0,
-                "tier": t.tier,
-                "badge": t.badge
-            }
-            tariffs_list.append(tariff_data)
+        # Тарифы из кэша: без SELECT и создания ORM-объектов на каждый запрос
+        tariffs_list = [{
+            "id": t['id'],
+            "name": t['name'],
+            "duration_days": t['duration_days'],
+            "price_uah": t['price_uah'],
+            "price_rub": t['price_rub'],
+            "price_usd": t['price_usd'],
+            "squad_id": t['squad_id'],  # Для обратной совместимости
+            "squad_ids": t['squad_ids'],
+            "traffic_limit_bytes": t['traffic_limit_bytes'] or 0,
+            "tier": t['tier'],
+            "badge": t['badge']
+        } for t in get_tariffs_list()]
         
         response = jsonify({"tariffs": tariffs_list})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
         return response, 200
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_tariffs")
         response = jsonify({"tariffs": []})
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 200
 
 
@@ -1067,47 +1114,24 @@ def miniapp_tariffs():
 # ============================================================================
 
 @app.route('/miniapp/subscription/renewal/options', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_subscription_renewal_options():
     """Получить опции продления подписки для miniapp"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        return response
-    
     try:
         # Парсим initData для получения пользователя
-        data = {}
-        if request.is_json:
-            data = request.json or {}
-        elif request.form:
-            data = dict(request.form)
-        elif request.data:
-            try:
-                data = json.loads(request.data.decode('utf-8'))
-            except:
-                pass
+        data = get_request_data()
         
-        init_data = data.get('initData') or request.headers.get('X-Telegram-Init-Data') or request.headers.get('X-Init-Data') or request.args.get('initData')
+        telegram_id, has_init_data = get_request_telegram_id(data)
         
-        if not init_data:
-            init_data_unsafe = data.get('initDataUnsafe', {})
-            if isinstance(init_data_unsafe, dict) and init_data_unsafe.get('user'):
-                user_data = init_data_unsafe['user']
-                telegram_id = user_data.get('id')
-            else:
-                response = jsonify({
-                    "detail": {
-                        "title": "Authorization Error",
-                        "message": "Missing initData. Please open the mini app from Telegram."
-                    }
-                })
-                response.headers.add('Access-Control-Allow-Origin', '*')
-                return response, 401
-        else:
-            telegram_id, _ = parse_telegram_init_data(init_data)
+        if not has_init_data:
+            response = jsonify({
+                "detail": {
+                    "title": "Authorization Error",
+                    "message": "Missing initData. Please open the mini app from Telegram."
+                }
+            })
+            return response, 401
         
         if not telegram_id:
             response = jsonify({
@@ -1116,42 +1140,35 @@ def miniapp_subscription_renewal_options():
                     "message": "Telegram ID not found in initData."
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 401
         
-        user = User.query.filter_by(telegram_id=str(telegram_id)).first()
-        if not user:
+        # Нужна только проверка регистрации, тарифы берутся из кэша: один лёгкий SELECT за запрос
+        user_id = db.session.scalar(select(User.id).where(User.telegram_id == str(telegram_id)))
+        if not user_id:
             response = jsonify({
                 "detail": {
                     "title": "User Not Found",
                     "message": "User not registered"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 404
         
         # Получаем тарифы
-        tariffs = Tariff.query.all()
         options = [{
-            "id": t.id,
-            "name": t.name,
-            "duration_days": t.duration_days,
-            "price_uah": t.price_uah,
-            "price_rub": t.price_rub,
-            "price_usd": t.price_usd
-        } for t in tariffs]
+            "id": t['id'],
+            "name": t['name'],
+            "duration_days": t['duration_days'],
+            "price_uah": t['price_uah'],
+            "price_rub": t['price_rub'],
+            "price_usd": t['price_usd']
+        } for t in get_tariffs_list()]
         
         response = jsonify({"options": options})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
         return response, 200
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_subscription_renewal_options")
         response = jsonify({"options": []})
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 200
 
 
@@ -1160,47 +1177,24 @@ def miniapp_subscription_renewal_options():
 # ============================================================================
 
 @app.route('/miniapp/subscription/settings', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_subscription_settings():
     """Получить настройки подписки для miniapp"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        return response
-    
     try:
         # Парсим initData
-        data = {}
-        if request.is_json:
-            data = request.json or {}
-        elif request.form:
-            data = dict(request.form)
-        elif request.data:
-            try:
-                data = json.loads(request.data.decode('utf-8'))
-            except:
-                pass
+        data = get_request_data()
         
-        init_data = data.get('initData') or request.headers.get('X-Telegram-Init-Data') or request.headers.get('X-Init-Data') or request.args.get('initData')
+        telegram_id, has_init_data = get_request_telegram_id(data)
         
-        if not init_data:
-            init_data_unsafe = data.get('initDataUnsafe', {})
-            if isinstance(init_data_unsafe, dict) and init_data_unsafe.get('user'):
-                user_data = init_data_unsafe['user']
-                telegram_id = user_data.get('id')
-            else:
-                response = jsonify({
-                    "detail": {
-                        "title": "Authorization Error",
-                        "message": "Missing initData. Please open the mini app from Telegram."
-                    }
-                })
-                response.headers.add('Access-Control-Allow-Origin', '*')
-                return response, 401
-        else:
-            telegram_id, _ = parse_telegram_init_data(init_data)
+        if not has_init_data:
+            response = jsonify({
+                "detail": {
+                    "title": "Authorization Error",
+                    "message": "Missing initData. Please open the mini app from Telegram."
+                }
+            })
+            return response, 401
         
         if not telegram_id:
             response = jsonify({
@@ -1209,7 +1203,6 @@ def miniapp_subscription_settings():
                     "message": "Telegram ID not found in initData."
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 401
         
         user = User.query.filter_by(telegram_id=str(telegram_id)).first()
@@ -1220,7 +1213,6 @@ def miniapp_subscription_settings():
                     "message": "User not registered"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 404
         
         # Возвращаем настройки подписки (упрощенная версия)
@@ -1228,21 +1220,16 @@ def miniapp_subscription_settings():
             "auto_renewal": False,
             "notifications": True
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
         return response, 200
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_subscription_settings")
         response = jsonify({
             "detail": {
                 "title": "Error",
                 "message": str(e)
             }
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
 
@@ -1251,28 +1238,13 @@ def miniapp_subscription_settings():
 # ============================================================================
 
 @app.route('/miniapp/promo-offers/<offer_id>/claim', methods=['POST', 'OPTIONS'])
-@limiter.limit("10 per minute")
+@limiter.exempt
+@local_limit("10 per minute")
 def miniapp_claim_promo_offer(offer_id):
     """Активировать промо-оффер через miniapp (алиас для промокода)"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        return response
-    
     try:
         # Используем offer_id как код промокода
-        data = {}
-        if request.is_json:
-            data = request.json or {}
-        elif request.form:
-            data = dict(request.form)
-        elif request.data:
-            try:
-                data = json.loads(request.data.decode('utf-8'))
-            except:
-                pass
+        data = get_request_data()
         
         # Используем offer_id как код промокода
         data['promo_code'] = offer_id
@@ -1281,15 +1253,13 @@ def miniapp_claim_promo_offer(offer_id):
         return miniapp_activate_promocode()
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_claim_promo_offer")
         response = jsonify({
             "detail": {
                 "title": "Internal Server Error",
                 "message": "An error occurred while processing the request."
             }
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
 
@@ -1298,7 +1268,8 @@ def miniapp_claim_promo_offer(offer_id):
 # ============================================================================
 
 @app.route('/miniapp/configs', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_configs():
     """
     Получить список конфигов пользователя.
@@ -1306,15 +1277,8 @@ def miniapp_configs():
     Конфиги создаются автоматически при покупке тарифа через /miniapp/payments/create.
     После успешной оплаты тарифа конфиг становится доступен через subscription URL.
     """
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        response.headers.add('Access-Control-Allow-Headers', 'Content-Type')
-        response.headers.add('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        return response
-    
     try:
-        data = request.json or {}
+        data = get_request_data()
         init_data = data.get('initData') or data.get('init_data') or ''
         telegram_id, _ = parse_telegram_init_data(init_data)
         
@@ -1322,7 +1286,6 @@ def miniapp_configs():
             response = jsonify({
                 "detail": {"title": "Authorization Error", "message": "Missing initData"}
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 401
         
         user = User.query.filter_by(telegram_id=str(telegram_id)).first()
@@ -1330,7 +1293,6 @@ def miniapp_configs():
             response = jsonify({
                 "detail": {"title": "User Not Found", "message": "User not registered"}
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 404
         
         # Проверяем, что remnawave_uuid валидный (должен быть UUID, а не email)
@@ -1338,7 +1300,6 @@ def miniapp_configs():
             response = jsonify({
                 "detail": {"title": "Error", "message": "User UUID not set. Please register in the bot first."}
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 500
         
         # Проверяем формат UUID (должен содержать дефисы, а не быть email)
@@ -1347,28 +1308,14 @@ def miniapp_configs():
             response = jsonify({
                 "detail": {"title": "Error", "message": "Invalid user UUID. Please contact support or re-register."}
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 500
         
         # Получаем данные подписки (subscription URL содержит конфиги)
-        cache_key = f'live_data_{user.remnawave_uuid}'
-        cached = cache.get(cache_key)
-        
-        if not cached:
-            API_URL = os.getenv('API_URL')
-            headers, cookies = get_remnawave_headers()
-            try:
-                resp = requests.get(
-                    f"{API_URL}/api/users/{user.remnawave_uuid}",
-                    headers=headers,
-                    cookies=cookies,
-                    timeout=10
-                )
-                if resp.status_code == 200:
-                    cached = resp.json().get('response', {})
-                    cache.set(cache_key, cached, timeout=300)
-            except:
-                pass
+        headers, cookies = get_remnawave_headers()
+        try:
+            cached = get_live_user(user.remnawave_uuid, headers, cookies)
+        except Exception:
+            cached = None
         
         subscription_url = cached.get('subscriptionUrl') if cached else None
         expire_at = cached.get('expireAt') if cached else None
@@ -1446,16 +1393,13 @@ def miniapp_configs():
             })
         
         response = jsonify({"configs": configs})
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 200
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_configs")
         response = jsonify({
             "detail": {"title": "Error", "message": str(e)}
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
 
@@ -1469,16 +1413,12 @@ def miniapp_configs():
 # ============================================================================
 
 @app.route('/miniapp/referrals/info', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_referrals_info():
     """Получить информацию о реферальной программе"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response
-    
     try:
-        data = request.json or {}
+        data = get_request_data()
         init_data = data.get('initData') or data.get('init_data') or ''
         telegram_id, _ = parse_telegram_init_data(init_data)
         
@@ -1486,7 +1426,6 @@ def miniapp_referrals_info():
             response = jsonify({
                 "detail": {"title": "Authorization Error", "message": "Missing initData"}
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 401
         
         user = User.query.filter_by(telegram_id=str(telegram_id)).first()
@@ -1494,7 +1433,6 @@ def miniapp_referrals_info():
             response = jsonify({
                 "detail": {"title": "User Not Found", "message": "User not registered"}
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 404
         
         # Генерируем реферальную ссылку
@@ -1558,30 +1496,23 @@ def miniapp_referrals_info():
         }
         
         response = jsonify(response_data)
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 200
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_referrals_info")
         response = jsonify({
             "detail": {"title": "Error", "message": str(e)}
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
 
 @app.route('/miniapp/referrals/stats', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_referrals_stats():
     """Получить статистику рефералов пользователя"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response
-    
     try:
-        data = request.json or {}
+        data = get_request_data()
         init_data = data.get('initData') or data.get('init_data') or ''
         telegram_id, _ = parse_telegram_init_data(init_data)
         
@@ -1589,7 +1520,6 @@ def miniapp_referrals_stats():
             response = jsonify({
                 "detail": {"title": "Authorization Error", "message": "Missing initData"}
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 401
         
         user = User.query.filter_by(telegram_id=str(telegram_id)).first()
@@ -1597,7 +1527,6 @@ def miniapp_referrals_stats():
             response = jsonify({
                 "detail": {"title": "User Not Found", "message": "User not registered"}
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 404
         
         # Подсчитываем рефералов
@@ -1614,16 +1543,13 @@ def miniapp_referrals_stats():
         }
         
         response = jsonify(response_data)
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 200
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_referrals_stats")
         response = jsonify({
             "detail": {"title": "Error", "message": str(e)}
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
 
@@ -1632,16 +1558,12 @@ def miniapp_referrals_stats():
 # ============================================================================
 
 @app.route('/miniapp/profile', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_profile():
     """Получить данные профиля пользователя для отображения"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response
-    
     try:
-        data = request.json or {}
+        data = get_request_data()
         init_data = data.get('initData') or data.get('init_data') or ''
         telegram_id, user_data_parsed = parse_telegram_init_data(init_data)
         
@@ -1649,7 +1571,6 @@ def miniapp_profile():
             response = jsonify({
                 "detail": {"title": "Authorization Error", "message": "Missing initData"}
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 401
         
         user = User.query.filter_by(telegram_id=str(telegram_id)).first()
@@ -1657,28 +1578,14 @@ def miniapp_profile():
             response = jsonify({
                 "detail": {"title": "User Not Found", "message": "User not registered"}
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 404
         
         # Получаем данные подписки
-        cache_key = f'live_data_{user.remnawave_uuid}'
-        cached = cache.get(cache_key)
-        
-        if not cached:
-            API_URL = os.getenv('API_URL')
-            headers, cookies = get_remnawave_headers()
-            try:
-                resp = requests.get(
-                    f"{API_URL}/api/users/{user.remnawave_uuid}",
-                    headers=headers,
-                    cookies=cookies,
-                    timeout=10
-                )
-                if resp.status_code == 200:
-                    cached = resp.json().get('response', {})
-                    cache.set(cache_key, cached, timeout=300)
-            except:
-                cached = {}
+        headers, cookies = get_remnawave_headers()
+        try:
+            cached = get_live_user(user.remnawave_uuid, headers, cookies)
+        except Exception:
+            cached = {}
         
         expire_at = cached.get('expireAt') if cached else None
         has_active = False
@@ -1690,7 +1597,6 @@ def miniapp_profile():
                 pass
         
         # Конвертируем баланс из USD в выбранную валюту пользователя
-        from modules.currency import convert_from_usd
         balance_usd = float(user.balance) if user.balance else 0.0
         balance_display = convert_from_usd(balance_usd, user.preferred_currency or 'uah')
         
@@ -1710,30 +1616,23 @@ def miniapp_profile():
         }
         
         response = jsonify(profile_data)
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 200
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_profile")
         response = jsonify({
             "detail": {"title": "Error", "message": str(e)}
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
 
 @app.route('/miniapp/settings', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_settings():
     """Обновить настройки пользователя (валюта, язык)"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response
-    
     try:
-        data = request.json or {}
+        data = get_request_data()
         init_data = data.get('initData') or data.get('init_data') or ''
         telegram_id, _ = parse_telegram_init_data(init_data)
         
@@ -1741,7 +1640,6 @@ def miniapp_settings():
             response = jsonify({
                 "detail": {"title": "Authorization Error", "message": "Missing initData"}
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 401
         
         user = User.query.filter_by(telegram_id=str(telegram_id)).first()
@@ -1749,7 +1647,6 @@ def miniapp_settings():
             response = jsonify({
                 "detail": {"title": "User Not Found", "message": "User not registered"}
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 404
         
         # Установка пароля (для пользователей из бота)
@@ -1759,10 +1656,8 @@ def miniapp_settings():
                 response = jsonify({
                     "detail": {"title": "Validation Error", "message": "Password must be at least 6 characters"}
                 })
-                response.headers.add('Access-Control-Allow-Origin', '*')
                 return response, 400
             
-            from modules.core import bcrypt, get_fernet
             user.password_hash = bcrypt.generate_password_hash(new_password).decode('utf-8')
             # Сохраняем зашифрованный пароль для бота
             fernet = get_fernet()
@@ -1776,7 +1671,6 @@ def miniapp_settings():
             response = jsonify({
                 "message": "Password set successfully"
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 200
 
         # Обновляем валюту
@@ -1784,8 +1678,6 @@ def miniapp_settings():
         if 'preferred_currency' in data:
             currency = data['preferred_currency']
             # Проверяем, что валюта активна
-            from modules.models.system import SystemSetting
-            import json
             settings = SystemSetting.query.first()
             active_currencies = ['uah', 'rub', 'usd']
             if settings and hasattr(settings, 'active_currencies') and settings.active_currencies:
@@ -1801,15 +1693,12 @@ def miniapp_settings():
                 db.session.commit()
                 # Очищаем кэш при изменении валюты, чтобы баланс пересчитался
                 if currency_changed:
-                    cache.delete(f'live_data_{user.remnawave_uuid}')
-                    cache.delete('all_live_users_map')
+                    invalidate_user_cache(user.remnawave_uuid)
         
         # Обновляем язык
         if 'preferred_lang' in data:
             lang = data['preferred_lang']
             # Проверяем, что язык активен
-            from modules.models.system import SystemSetting
-            import json
             settings = SystemSetting.query.first()
             active_languages = ['ru', 'ua', 'en', 'cn']
             if settings and hasattr(settings, 'active_languages') and settings.active_languages:
@@ -1823,16 +1712,13 @@ def miniapp_settings():
                 db.session.commit()
         
         response = jsonify({"success": True, "message": "Settings updated"})
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 200
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_settings")
         response = jsonify({
             "detail": {"title": "Error", "message": str(e)}
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
 
@@ -1841,16 +1727,12 @@ def miniapp_settings():
 # ============================================================================
 
 @app.route('/miniapp/options', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_options():
     """Получить список платных опций"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response
-    
     try:
-        data = request.json or {}
+        data = get_request_data()
         init_data = data.get('initData') or data.get('init_data') or ''
         telegram_id, _ = parse_telegram_init_data(init_data)
         
@@ -1875,14 +1757,11 @@ def miniapp_options():
                 pass
         
         response = jsonify({"options": options})
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 200
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_options")
         response = jsonify({"options": []})
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 200
 
 
@@ -1891,16 +1770,12 @@ def miniapp_options():
 # ============================================================================
 
 @app.route('/miniapp/support/tickets', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_support_tickets():
     """Получить список тикетов или создать новый тикет"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response
-    
     try:
-        data = request.json or {}
+        data = get_request_data()
         init_data = data.get('initData') or data.get('init_data') or ''
         telegram_id, _ = parse_telegram_init_data(init_data)
         
@@ -1911,7 +1786,6 @@ def miniapp_support_tickets():
                     "message": "Invalid or missing Telegram initData"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 401
         
         # Получаем пользователя (преобразуем telegram_id в строку, т.к. в БД это VARCHAR)
@@ -1923,10 +1797,8 @@ def miniapp_support_tickets():
                     "message": "User not registered. Please register first."
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 404
         
-        from modules.models.ticket import Ticket, TicketMessage
         
         # GET - список тикетов
         if not data.get('subject') and not data.get('message'):
@@ -1939,7 +1811,6 @@ def miniapp_support_tickets():
             } for t in tickets]
             
             response = jsonify({"tickets": result})
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 200
         
         # POST - создание тикета
@@ -1953,7 +1824,6 @@ def miniapp_support_tickets():
                     "message": "Subject is required"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 400
         
         ticket = Ticket(
@@ -1978,7 +1848,6 @@ def miniapp_support_tickets():
         
         # Отправляем уведомление админам в группу
         try:
-            from modules.notifications import notify_support_ticket
             notify_support_ticket(ticket, user, message, is_new_ticket=True)
         except Exception as e:
             print(f"Error sending support ticket notification: {e}")
@@ -1987,35 +1856,27 @@ def miniapp_support_tickets():
             "message": "Ticket created successfully",
             "ticket_id": ticket.id
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 201
         
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f"Error in miniapp_support_tickets: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_support_tickets")
         response = jsonify({
             "detail": {
                 "title": "Internal Error",
                 "message": str(e)
             }
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
 
 @app.route('/miniapp/support/tickets/<int:ticket_id>', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_support_ticket_detail(ticket_id):
     """Получить детали тикета"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response
-    
     try:
-        data = request.json or {}
+        data = get_request_data()
         init_data = data.get('initData') or data.get('init_data') or ''
         telegram_id, _ = parse_telegram_init_data(init_data)
         
@@ -2026,7 +1887,6 @@ def miniapp_support_ticket_detail(ticket_id):
                     "message": "Invalid or missing Telegram initData"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 401
         
         # Получаем пользователя (преобразуем telegram_id в строку, т.к. в БД это VARCHAR)
@@ -2038,10 +1898,8 @@ def miniapp_support_ticket_detail(ticket_id):
                     "message": "User not registered. Please register first."
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 404
         
-        from modules.models.ticket import Ticket, TicketMessage
         
         # Получаем тикет
         ticket = Ticket.query.filter_by(id=ticket_id, user_id=user.id).first()
@@ -2052,7 +1910,6 @@ def miniapp_support_ticket_detail(ticket_id):
                     "message": "Ticket not found or access denied"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 404
         
         # Получаем сообщения
@@ -2072,34 +1929,26 @@ def miniapp_support_ticket_detail(ticket_id):
         }
         
         response = jsonify({"ticket": result})
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 200
         
     except Exception as e:
-        app.logger.error(f"Error in miniapp_support_ticket_detail: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_support_ticket_detail")
         response = jsonify({
             "detail": {
                 "title": "Internal Error",
                 "message": str(e)
             }
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
 
 @app.route('/miniapp/support/tickets/<int:ticket_id>/reply', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_support_ticket_reply(ticket_id):
     """Ответить на тикет"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response
-    
     try:
-        data = request.json or {}
+        data = get_request_data()
         init_data = data.get('initData') or data.get('init_data') or ''
         telegram_id, _ = parse_telegram_init_data(init_data)
         
@@ -2110,7 +1959,6 @@ def miniapp_support_ticket_reply(ticket_id):
                     "message": "Invalid or missing Telegram initData"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 401
         
         # Получаем пользователя (преобразуем telegram_id в строку, т.к. в БД это VARCHAR)
@@ -2122,10 +1970,8 @@ def miniapp_support_ticket_reply(ticket_id):
                     "message": "User not registered. Please register first."
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 404
         
-        from modules.models.ticket import Ticket, TicketMessage
         
         # Проверяем, что тикет принадлежит пользователю
         ticket = Ticket.query.filter_by(id=ticket_id, user_id=user.id).first()
@@ -2136,7 +1982,6 @@ def miniapp_support_ticket_reply(ticket_id):
                     "message": "Ticket not found or access denied"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 404
         
         message_text = data.get('message', '').strip()
@@ -2147,7 +1992,6 @@ def miniapp_support_ticket_reply(ticket_id):
                     "message": "Message is required"
                 }
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 400
         
         # Создаем сообщение
@@ -2163,20 +2007,15 @@ def miniapp_support_ticket_reply(ticket_id):
         
         # Отправляем уведомление админам в группу
         try:
-            from modules.notifications import notify_support_ticket
             notify_support_ticket(ticket, user, message_text, is_new_ticket=False)
         except Exception as e:
             print(f"Error sending support ticket notification: {e}")
         
         # Отправляем уведомление админам в оба бота (если ответил пользователь)
         # Получаем всех админов с telegram_id
-        from modules.models.user import User
         admins = User.query.filter_by(role='ADMIN').filter(User.telegram_id != None).all()
         
         if admins:
-            # Импортируем функцию отправки сообщений
-            from modules.api.admin.routes import send_telegram_message
-            
             # Получаем токены ботов
             old_bot_token = os.getenv("CLIENT_BOT_TOKEN")
             new_bot_token = os.getenv("CLIENT_BOT_V2_TOKEN") or os.getenv("CLIENT_BOT_TOKEN")
@@ -2191,8 +2030,6 @@ def miniapp_support_ticket_reply(ticket_id):
             )
             
             # Отправляем всем админам в оба бота
-            import threading
-            
             def send_notification(bot_token, telegram_id, text):
                 if bot_token:
                     try:
@@ -2217,21 +2054,17 @@ def miniapp_support_ticket_reply(ticket_id):
             "message": "Reply sent successfully",
             "message_id": ticket_message.id
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 201
         
     except Exception as e:
         db.session.rollback()
-        app.logger.error(f"Error in miniapp_support_ticket_reply: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_support_ticket_reply")
         response = jsonify({
             "detail": {
                 "title": "Internal Error",
                 "message": str(e)
             }
         })
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 500
 
 
@@ -2240,16 +2073,12 @@ def miniapp_support_ticket_reply(ticket_id):
 # ============================================================================
 
 @app.route('/miniapp/payments/history', methods=['POST', 'OPTIONS'])
-@limiter.limit("30 per minute")
+@limiter.exempt
+@local_limit("30 per minute")
 def miniapp_payments_history():
     """Получить историю платежей пользователя"""
-    if request.method == 'OPTIONS':
-        response = jsonify({})
-        response.headers.add('Access-Control-Allow-Origin', '*')
-        return response
-    
     try:
-        data = request.json or {}
+        data = get_request_data()
         init_data = data.get('initData') or data.get('init_data') or ''
         telegram_id, _ = parse_telegram_init_data(init_data)
         
@@ -2257,7 +2086,6 @@ def miniapp_payments_history():
             response = jsonify({
                 "detail": {"title": "Authorization Error", "message": "Missing initData"}
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 401
         
         user = User.query.filter_by(telegram_id=str(telegram_id)).first()
@@ -2265,7 +2093,6 @@ def miniapp_payments_history():
             response = jsonify({
                 "detail": {"title": "User Not Found", "message": "User not registered"}
             })
-            response.headers.add('Access-Control-Allow-Origin', '*')
             return response, 404
         
         # Получаем платежи пользователя
@@ -2317,12 +2144,9 @@ def miniapp_payments_history():
             })
         
         response = jsonify({"payments": payments_list})
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 200
         
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in miniapp_payments_history")
         response = jsonify({"payments": []})
-        response.headers.add('Access-Control-Allow-Origin', '*')
         return response, 200
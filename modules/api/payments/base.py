@@ -1,19 +1,109 @@
 """
 Базовые функции для платёжных систем
 """
+import base64
 import os
-from modules.core import get_fernet
+import threading
+import time
+from collections import namedtuple
+from functools import lru_cache
+from sqlalchemy import Text, event
+from modules.core import get_fernet, create_http_session
 from modules.models.payment import PaymentSetting
 from modules.models.bot_config import BotConfig
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 fernet = get_fernet()
 
+# Общая сессия для запросов к API платёжных систем: TCP/TLS-соединения переиспользуются.
+# POST-запросы создания платежа сессия не повторяет
+payment_session = create_http_session()
+
+
+def post_json(url, payload, headers=None, timeout=(5, 25)):
+    """POST с JSON-телом через payment_session (тело сериализуется orjson сразу в bytes)"""
+    if orjson is not None:
+        try:
+            body = orjson.dumps(payload)
+        except orjson.JSONEncodeError:
+            body = None
+        if body is not None:
+            headers = {**headers, "Content-Type": "application/json"} if headers else {"Content-Type": "application/json"}
+            return payment_session.post(url, data=body, headers=headers, timeout=timeout)
+    return payment_session.post(url, json=payload, headers=headers, timeout=timeout)
+
+
+# Расшифрованные ключи хранятся только в памяти процесса (секреты не кладём в общий кэш).
+# Изменение настроек сбрасывает кэш сразу в этом процессе, в остальных - по истечении TTL
+PAYMENT_SETTINGS_TTL = 60
+_decrypted_settings = {'expires': 0.0, 'value': None}
+_decrypted_settings_lock = threading.Lock()
+
+# Один объект настроек разделяют все запросы процесса, поэтому он неизменяемый
+DecryptedPaymentSettings = namedtuple(
+    'DecryptedPaymentSettings',
+    [c.key for c in PaymentSetting.__table__.columns]
+    + ['yookassa_basic_auth', 'mulenpay_basic_auth', 'urlpay_basic_auth']
+)
+
 
 def get_payment_settings():
     """Получить настройки платёжных систем"""
     return PaymentSetting.query.first()
 
 
+def get_decrypted_payment_settings():
+    """
+    Настройки платёжных систем с уже расшифрованными ключами (None, если настроек нет)
+
+    Текстовые поля расшифровываются один раз на TTL, а не при каждом запросе.
+    Возвращается неизменяемый DecryptedPaymentSettings, общий для всех запросов.
+    """
+    if time.monotonic() < _decrypted_settings['expires']:
+        return _decrypted_settings['value']
+
+    with _decrypted_settings_lock:
+        if time.monotonic() < _decrypted_settings['expires']:
+            return _decrypted_settings['value']
+
+        s = PaymentSetting.query.first()
+        value = None
+        if s:
+            fields = {
+                c.key: decrypt_key(getattr(s, c.key)) if isinstance(c.type, Text) else getattr(s, c.key)
+                for c in PaymentSetting.__table__.columns
+            }
+            # Заголовки Basic-авторизации считаются вместе с расшифровкой, а не при каждом платеже
+            value = DecryptedPaymentSettings(
+                **fields,
+                yookassa_basic_auth=basic_auth_header(fields['yookassa_shop_id'], fields['yookassa_secret_key']),
+                mulenpay_basic_auth=basic_auth_header(fields['mulenpay_api_key'], fields['mulenpay_secret_key']),
+                urlpay_basic_auth=basic_auth_header(fields['urlpay_api_key'], fields['urlpay_secret_key'])
+            )
+        _decrypted_settings['value'] = value
+        _decrypted_settings['expires'] = time.monotonic() + PAYMENT_SETTINGS_TTL
+    return value
+
+
+def basic_auth_header(login, password):
+    """Значение заголовка Authorization: Basic (пустая строка, если нет логина или пароля)"""
+    if not login or not password:
+        return ""
+    return "Basic " + base64.b64encode(f"{login}:{password}".encode('utf-8')).decode('ascii')
+
+
+@event.listens_for(PaymentSetting, 'after_insert')
+@event.listens_for(PaymentSetting, 'after_update')
+@event.listens_for(PaymentSetting, 'after_delete')
+def invalidate_decrypted_payment_settings(mapper, connection, target):
+    """Сбросить расшифрованные настройки при их изменении"""
+    _decrypted_settings['expires'] = 0.0
+
+
 def decrypt_key(encrypted_key):
     """Расшифровать ключ API"""
     if not encrypted_key:
@@ -50,12 +140,23 @@ def decrypt_key(encrypted_key):
         return ""
 
 
+def get_server_base_url() -> str:
+    """Адрес сервера из YOUR_SERVER_IP / YOUR_SERVER_IP_OR_DOMAIN с протоколом (пустая строка, если не задан)"""
+    base_url = os.getenv('YOUR_SERVER_IP') or os.getenv('YOUR_SERVER_IP_OR_DOMAIN', '')
+    if base_url and not base_url.startswith(('http://', 'https://')):
+        base_url = f"https://{base_url}"
+    return base_url
+
+
+# Окружение не меняется во время работы: адрес сервера и URL возврата на сайт считаются при импорте
+SERVER_BASE_URL = get_server_base_url()
+WEBSITE_RETURN_URL = f"{SERVER_BASE_URL}/dashboard/subscription"
+
+
+@lru_cache(maxsize=None)
 def get_callback_url(provider: str) -> str:
     """Получить URL для webhook"""
-    base_url = os.getenv('YOUR_SERVER_IP') or os.getenv('YOUR_SERVER_IP_OR_DOMAIN', '')
-    if not base_url.startswith(('http://', 'https://')):
-        base_url = f"https://{base_url}" if base_url else ""
-    return f"{base_url}/api/webhook/{provider}" if base_url else f"/api/webhook/{provider}"
+    return f"{SERVER_BASE_URL}/api/webhook/{provider}"
 
 
 def get_bot_username() -> str:
@@ -91,25 +192,18 @@ def get_return_url(source='miniapp', miniapp_type='v2') -> str:
         source: 'miniapp' для мини-апп (возврат в бот) или 'website' для сайта (возврат на сайт)
         miniapp_type: 'v2' для нового мини-аппа, 'v1' или 'old' для старого мини-аппа
     """
-    # Сначала пробуем YOUR_SERVER_IP, потом YOUR_SERVER_IP_OR_DOMAIN
-    base_url = os.getenv('YOUR_SERVER_IP') or os.getenv('YOUR_SERVER_IP_OR_DOMAIN', '')
+    # Для сайта возвращаем на страницу подписки
+    if source == 'website':
+        return WEBSITE_RETURN_URL
+
+    base_url = SERVER_BASE_URL
     if not base_url:
         # Если нет base_url, возвращаем относительный путь
-        if source == 'website':
-            return "/dashboard/subscription"
         # Для старого мини-аппа используем /miniapp/payment-success.html
         if miniapp_type in ('v1', 'old'):
             return "/miniapp/payment-success.html"
         return "/payment-success.html"
 
-    # Убеждаемся, что есть протокол
-    if not base_url.startswith(('http://', 'https://')):
-        base_url = f"https://{base_url}"
-
-    # Для сайта возвращаем на страницу подписки
-    if source == 'website':
-        return f"{base_url}/dashboard/subscription"
-
     # Для старого мини-аппа используем /miniapp/payment-success.html
     if miniapp_type in ('v1', 'old'):
         bot_username = get_bot_username() or 'stealthnet_test_bot'
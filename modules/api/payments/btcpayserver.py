@@ -3,7 +3,7 @@ BTCPay Server - self-hosted платёжная система для крипт
 https://btcpayserver.org/
 """
 import requests
-from modules.api.payments.base import get_payment_settings, decrypt_key, get_callback_url, get_return_url
+from modules.api.payments.base import get_decrypted_payment_settings, post_json, get_callback_url, get_return_url
 
 
 def create_btcpayserver_payment(amount: float, currency: str, order_id: str, **kwargs):
@@ -19,12 +19,12 @@ def create_btcpayserver_payment(amount: float, currency: str, order_id: str, **k
     Returns:
         tuple: (payment_url, invoice_id) или (None, error_message)
     """
-    settings = get_payment_settings()
+    settings = get_decrypted_payment_settings()
     if not settings:
         return None, "Payment settings not configured"
     
     server_url = settings.btcpayserver_url
-    api_key = decrypt_key(settings.btcpayserver_api_key)
+    api_key = settings.btcpayserver_api_key
     store_id = settings.btcpayserver_store_id
     
     if not server_url or not api_key or not store_id:
@@ -58,11 +58,10 @@ def create_btcpayserver_payment(amount: float, currency: str, order_id: str, **k
             "Content-Type": "application/json"
         }
         
-        response = requests.post(
+        response = post_json(
             f"{server_url}/api/v1/stores/{store_id}/invoices",
-            json=payload,
-            headers=headers,
-            timeout=30
+            payload,
+            headers=headers
         )
         
         data = response.json()
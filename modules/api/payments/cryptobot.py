@@ -3,7 +3,7 @@ CryptoBot - платёжная система Telegram
 https://t.me/CryptoBot
 """
 import requests
-from modules.api.payments.base import get_payment_settings, decrypt_key, get_callback_url
+from modules.api.payments.base import get_decrypted_payment_settings, post_json, get_callback_url
 
 
 def create_cryptobot_payment(amount: float, currency: str, order_id: str, **kwargs):
@@ -18,11 +18,11 @@ def create_cryptobot_payment(amount: float, currency: str, order_id: str, **kwar
     Returns:
         tuple: (payment_url, invoice_id) или (None, error_message)
     """
-    settings = get_payment_settings()
+    settings = get_decrypted_payment_settings()
     if not settings:
         return None, "Payment settings not configured"
     
-    api_key = decrypt_key(settings.cryptobot_api_key)
+    api_key = settings.cryptobot_api_key
     if not api_key:
         return None, "CryptoBot API key not configured"
     
@@ -46,11 +46,10 @@ def create_cryptobot_payment(amount: float, currency: str, order_id: str, **kwar
             "Content-Type": "application/json"
         }
         
-        response = requests.post(
+        response = post_json(
             "https://pay.crypt.bot/api/createInvoice",
-            json=payload,
-            headers=headers,
-            timeout=30
+            payload,
+            headers=headers
         )
         
         data = response.json()
@@ -73,11 +72,11 @@ def verify_cryptobot_signature(data: dict, signature: str) -> bool:
     import hashlib
     import hmac
     
-    settings = get_payment_settings()
+    settings = get_decrypted_payment_settings()
     if not settings:
         return False
     
-    api_key = decrypt_key(settings.cryptobot_api_key)
+    api_key = settings.cryptobot_api_key
     if not api_key:
         return False
     
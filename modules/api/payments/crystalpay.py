@@ -3,7 +3,7 @@ CrystalPay - платёжная система
 https://crystalpay.io/
 """
 import requests
-from modules.api.payments.base import get_payment_settings, decrypt_key, get_callback_url, get_return_url
+from modules.api.payments.base import get_decrypted_payment_settings, post_json, get_callback_url, get_return_url
 
 
 def create_crystalpay_payment(amount: float, currency: str, order_id: str, **kwargs):
@@ -18,12 +18,12 @@ def create_crystalpay_payment(amount: float, currency: str, order_id: str, **kwa
     Returns:
         tuple: (payment_url, payment_id) или (None, error_message)
     """
-    settings = get_payment_settings()
+    settings = get_decrypted_payment_settings()
     if not settings:
         return None, "Payment settings not configured"
     
-    api_key = decrypt_key(settings.crystalpay_api_key)
-    api_secret = decrypt_key(settings.crystalpay_api_secret)
+    api_key = settings.crystalpay_api_key
+    api_secret = settings.crystalpay_api_secret
     
     if not api_key or not api_secret:
         return None, "CrystalPay API credentials not configured"
@@ -42,10 +42,9 @@ def create_crystalpay_payment(amount: float, currency: str, order_id: str, **kwa
             "redirect_url": get_return_url(kwargs.get('source', 'miniapp'), kwargs.get('miniapp_type', 'v2'))
         }
         
-        response = requests.post(
+        response = post_json(
             "https://api.crystalpay.io/v3/invoice/create/",
-            json=payload,
-            timeout=30
+            payload
         )
         
         data = response.json()
@@ -66,11 +65,11 @@ def verify_crystalpay_signature(data: dict, signature: str) -> bool:
     """Проверить подпись webhook от CrystalPay"""
     import hashlib
     
-    settings = get_payment_settings()
+    settings = get_decrypted_payment_settings()
     if not settings:
         return False
     
-    api_secret = decrypt_key(settings.crystalpay_api_secret)
+    api_secret = settings.crystalpay_api_secret
     if not api_secret:
         return False
     
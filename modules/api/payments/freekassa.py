@@ -3,7 +3,7 @@ FreeKassa - платёжная система
 https://freekassa.ru/
 """
 import hashlib
-from modules.api.payments.base import get_payment_settings, decrypt_key, get_callback_url
+from modules.api.payments.base import get_decrypted_payment_settings, get_callback_url
 
 
 def create_freekassa_payment(amount: float, currency: str, order_id: str, **kwargs):
@@ -18,12 +18,12 @@ def create_freekassa_payment(amount: float, currency: str, order_id: str, **kwar
     Returns:
         tuple: (payment_url, order_id) или (None, error_message)
     """
-    settings = get_payment_settings()
+    settings = get_decrypted_payment_settings()
     if not settings:
         return None, "Payment settings not configured"
     
     shop_id = settings.freekassa_shop_id
-    secret = decrypt_key(settings.freekassa_secret)
+    secret = settings.freekassa_secret
     
     if not shop_id or not secret:
         return None, "FreeKassa credentials not configured"
@@ -54,11 +54,11 @@ def create_freekassa_payment(amount: float, currency: str, order_id: str, **kwar
 
 def verify_freekassa_signature(data: dict) -> bool:
     """Проверить подпись webhook от FreeKassa"""
-    settings = get_payment_settings()
+    settings = get_decrypted_payment_settings()
     if not settings:
         return False
     
-    secret2 = decrypt_key(settings.freekassa_secret2)
+    secret2 = settings.freekassa_secret2
     if not secret2:
         return False
     
@@ -3,7 +3,7 @@ Heleket - платёжная система для криптовалют
 https://heleket.com/
 """
 import requests
-from modules.api.payments.base import get_payment_settings, decrypt_key, get_callback_url, get_return_url
+from modules.api.payments.base import get_decrypted_payment_settings, post_json, get_callback_url, get_return_url
 
 
 def create_heleket_payment(amount: float, currency: str, order_id: str, **kwargs):
@@ -18,11 +18,11 @@ def create_heleket_payment(amount: float, currency: str, order_id: str, **kwargs
     Returns:
         tuple: (payment_url, payment_id) или (None, error_message)
     """
-    settings = get_payment_settings()
+    settings = get_decrypted_payment_settings()
     if not settings:
         return None, "Payment settings not configured"
     
-    api_key = decrypt_key(settings.heleket_api_key)
+    api_key = settings.heleket_api_key
     if not api_key:
         return None, "Heleket API key not configured"
     
@@ -47,11 +47,10 @@ def create_heleket_payment(amount: float, currency: str, order_id: str, **kwargs
             "Content-Type": "application/json"
         }
         
-        response = requests.post(
+        response = post_json(
             "https://api.heleket.com/v1/payment",
-            json=payload,
-            headers=headers,
-            timeout=30
+            payload,
+            headers=headers
         )
         
         data = response.json()
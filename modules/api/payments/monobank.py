@@ -3,8 +3,10 @@ Monobank - платёжная система (Украина)
 https://api.monobank.ua/
 """
 import requests
-from modules.api.payments.base import get_payment_settings, decrypt_key, get_callback_url, get_return_url
+from modules.api.payments.base import get_decrypted_payment_settings, post_json, get_callback_url, get_return_url
 
+# Код валюты платежа -> числовой код ISO 4217 (поле ccy); у всех валют 100 копеек в единице
+MONOBANK_CCY = {'UAH': 980, 'RUB': 643, 'USD': 840}
 
 def create_monobank_payment(amount: float, currency: str, order_id: str, **kwargs):
     """
@@ -18,11 +20,11 @@ def create_monobank_payment(amount: float, currency: str, order_id: str, **kwarg
     Returns:
         tuple: (payment_url, invoice_id) или (None, error_message)
     """
-    settings = get_payment_settings()
+    settings = get_decrypted_payment_settings()
     if not settings:
         return None, "Payment settings not configured"
     
-    token = decrypt_key(settings.monobank_token)
+    token = settings.monobank_token
     if not token:
         return None, "Monobank token not configured"
     
@@ -32,7 +34,7 @@ def create_monobank_payment(amount: float, currency: str, order_id: str, **kwarg
         
         payload = {
             "amount": amount_kopecks,
-            "ccy": 980,  # UAH ISO код
+            "ccy": MONOBANK_CCY['UAH'],
             "merchantPaymInfo": {
                 "reference": order_id,
                 "destination": f"Подписка StealthNET #{order_id}"
@@ -42,16 +44,11 @@ def create_monobank_payment(amount: float, currency: str, order_id: str, **kwarg
             "validity": 3600  # 1 час
         }
         
-        headers = {
-            "X-Token": token,
-            "Content-Type": "application/json"
-        }
-        
-        response = requests.post(
+        # Content-Type: application/json добавляет post_json
+        response = post_json(
             "https://api.monobank.ua/api/merchant/invoice/create",
-            json=payload,
-            headers=headers,
-            timeout=30
+            payload,
+            headers={"X-Token": token}
         )
         
         data = response.json()
@@ -3,7 +3,7 @@ Robokassa - платёжная система
 https://robokassa.com/
 """
 import hashlib
-from modules.api.payments.base import get_payment_settings, decrypt_key
+from modules.api.payments.base import get_decrypted_payment_settings
 
 
 def create_robokassa_payment(amount: float, currency: str, order_id: str, **kwargs):
@@ -19,12 +19,12 @@ def create_robokassa_payment(amount: float, currency: str, order_id: str, **kwar
     Returns:
         tuple: (payment_url, order_id) или (None, error_message)
     """
-    settings = get_payment_settings()
+    settings = get_decrypted_payment_settings()
     if not settings:
         return None, "Payment settings not configured"
     
     merchant_login = settings.robokassa_merchant_login
-    password1 = decrypt_key(settings.robokassa_password1)
+    password1 = settings.robokassa_password1
     
     if not merchant_login or not password1:
         return None, "Robokassa credentials not configured"
@@ -58,11 +58,11 @@ def create_robokassa_payment(amount: float, currency: str, order_id: str, **kwar
 
 def verify_robokassa_signature(data: dict) -> bool:
     """Проверить подпись webhook от Robokassa"""
-    settings = get_payment_settings()
+    settings = get_decrypted_payment_settings()
     if not settings:
         return False
     
-    password2 = decrypt_key(settings.robokassa_password2)
+    password2 = settings.robokassa_password2
     if not password2:
         return False
     
@@ -4,7 +4,7 @@ API эндпоинты для платежей
 from flask import jsonify, request
 from modules.core import get_app, get_db, get_fernet
 from modules.auth import admin_required, get_user_from_token
-from modules.models.payment import Payment, PaymentSetting
+from modules.models.payment import Payment, PaymentSetting, get_configured_payment_fields
 from modules.api.payments import create_payment, PAYMENT_PROVIDERS
 
 app = get_app()
@@ -24,9 +24,7 @@ def payment_settings(current_admin):
             # Перезагружаем объект из БД после создания
             db.session.refresh(s)
     except Exception as e:
-        print(f"Error initializing payment settings: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error initializing payment settings")
         s = PaymentSetting()
         db.session.add(s)
         try:
@@ -233,113 +231,42 @@ def payment_settings(current_admin):
         
     except Exception as e:
         db.session.rollback()
-        print(f"❌ Error updating payment settings: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("❌ Error updating payment settings")
         return jsonify({"message": f"Internal Error: {str(e)}"}), 500
 
 
+# Платёжный метод и поля настроек, без которых он не работает
+PAYMENT_METHOD_REQUIREMENTS = (
+    ('crystalpay', ('crystalpay_api_key', 'crystalpay_api_secret')),
+    ('heleket', ('heleket_api_key',)),
+    ('yookassa', ('yookassa_shop_id', 'yookassa_secret_key')),
+    ('platega', ('platega_api_key', 'platega_merchant_id')),
+    ('mulenpay', ('mulenpay_api_key', 'mulenpay_secret_key', 'mulenpay_shop_id')),
+    ('urlpay', ('urlpay_api_key', 'urlpay_secret_key', 'urlpay_shop_id')),
+    ('telegram_stars', ('telegram_bot_token',)),
+    ('monobank', ('monobank_token',)),
+    ('btcpayserver', ('btcpayserver_url', 'btcpayserver_api_key', 'btcpayserver_store_id')),
+    ('tribute', ('tribute_api_key',)),
+    ('robokassa', ('robokassa_merchant_login', 'robokassa_password1')),
+    ('freekassa', ('freekassa_shop_id', 'freekassa_secret')),
+    ('cryptobot', ('cryptobot_api_key',)),
+)
+
+
 @app.route('/api/public/available-payment-methods', methods=['GET'])
 def available_payment_methods():
     """Получить список доступных платёжных методов"""
-    def decrypt_key(key):
-        """Расшифровка ключа"""
-        fernet = get_fernet()
-        if not key or not fernet:
-            return ""
-        try:
-            return fernet.decrypt(key).decode('utf-8')
-        except:
-            return ""
-    
     try:
-        s = PaymentSetting.query.first()
-        if not s:
-            return jsonify({"available_methods": []}), 200
-        
-        available = []
-        
-        # CrystalPay - нужны api_key и api_secret
-        crystalpay_key = decrypt_key(s.crystalpay_api_key) if s.crystalpay_api_key else None
-        crystalpay_secret = decrypt_key(s.crystalpay_api_secret) if s.crystalpay_api_secret else None
-        if crystalpay_key and crystalpay_secret and crystalpay_key != "DECRYPTION_ERROR" and crystalpay_secret != "DECRYPTION_ERROR":
-            available.append('crystalpay')
-        
-        # Heleket - нужен api_key
-        heleket_key = decrypt_key(s.heleket_api_key) if s.heleket_api_key else None
-        if heleket_key and heleket_key != "DECRYPTION_ERROR":
-            available.append('heleket')
-        
-        # YooKassa - нужны shop_id и secret_key
-        yookassa_shop = decrypt_key(s.yookassa_shop_id) if s.yookassa_shop_id else None
-        yookassa_secret = decrypt_key(s.yookassa_secret_key) if s.yookassa_secret_key else None
-        if yookassa_shop and yookassa_secret and yookassa_shop != "DECRYPTION_ERROR" and yookassa_secret != "DECRYPTION_ERROR":
-            available.append('yookassa')
-        
-        # Platega - нужны api_key и merchant_id
-        platega_key = decrypt_key(getattr(s, 'platega_api_key', None)) if getattr(s, 'platega_api_key', None) else None
-        platega_merchant = decrypt_key(getattr(s, 'platega_merchant_id', None)) if getattr(s, 'platega_merchant_id', None) else None
-        if platega_key and platega_merchant and platega_key != "DECRYPTION_ERROR" and platega_merchant != "DECRYPTION_ERROR":
-            available.append('platega')
-        
-        # Mulenpay - нужны api_key, secret_key и shop_id
-        mulenpay_key = decrypt_key(getattr(s, 'mulenpay_api_key', None)) if getattr(s, 'mulenpay_api_key', None) else None
-        mulenpay_secret = decrypt_key(getattr(s, 'mulenpay_secret_key', None)) if getattr(s, 'mulenpay_secret_key', None) else None
-        mulenpay_shop = decrypt_key(getattr(s, 'mulenpay_shop_id', None)) if getattr(s, 'mulenpay_shop_id', None) else None
-        if mulenpay_key and mulenpay_secret and mulenpay_shop and mulenpay_key != "DECRYPTION_ERROR" and mulenpay_secret != "DECRYPTION_ERROR" and mulenpay_shop != "DECRYPTION_ERROR":
-            available.append('mulenpay')
-        
-        # UrlPay - нужны api_key, secret_key и shop_id
-        urlpay_key = decrypt_key(getattr(s, 'urlpay_api_key', None)) if getattr(s, 'urlpay_api_key', None) else None
-        urlpay_secret = decrypt_key(getattr(s, 'urlpay_secret_key', None)) if getattr(s, 'urlpay_secret_key', None) else None
-        urlpay_shop = decrypt_key(getattr(s, 'urlpay_shop_id', None)) if getattr(s, 'urlpay_shop_id', None) else None
-        if urlpay_key and urlpay_secret and urlpay_shop and urlpay_key != "DECRYPTION_ERROR" and urlpay_secret != "DECRYPTION_ERROR" and urlpay_shop != "DECRYPTION_ERROR":
-            available.append('urlpay')
-        
-        # Telegram Stars - нужен bot_token
-        telegram_token = decrypt_key(s.telegram_bot_token) if s.telegram_bot_token else None
-        if telegram_token and telegram_token != "DECRYPTION_ERROR":
-            available.append('telegram_stars')
-        
-        # Monobank - нужен token
-        monobank_token = decrypt_key(getattr(s, 'monobank_token', None)) if getattr(s, 'monobank_token', None) else None
-        if monobank_token and monobank_token != "DECRYPTION_ERROR":
-            available.append('monobank')
-        
-        # BTCPayServer - нужны url, api_key и store_id
-        btcpayserver_url = decrypt_key(getattr(s, 'btcpayserver_url', None)) if getattr(s, 'btcpayserver_url', None) else None
-        btcpayserver_api_key = decrypt_key(getattr(s, 'btcpayserver_api_key', None)) if getattr(s, 'btcpayserver_api_key', None) else None
-        btcpayserver_store_id = decrypt_key(getattr(s, 'btcpayserver_store_id', None)) if getattr(s, 'btcpayserver_store_id', None) else None
-        if btcpayserver_url and btcpayserver_api_key and btcpayserver_store_id and btcpayserver_url != "DECRYPTION_ERROR" and btcpayserver_api_key != "DECRYPTION_ERROR" and btcpayserver_store_id != "DECRYPTION_ERROR":
-            available.append('btcpayserver')
-        
-        # Tribute - нужен api_key
-        tribute_api_key = decrypt_key(getattr(s, 'tribute_api_key', None)) if getattr(s, 'tribute_api_key', None) else None
-        if tribute_api_key and tribute_api_key != "DECRYPTION_ERROR":
-            available.append('tribute')
-        
-        # Robokassa - нужны merchant_login и password1
-        robokassa_login = decrypt_key(getattr(s, 'robokassa_merchant_login', None)) if getattr(s, 'robokassa_merchant_login', None) else None
-        robokassa_password1 = decrypt_key(getattr(s, 'robokassa_password1', None)) if getattr(s, 'robokassa_password1', None) else None
-        if robokassa_login and robokassa_password1 and robokassa_login != "DECRYPTION_ERROR" and robokassa_password1 != "DECRYPTION_ERROR":
-            available.append('robokassa')
-        
-        # Freekassa - нужны shop_id и secret
-        freekassa_shop_id = decrypt_key(s.freekassa_shop_id) if s.freekassa_shop_id else None
-        freekassa_secret = decrypt_key(s.freekassa_secret) if s.freekassa_secret else None
-        if freekassa_shop_id and freekassa_secret and freekassa_shop_id != "DECRYPTION_ERROR" and freekassa_secret != "DECRYPTION_ERROR":
-            available.append('freekassa')
-        
-        # CryptoBot - нужен api_key
-        cryptobot_api_key = decrypt_key(s.cryptobot_api_key) if s.cryptobot_api_key else None
-        if cryptobot_api_key and cryptobot_api_key != "DECRYPTION_ERROR":
-            available.append('cryptobot')
+        # Достаточно знать, какие ключи заданы, - расшифровка не нужна
+        configured = get_configured_payment_fields()
+        available = [
+            method for method, fields in PAYMENT_METHOD_REQUIREMENTS
+            if configured.issuperset(fields)
+        ]
         
         return jsonify({"available_methods": available}), 200
         
     except Exception as e:
-        print(f"Error in available_payment_methods: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in available_payment_methods")
         return jsonify({"available_methods": []}), 200
 
@@ -3,7 +3,7 @@ Telegram Stars - оплата через Telegram
 https://core.telegram.org/bots/payments
 """
 import requests
-from modules.api.payments.base import get_payment_settings, decrypt_key
+from modules.api.payments.base import get_decrypted_payment_settings, post_json
 
 
 def create_telegram_stars_payment(amount: float, currency: str, order_id: str, **kwargs):
@@ -18,11 +18,11 @@ def create_telegram_stars_payment(amount: float, currency: str, order_id: str, *
     Returns:
         tuple: (invoice_link, order_id) или (None, error_message)
     """
-    settings = get_payment_settings()
+    settings = get_decrypted_payment_settings()
     if not settings:
         return None, "Payment settings not configured"
     
-    bot_token = decrypt_key(settings.telegram_bot_token)
+    bot_token = settings.telegram_bot_token
     if not bot_token:
         return None, "Telegram Bot Token not configured"
     
@@ -53,11 +53,9 @@ def create_telegram_stars_payment(amount: float, currency: str, order_id: str, *
             }]
         }
         
-        response = requests.post(
+        response = post_json(
             f"https://api.telegram.org/bot{bot_token}/createInvoiceLink",
-            json=payload,
-            headers={"Content-Type": "application/json"},
-            timeout=30
+            payload
         )
         
         data = response.json()
@@ -5,7 +5,7 @@ https://yookassa.ru/
 import requests
 import uuid
 import json
-from modules.api.payments.base import get_payment_settings, decrypt_key, get_callback_url, get_return_url
+from modules.api.payments.base import get_decrypted_payment_settings, post_json, get_callback_url, get_return_url
 
 
 def create_yookassa_payment(amount: float, currency: str, order_id: str, **kwargs):
@@ -21,13 +21,13 @@ def create_yookassa_payment(amount: float, currency: str, order_id: str, **kwarg
     Returns:
         tuple: (payment_url, payment_id) или (None, error_message)
     """
-    settings = get_payment_settings()
+    settings = get_decrypted_payment_settings()
     if not settings:
         return None, "Payment settings not configured"
     
     # Оба ключа должны быть расшифрованы
-    shop_id = decrypt_key(settings.yookassa_shop_id) if settings.yookassa_shop_id else None
-    secret_key = decrypt_key(settings.yookassa_secret_key) if settings.yookassa_secret_key else None
+    shop_id = settings.yookassa_shop_id or None
+    secret_key = settings.yookassa_secret_key or None
     
     # Если расшифровка не удалась, decrypt_key вернет пустую строку
     if not shop_id or not secret_key:
@@ -106,16 +106,15 @@ def create_yookassa_payment(amount: float, currency: str, order_id: str, **kwarg
                 print(f"[YOOKASSA] Receipt added: email={user_email}, vat_code={receipt_items[0].get('vat_code', 1)}")
         
         headers = {
+            "Authorization": settings.yookassa_basic_auth,
             "Content-Type": "application/json",
             "Idempotence-Key": str(uuid.uuid4())
         }
         
-        response = requests.post(
+        response = post_json(
             "https://api.yookassa.ru/v3/payments",
-            json=payload,
-            headers=headers,
-            auth=(shop_id, secret_key),
-            timeout=30
+            payload,
+            headers=headers
         )
         
         try:
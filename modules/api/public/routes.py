@@ -241,9 +241,7 @@ def public_branding():
         }), 200
 
     except Exception as e:
-        print(f"Error in public_branding: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("Error in public_branding")
         return jsonify({"message": "Internal Error"}), 500
 
 
@@ -275,13 +273,13 @@ def public_currency_rates():
 def get_public_nodes():
     """Публичные ноды для лендинга"""
     try:
-        import requests
+        from modules.remnawave import remnawave_session
         headers, cookies = {}, {}
         ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
         if ADMIN_TOKEN:
             headers["Authorization"] = f"Bearer {ADMIN_TOKEN}"
         
-        resp = requests.get(f"{os.getenv('API_URL')}/api/nodes/public", headers=headers, timeout=10)
+        resp = remnawave_session.get(f"{os.getenv('API_URL')}/api/nodes/public", headers=headers, timeout=10)
         resp.raise_for_status()
         return jsonify(resp.json()), 200
     except Exception as e:
@@ -17,6 +17,7 @@ import os
 import threading
 
 from modules.core import get_app, get_db, get_cache, get_fernet
+from modules.remnawave import invalidate_user_cache, invalidate_live_data, remnawave_session
 from modules.models.payment import Payment, PaymentSetting
 from modules.models.user import User
 from modules.models.tariff import Tariff
@@ -72,9 +73,7 @@ def add_referral_commission(user, amount_usd, is_tariff_purchase=True):
         print(f"[REFERRAL] Начислено {commission_usd:.2f} USD ({referral_percent}%) рефереру {referrer.id} за покупку пользователя {user.id}")
         
     except Exception as e:
-        print(f"[REFERRAL] Ошибка начисления комиссии: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("[REFERRAL] Ошибка начисления комиссии")
 
 
 def get_remnawave_headers(additional_headers=None):
@@ -130,7 +129,7 @@ def process_successful_payment(payment, user, tariff):
     headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
     
     try:
-        resp = requests.get(f"{API_URL}/api/users/{user.remnawave_uuid}", headers=headers)
+        resp = remnawave_session.get(f"{API_URL}/api/users/{user.remnawave_uuid}", headers=headers, timeout=10)
         if resp.status_code != 200:
             print(f"Failed to get user data: {resp.status_code}")
             return False
@@ -179,7 +178,7 @@ def process_successful_payment(payment, user, tariff):
             patch_payload["trafficLimitStrategy"] = "NO_RESET"
         
         h, c = get_remnawave_headers({"Content-Type": "application/json"})
-        patch_resp = requests.patch(f"{API_URL}/api/users", headers=h, cookies=c, json=patch_payload)
+        patch_resp = remnawave_session.patch(f"{API_URL}/api/users", headers=h, cookies=c, json=patch_payload, timeout=10)
         
         if not patch_resp.ok:
             print(f"Failed to update user: {patch_resp.status_code}")
@@ -199,9 +198,7 @@ def process_successful_payment(payment, user, tariff):
         add_referral_commission(user, amount_usd, is_tariff_purchase=True)
         db.session.commit()
         
-        cache.delete(f'live_data_{user.remnawave_uuid}')
-        cache.delete(f'nodes_{user.remnawave_uuid}')
-        cache.delete('all_live_users_map')
+        invalidate_user_cache(user.remnawave_uuid, nodes=True)
         
         # Отправляем уведомление админам
         try:
@@ -330,8 +327,7 @@ def yookassa_webhook():
                 payment.status = 'REFUNDED'
                 db.session.commit()
                 
-                cache.delete(f'live_data_{user.remnawave_uuid}')
-                cache.delete('all_live_users_map')
+                invalidate_user_cache(user.remnawave_uuid)
                 
                 print(f"[YOOKASSA] ✅ Balance refund processed: user_id={user.id}, refund={refund_amount_usd} USD, new_balance={new_balance} USD")
             else:
@@ -422,8 +418,7 @@ def yookassa_webhook():
                 add_referral_commission(user, amount_usd, is_tariff_purchase=False)
                 db.session.commit()
                 
-                cache.delete(f'live_data_{user.remnawave_uuid}')
-                cache.delete('all_live_users_map')
+                invalidate_user_cache(user.remnawave_uuid)
                 
                 # Отправляем уведомление админам
                 try:
@@ -542,7 +537,7 @@ def telegram_webhook():
             except Exception as e:
                 print(f"Error sending user payment notification: {e}")
             
-            cache.delete(f'live_data_{u.remnawave_uuid}')
+            invalidate_live_data(u.remnawave_uuid)
             return jsonify({"ok": True}), 200
         
         # Покупка тарифа
@@ -616,7 +611,7 @@ def process_telegram_payment_internal():
             except Exception as e:
                 print(f"[TELEGRAM-INTERNAL] Notification error: {e}")
             
-            cache.delete(f'live_data_{u.remnawave_uuid}')
+            invalidate_live_data(u.remnawave_uuid)
             print(f"[TELEGRAM-INTERNAL] Balance topped up: user={u.id}, amount={amount_usd} USD")
             return jsonify({
                 "success": True, 
@@ -641,9 +636,7 @@ def process_telegram_payment_internal():
             return jsonify({"success": False, "message": str(e)}), 500
         
     except Exception as e:
-        print(f"[TELEGRAM-INTERNAL] Error: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("[TELEGRAM-INTERNAL] Error")
         return jsonify({"success": False, "message": str(e)}), 500
 
 
@@ -770,8 +763,7 @@ def crystalpay_webhook():
             except Exception as e:
                 print(f"Error sending user payment notification: {e}")
             
-            cache.delete(f'live_data_{u.remnawave_uuid}')
-            cache.delete('all_live_users_map')
+            invalidate_user_cache(u.remnawave_uuid)
             
             return jsonify({"error": False}), 200
         
@@ -786,9 +778,7 @@ def crystalpay_webhook():
         return jsonify({"error": False}), 200
         
     except Exception as e:
-        print(f"[CRYSTALPAY] Error: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("[CRYSTALPAY] Error")
         return jsonify({"error": False}), 200
 
 
@@ -814,24 +804,11 @@ def platega_webhook():
     """
     # Всегда возвращаем 200 OK, даже при ошибках, чтобы Platega не повторял запрос
     try:
-        # Проверяем, что запрос содержит JSON
-        if not request.is_json:
-            # Пробуем распарсить как JSON вручную
-            try:
-                if request.data:
-                    import json as json_lib
-                    webhook_data = json_lib.loads(request.data.decode('utf-8'))
-                else:
-                    print("[PLATEGA] No JSON data in request")
-                    return jsonify({"status": "ok"}), 200
-            except Exception as parse_error:
-                print(f"[PLATEGA] Failed to parse JSON: {parse_error}")
-                return jsonify({"status": "ok"}), 200
-        else:
-            webhook_data = request.json
+        # JSON разбирается один раз и при любом Content-Type; невалидное тело даёт None
+        webhook_data = request.get_json(force=True, silent=True)
         
         if not webhook_data:
-            print("[PLATEGA] Empty webhook data")
+            print("[PLATEGA] Empty or invalid JSON in webhook")
             return jsonify({"status": "ok"}), 200
         
         # Логируем входящий webhook для отладки
@@ -965,9 +942,7 @@ def platega_webhook():
             return jsonify({"status": "ok"}), 200
         
     except Exception as e:
-        print(f"[PLATEGA] Error: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("[PLATEGA] Error")
         # Всегда возвращаем 200 OK с JSON ответом, чтобы Platega не повторял запрос
         # Это важно для своевременных обновлений статуса транзакций
         return jsonify({"status": "ok"}), 200
@@ -1008,9 +983,7 @@ def mulenpay_webhook():
             return jsonify({}), 200
         
     except Exception as e:
-        print(f"[MULENPAY] Error: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("[MULENPAY] Error")
         return jsonify({}), 200
 
 
@@ -1049,9 +1022,7 @@ def urlpay_webhook():
             return jsonify({}), 200
         
     except Exception as e:
-        print(f"[URLPAY] Error: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("[URLPAY] Error")
         return jsonify({}), 200
 
 
@@ -1094,9 +1065,7 @@ def btcpayserver_webhook():
             return jsonify({}), 200
         
     except Exception as e:
-        print(f"[BTCPAYSERVER] Error: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("[BTCPAYSERVER] Error")
         return jsonify({}), 200
 
 
@@ -1135,9 +1104,7 @@ def tribute_webhook():
             return jsonify({}), 200
         
     except Exception as e:
-        print(f"[TRIBUTE] Error: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("[TRIBUTE] Error")
         return jsonify({}), 200
 
 
@@ -1173,7 +1140,5 @@ def monobank_webhook():
             return jsonify({}), 200
         
     except Exception as e:
-        print(f"[MONOBANK] Error: {e}")
-        import traceback
-        traceback.print_exc()
+        app.logger.exception("[MONOBANK] Error")
         return jsonify({}), 200
@@ -5,6 +5,7 @@ from datetime import datetime, timedelta, timezone
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 import os
+import time
 from dotenv import load_dotenv
 
 # Загрузка переменных окружения
@@ -22,8 +23,11 @@ bcrypt = get_bcrypt()
 from modules.user import User
 
 # Функции аутентификации
+JWT_TTL_SECONDS = 24 * 60 * 60
+
 def create_local_jwt(user_id):
-    payload = {'iat': datetime.now(timezone.utc), 'exp': datetime.now(timezone.utc) + timedelta(days=1), 'sub': str(user_id)}
+    now = int(time.time())
+    payload = {'iat': now, 'exp': now + JWT_TTL_SECONDS, 'sub': str(user_id)}
     token = jwt.encode(payload, app.config['JWT_SECRET_KEY'], algorithm="HS256")
     return token
 
@@ -4,6 +4,7 @@
 """
 
 from flask import Flask
+from flask.json.provider import DefaultJSONProvider
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_caching import Cache
@@ -12,12 +13,26 @@ from flask_bcrypt import Bcrypt
 from flask_cors import CORS
 from flask_mail import Mail
 from cryptography.fernet import Fernet
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from logging.handlers import QueueHandler, QueueListener
+import atexit
+import copy
+import logging
 import os
+import queue
+import requests
+import sys
 from dotenv import load_dotenv
 
 # Загрузка переменных окружения
 load_dotenv()
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 # Основной экземпляр Flask (будет инициализирован в app.py)
 app = None
 
@@ -29,6 +44,71 @@ mail = None
 cache = None
 limiter = None
 
+class ORJSONProvider(DefaultJSONProvider):
+    """
+    JSON провайдер Flask на orjson: request.json и jsonify
+    разбирают и сериализуют JSON без pure-Python кодека.
+    """
+
+    # datetime/date сериализуются как у стандартного провайдера (HTTP-дата)
+    option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME if orjson else 0
+
+    def dumps(self, obj, **kwargs):
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self._dumps_bytes(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dumps_bytes(obj), mimetype=self.mimetype)
+
+    def _dumps_bytes(self, obj):
+        option = self.option
+        if self._app.debug:
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=self.default, option=option)
+        except orjson.JSONEncodeError:
+            # Например, int больше 64 бит - отдаём стандартному json
+            return super().dumps(obj).encode('utf-8')
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    QueueHandler без форматирования в потоке запроса
+
+    Аргументы сразу подставляются в сообщение (объекты могут измениться позже),
+    а стек исключения форматирует и пишет поток QueueListener.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def init_queue_logging(flask_app):
+    """Перевести app.logger на очередь: запись в stderr идёт в отдельном потоке"""
+    from flask.logging import default_handler
+
+    log_queue = queue.SimpleQueue()
+    stream_handler = logging.StreamHandler(sys.stderr)
+    stream_handler.setFormatter(logging.Formatter("[%(asctime)s] %(levelname)s in %(module)s: %(message)s"))
+    listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    flask_app.logger.removeHandler(default_handler)
+    flask_app.logger.addHandler(DeferredQueueHandler(log_queue))
+    return listener
+
+
 def init_app(flask_app):
     """
     Инициализация основного экземпляра Flask и всех расширений.
@@ -38,6 +118,11 @@ def init_app(flask_app):
 
     app = flask_app
 
+    if orjson:
+        app.json = ORJSONProvider(app)
+
+    init_queue_logging(app)
+
     # Конфигурация Flask
     app.config['JWT_SECRET_KEY'] = os.getenv("JWT_SECRET_KEY")
     
@@ -97,6 +182,9 @@ def init_app(flask_app):
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['FERNET_KEY'] = os.getenv("FERNET_KEY").encode() if os.getenv("FERNET_KEY") else None
 
+    # Cost factor bcrypt для новых хешей; пароли с другим cost перехешируются при входе
+    app.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv("BCRYPT_LOG_ROUNDS", 12))
+
     # Инициализация расширений
     db = SQLAlchemy(app)
     bcrypt = Bcrypt(app)
@@ -119,6 +207,8 @@ def init_app(flask_app):
     
     # Конфигурация кэширования (Redis, FileSystemCache или null)
     cache_type = os.getenv("CACHE_TYPE", "null").lower()
+    # Хранилище счётчиков rate limit: Redis (общий для всех воркеров) или память процесса
+    limiter_storage_uri = "memory://"
     
     if cache_type == "redis":
         # Redis кэширование (рекомендуется для продакшн)
@@ -153,6 +243,7 @@ def init_app(flask_app):
                 test_value = cache.get('test')
                 if test_value == 'value':
                     print(f"✅ Кэширование: Redis ({redis_host}:{redis_port}, DB {redis_db})")
+                    limiter_storage_uri = redis_url
                 else:
                     raise Exception("Cache test failed")
             except Exception as cache_error:
@@ -181,7 +272,15 @@ def init_app(flask_app):
         print("⚠️  Кэширование: отключено (null cache)")
     
     cache = Cache(app)
-    limiter = Limiter(get_remote_address, app=app, default_limits=["2000 per day", "500 per hour"], storage_uri="memory://")
+    # В Redis используем moving-window: точный лимит на скользящем окне (sorted set + Lua в limits),
+    # в памяти - fixed-window, чтобы не хранить метку каждого запроса в каждом воркере
+    limiter = Limiter(
+        get_remote_address,
+        app=app,
+        default_limits=["2000 per day", "500 per hour"],
+        storage_uri=limiter_storage_uri,
+        strategy="moving-window" if limiter_storage_uri.startswith("redis://") else "fixed-window"
+    )
 
     # CORS
     # Временно отключаем CORS для отладки
@@ -235,4 +334,31 @@ def get_limiter():
     """Возвращает экземпляр Limiter"""
     if limiter is None:
         raise RuntimeError("Limiter not initialized. Call init_app() first.")
-    return limiter
\ No newline at end of file
+    return limiter
+
+
+def create_http_session(pool_maxsize=32):
+    """
+    Создать requests.Session с пулом keep-alive соединений
+
+    Соединения (TCP + TLS) переиспользуются между запросами к одному хосту.
+    Идемпотентные GET повторяются при 502/503/504; ошибки подключения и
+    таймауты не повторяются, чтобы не умножать время ожидания.
+    """
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=pool_maxsize,
+        pool_maxsize=pool_maxsize,
+        max_retries=Retry(
+            total=2,
+            connect=0,
+            read=0,
+            backoff_factor=0.1,
+            status_forcelist=[502, 503, 504],
+            allowed_methods=frozenset(['GET']),
+            raise_on_status=False
+        )
+    )
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
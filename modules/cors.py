@@ -0,0 +1,85 @@
+"""
+CORS для публичных эндпоинтов (мини-приложение, статика, восстановление пароля)
+
+Заголовки и тело ответа на preflight собраны один раз при импорте,
+а не заново в каждой ветке обработчика.
+"""
+from functools import wraps
+
+from flask import current_app, make_response, request
+
+# CORS-заголовки ответов мини-приложения
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type',
+    'Access-Control-Allow-Methods': 'POST, OPTIONS'
+}
+
+# Статика мини-приложений отдаётся и на GET/HEAD
+STATIC_CORS_HEADERS = {**CORS_HEADERS, 'Access-Control-Allow-Methods': 'GET, HEAD, POST, OPTIONS'}
+
+# Ответ на preflight всегда одинаковый: тело сериализуется один раз
+PREFLIGHT_BODY = b'{}'
+
+# Префиксы путей мини-приложений (API и статика): preflight отвечает CORSPreflightMiddleware,
+# CORS-заголовки к остальным ответам добавляет add_miniapp_cors_headers
+PREFLIGHT_PATH_PREFIXES = ('/miniapp/', '/miniapp-v2/')
+
+
+def cors_preflight(headers=CORS_HEADERS):
+    """Ответ на CORS preflight (OPTIONS)"""
+    return current_app.response_class(PREFLIGHT_BODY, mimetype='application/json', headers=headers)
+
+
+class CORSPreflightMiddleware:
+    """
+    WSGI-обёртка над app.wsgi_app: preflight мини-приложений отвечается до Flask
+
+    OPTIONS на эти пути не проходит диспетчеризацию, before_request-хуки и лимитеры.
+    Заголовки статики включают методы API мини-приложения (POST, OPTIONS).
+    """
+
+    def __init__(self, wsgi_app, prefixes=PREFLIGHT_PATH_PREFIXES, headers=STATIC_CORS_HEADERS):
+        self.wsgi_app = wsgi_app
+        self.prefixes = prefixes
+        self.headers = list(headers.items())
+
+    def __call__(self, environ, start_response):
+        if environ.get('REQUEST_METHOD') == 'OPTIONS' and environ.get('PATH_INFO', '').startswith(self.prefixes):
+            start_response('204 No Content', self.headers)
+            return [b'']
+        return self.wsgi_app(environ, start_response)
+
+
+def add_miniapp_cors_headers(response):
+    """
+    after_request: CORS-заголовки ко всем ответам мини-приложений
+
+    Хук срабатывает и для ответов на ошибки (429 от лимитера, 500), которые
+    без заголовков браузер не отдал бы мини-приложению.
+    """
+    if request.path.startswith(PREFLIGHT_PATH_PREFIXES):
+        response.headers.update(CORS_HEADERS)
+    return response
+
+
+def init_cors(flask_app):
+    """Подключить CORS мини-приложений: preflight на уровне WSGI и заголовки в after_request"""
+    flask_app.wsgi_app = CORSPreflightMiddleware(flask_app.wsgi_app)
+    flask_app.after_request(add_miniapp_cors_headers)
+
+
+def with_cors(f):
+    """
+    Ответить на CORS preflight (OPTIONS) и добавить CORS-заголовки к ответу эндпоинта
+
+    Для эндпоинтов вне путей мини-приложений (их обслуживает init_cors).
+    """
+    @wraps(f)
+    def wrapper(*args, **kwargs):
+        if request.method == 'OPTIONS':
+            return cors_preflight()
+        response = make_response(f(*args, **kwargs))
+        response.headers.update(CORS_HEADERS)
+        return response
+    return wrapper
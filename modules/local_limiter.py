@@ -0,0 +1,64 @@
+"""
+Локальный rate limit (token bucket в памяти процесса)
+
+Для эндпоинтов, которым не нужен общий для всех воркеров счётчик:
+проверка лимита не обращается к Redis. Лимит действует в каждом
+воркере отдельно.
+"""
+import threading
+import time
+from functools import wraps
+
+from flask import request
+from flask_limiter.util import get_remote_address
+from limits import parse
+from werkzeug.exceptions import TooManyRequests
+
+# (эндпоинт, IP) -> [токены, время последнего пополнения]
+_buckets = {}
+_buckets_lock = threading.Lock()
+
+# Корзины без запросов дольше BUCKET_IDLE_SECONDS удаляются не чаще раза в PRUNE_INTERVAL
+BUCKET_IDLE_SECONDS = 600
+PRUNE_INTERVAL = 60
+_last_prune = time.monotonic()
+
+
+def _prune(now):
+    """Удалить неактивные корзины (вызывается под блокировкой)"""
+    global _last_prune
+    if now - _last_prune < PRUNE_INTERVAL:
+        return
+    _last_prune = now
+    for key in [k for k, (_, last) in _buckets.items() if now - last > BUCKET_IDLE_SECONDS]:
+        del _buckets[key]
+
+
+def local_limit(limit_value):
+    """
+    Декоратор лимита запросов с IP в формате flask-limiter ("30 per minute")
+
+    Ёмкость корзины - число запросов, скорость пополнения - число запросов за период.
+    CORS preflight (OPTIONS) не ограничивается.
+    """
+    item = parse(limit_value)
+    capacity = float(item.amount)
+    rate = item.amount / item.get_expiry()
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if request.method != 'OPTIONS':
+                key = (request.endpoint, get_remote_address())
+                now = time.monotonic()
+                with _buckets_lock:
+                    _prune(now)
+                    tokens, last = _buckets.get(key, (capacity, now))
+                    tokens = min(capacity, tokens + (now - last) * rate)
+                    allowed = tokens >= 1
+                    _buckets[key] = (tokens - 1 if allowed else tokens, now)
+                if not allowed:
+                    raise TooManyRequests(f"{limit_value}")
+            return f(*args, **kwargs)
+        return wrapper
+    return decorator
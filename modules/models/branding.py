@@ -1,10 +1,15 @@
 """
 Модель настроек брендинга
 """
-from modules.core import get_db
+from modules.core import get_db, get_cache
+from sqlalchemy import event
 
 db = get_db()
 
+# Настройки меняются только из админки, а читаются при каждой загрузке мини-приложения
+BRANDING_CONFIG_CACHE_KEY = 'branding_settings_config'
+BRANDING_CONFIG_CACHE_TIMEOUT = 300
+
 class BrandingSetting(db.Model):
     """Настройки брендинга"""
     id = db.Column(db.Integer, primary_key=True)
@@ -72,3 +77,20 @@ def get_branding_settings():
     return BrandingSetting.query.first()
 
 
+def get_branding_config():
+    """Настройки брендинга словарём из кэша (пустой словарь, если настроек нет)"""
+    cache = get_cache()
+    config = cache.get(BRANDING_CONFIG_CACHE_KEY)
+    if config is None:
+        branding = BrandingSetting.query.first()
+        config = {c.key: getattr(branding, c.key) for c in BrandingSetting.__table__.columns} if branding else {}
+        cache.set(BRANDING_CONFIG_CACHE_KEY, config, timeout=BRANDING_CONFIG_CACHE_TIMEOUT)
+    return config
+
+
+@event.listens_for(BrandingSetting, 'after_insert')
+@event.listens_for(BrandingSetting, 'after_update')
+@event.listens_for(BrandingSetting, 'after_delete')
+def invalidate_branding_config(mapper, connection, target):
+    """Сбросить кэш настроек при их изменении"""
+    get_cache().delete(BRANDING_CONFIG_CACHE_KEY)
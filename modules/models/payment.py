@@ -2,11 +2,17 @@
 Модели платежей и настроек платёжных систем
 """
 from datetime import datetime, timezone
-from modules.core import get_db, get_fernet
+from sqlalchemy import Text, event
+from modules.core import get_db, get_fernet, get_cache
 
 db = get_db()
 fernet = get_fernet()
 
+# Какие ключи заполнены - не секрет (это видно по списку методов оплаты),
+# поэтому множество полей хранится в общем кэше и не требует расшифровки
+CONFIGURED_FIELDS_CACHE_KEY = 'payment_settings_configured_fields'
+CONFIGURED_FIELDS_CACHE_TIMEOUT = 300
+
 class PaymentSetting(db.Model):
     """Настройки платёжных систем"""
     id = db.Column(db.Integer, primary_key=True)
@@ -66,6 +72,31 @@ class PaymentSetting(db.Model):
     freekassa_secret2 = db.Column(db.Text, nullable=True)
 
 
+def get_configured_payment_fields():
+    """
+    Имена заполненных текстовых полей PaymentSetting (frozenset)
+
+    Пустые ключи сохраняются как NULL, поэтому наличие шифротекста означает,
+    что ключ задан: Fernet для проверки не нужен.
+    """
+    cache = get_cache()
+    configured = cache.get(CONFIGURED_FIELDS_CACHE_KEY)
+    if configured is None:
+        columns = [c for c in PaymentSetting.__table__.columns if isinstance(c.type, Text)]
+        row = db.session.query(*columns).first()
+        configured = frozenset(c.key for c, value in zip(columns, row) if value) if row else frozenset()
+        cache.set(CONFIGURED_FIELDS_CACHE_KEY, configured, timeout=CONFIGURED_FIELDS_CACHE_TIMEOUT)
+    return configured
+
+
+@event.listens_for(PaymentSetting, 'after_insert')
+@event.listens_for(PaymentSetting, 'after_update')
+@event.listens_for(PaymentSetting, 'after_delete')
+def invalidate_configured_payment_fields(mapper, connection, target):
+    """Сбросить кэш заполненных полей при изменении настроек"""
+    get_cache().delete(CONFIGURED_FIELDS_CACHE_KEY)
+
+
 class Payment(db.Model):
     """Платёж"""
     id = db.Column(db.Integer, primary_key=True)
@@ -76,7 +107,7 @@ class Payment(db.Model):
     amount = db.Column(db.Float, nullable=False)
     currency = db.Column(db.String(5), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))
-    payment_system_id = db.Column(db.String(100), nullable=True)
+    payment_system_id = db.Column(db.String(100), nullable=True, index=True)  # Поиск платежа по ID в платёжной системе
     payment_provider = db.Column(db.String(20), nullable=True, default='crystalpay')
     promo_code_id = db.Column(db.Integer, db.ForeignKey('promo_code.id'), nullable=True)
     telegram_message_id = db.Column(db.Integer, nullable=True)  # ID сообщения в Telegram боте о создании платежа
@@ -14,3 +14,15 @@ class PromoCode(db.Model):
     uses_left = db.Column(db.Integer, nullable=False, default=1)
     squad_id = db.Column(db.String(100), nullable=True)  # ID сквада для промокодов типа DAYS
 
+    def apply_discount(self, amount):
+        """
+        Сумма после скидки PERCENT/FIXED (не меньше 0, с точностью до копейки)
+
+        Скидка считается в целых копейках, без хвостов float вида 89.99999999.
+        """
+        cents = round(float(amount) * 100)
+        if self.promo_type == 'PERCENT':
+            cents -= (cents * self.value + 50) // 100
+        elif self.promo_type == 'FIXED':
+            cents -= self.value * 100
+        return max(cents, 0) / 100
@@ -1,10 +1,15 @@
 """
 Модель реферальных настроек
 """
-from modules.core import get_db
+from modules.core import get_db, get_cache
+from sqlalchemy import event
 
 db = get_db()
 
+# Настройки меняются только из админки, а читаются при каждой активации триала
+REFERRAL_CONFIG_CACHE_KEY = 'referral_settings_config'
+REFERRAL_CONFIG_CACHE_TIMEOUT = 300
+
 class ReferralSetting(db.Model):
     """Настройки реферальной программы"""
     id = db.Column(db.Integer, primary_key=True)
@@ -20,3 +25,20 @@ def get_referral_settings():
     return ReferralSetting.query.first()
 
 
+def get_referral_config():
+    """Настройки реферальной программы словарём из кэша (пустой словарь, если настроек нет)"""
+    cache = get_cache()
+    config = cache.get(REFERRAL_CONFIG_CACHE_KEY)
+    if config is None:
+        settings = ReferralSetting.query.first()
+        config = {c.key: getattr(settings, c.key) for c in ReferralSetting.__table__.columns} if settings else {}
+        cache.set(REFERRAL_CONFIG_CACHE_KEY, config, timeout=REFERRAL_CONFIG_CACHE_TIMEOUT)
+    return config
+
+
+@event.listens_for(ReferralSetting, 'after_insert')
+@event.listens_for(ReferralSetting, 'after_update')
+@event.listens_for(ReferralSetting, 'after_delete')
+def invalidate_referral_config(mapper, connection, target):
+    """Сбросить кэш настроек при их изменении"""
+    get_cache().delete(REFERRAL_CONFIG_CACHE_KEY)
@@ -1,10 +1,15 @@
 """
 Модель системных настроек
 """
-from modules.core import get_db
+from modules.core import get_db, get_cache
+from sqlalchemy import event
 
 db = get_db()
 
+# Язык и валюта по умолчанию читаются при каждой регистрации - держим их в кэше
+SYSTEM_DEFAULTS_CACHE_KEY = 'system_settings_defaults'
+SYSTEM_DEFAULTS_CACHE_TIMEOUT = 60
+
 class SystemSetting(db.Model):
     """Системные настройки"""
     id = db.Column(db.Integer, primary_key=True)
@@ -34,3 +39,20 @@ def get_system_settings():
     return SystemSetting.query.first()
 
 
+def get_system_defaults():
+    """Получить (язык, валюта) по умолчанию для новых пользователей"""
+    cache = get_cache()
+    defaults = cache.get(SYSTEM_DEFAULTS_CACHE_KEY)
+    if defaults is None:
+        settings = SystemSetting.query.first()
+        defaults = (settings.default_language, settings.default_currency) if settings else ('ru', 'uah')
+        cache.set(SYSTEM_DEFAULTS_CACHE_KEY, defaults, timeout=SYSTEM_DEFAULTS_CACHE_TIMEOUT)
+    return defaults
+
+
+@event.listens_for(SystemSetting, 'after_insert')
+@event.listens_for(SystemSetting, 'after_update')
+@event.listens_for(SystemSetting, 'after_delete')
+def invalidate_system_defaults(mapper, connection, target):
+    """Сбросить кэш значений по умолчанию при изменении настроек"""
+    get_cache().delete(SYSTEM_DEFAULTS_CACHE_KEY)
@@ -2,10 +2,37 @@
 Модель тарифа
 """
 import json
-from modules.core import get_db
+from sqlalchemy import event
+from modules.core import get_db, get_cache
 
 db = get_db()
 
+# Список тарифов читается мини-приложением при каждом открытии, а меняется только из админки
+TARIFFS_CACHE_KEY = 'tariffs_list'
+TARIFFS_CACHE_TIMEOUT = 300
+
+# Валюта пользователя (uah/rub/usd) -> колонка цены тарифа и код валюты платежа
+TARIFF_PRICES = {
+    'uah': ('price_uah', 'UAH'),
+    'rub': ('price_rub', 'RUB'),
+    'usd': ('price_usd', 'USD'),
+}
+
+# Валюта пользователя -> код валюты платежа
+CURRENCY_CODES = {currency: code for currency, (_, code) in TARIFF_PRICES.items()}
+
+def parse_squad_ids(squad_ids, squad_id):
+    """Список сквадов из JSON-поля squad_ids или из старого поля squad_id"""
+    if squad_ids:
+        try:
+            return json.loads(squad_ids)
+        except:
+            return []
+    elif squad_id:
+        return [squad_id]
+    return []
+
+
 class Tariff(db.Model):
     """Тариф подписки"""
     id = db.Column(db.Integer, primary_key=True)
@@ -22,16 +49,17 @@ class Tariff(db.Model):
     badge = db.Column(db.String(50), nullable=True)  # Бейдж ('top_sale', etc.)
     bonus_days = db.Column(db.Integer, nullable=True, default=0)  # Бонусные дни
     
+    def get_price(self, *currencies):
+        """(цена, код валюты) для первой поддерживаемой валюты из списка; последняя - запасная"""
+        for currency in currencies:
+            if currency in TARIFF_PRICES:
+                break
+        column, code = TARIFF_PRICES[currency]
+        return getattr(self, column), code
+    
     def get_squad_ids(self):
         """Получить список сквадов из JSON или из старого поля squad_id"""
-        if self.squad_ids:
-            try:
-                return json.loads(self.squad_ids)
-            except:
-                return []
-        elif self.squad_id:
-            return [self.squad_id]
-        return []
+        return parse_squad_ids(self.squad_ids, self.squad_id)
     
     def set_squad_ids(self, squad_ids_list):
         """Установить список сквадов в JSON"""
@@ -44,3 +72,27 @@ class Tariff(db.Model):
                 self.squad_ids = None
         else:
             self.squad_ids = None
+
+
+def get_tariffs_list():
+    """
+    Тарифы списком словарей из кэша (по возрастанию id)
+
+    Ключи - колонки таблицы, кроме squad_ids: там уже разобранный список (get_squad_ids).
+    """
+    cache = get_cache()
+    tariffs = cache.get(TARIFFS_CACHE_KEY)
+    if tariffs is None:
+        # Только строки колонок: список только для чтения, ORM-объекты и identity map не нужны
+        rows = db.session.execute(db.select(*Tariff.__table__.columns).order_by(Tariff.id)).mappings()
+        tariffs = [{**row, 'squad_ids': parse_squad_ids(row['squad_ids'], row['squad_id'])} for row in rows]
+        cache.set(TARIFFS_CACHE_KEY, tariffs, timeout=TARIFFS_CACHE_TIMEOUT)
+    return tariffs
+
+
+@event.listens_for(Tariff, 'after_insert')
+@event.listens_for(Tariff, 'after_update')
+@event.listens_for(Tariff, 'after_delete')
+def invalidate_tariffs_list(mapper, connection, target):
+    """Сбросить кэш списка тарифов при изменении тарифа"""
+    get_cache().delete(TARIFFS_CACHE_KEY)
@@ -5,7 +5,6 @@ from datetime import datetime, timezone
 from modules.core import get_db
 from sqlalchemy import event
 import os
-import requests
 
 db = get_db()
 
@@ -13,6 +12,7 @@ class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=True)
     password_hash = db.Column(db.String(128), nullable=True)
+    has_password = db.Column(db.Boolean, default=False, nullable=False)  # Денормализовано из password_hash
     encrypted_password = db.Column(db.Text, nullable=True)
     role = db.Column(db.String(20), nullable=False, default='CLIENT')
     remnawave_uuid = db.Column(db.String(100), nullable=True)
@@ -37,10 +37,15 @@ class User(db.Model):
     referrer = db.relationship('User', remote_side=[id], backref='referrals')
 
 
+@event.listens_for(User.password_hash, 'set')
+def sync_has_password(target, value, oldvalue, initiator):
+    """Поддерживает has_password в соответствии с password_hash"""
+    target.has_password = bool(value)
+
+
 # Автоматическая синхронизация telegramId в RemnaWave при изменении telegram_id
 from sqlalchemy import event
 import os
-import requests
 
 @event.listens_for(User, 'after_update')
 def sync_telegram_id_to_remnawave(mapper, connection, target):
@@ -58,8 +63,10 @@ def sync_telegram_id_to_remnawave(mapper, connection, target):
                 ADMIN_TOKEN = os.getenv('ADMIN_TOKEN')
                 
                 if API_URL and ADMIN_TOKEN:
+                    # Импорт внутри: modules.remnawave при импорте обращается к приложению
+                    from modules.remnawave import remnawave_session
                     headers = {"Authorization": f"Bearer {ADMIN_TOKEN}"}
-                    requests.patch(
+                    remnawave_session.patch(
                         f"{API_URL}/api/users",
                         headers=headers,
                         json={"uuid": target.remnawave_uuid, "telegramId": str(new_value) if new_value else None},
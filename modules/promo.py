@@ -13,8 +13,7 @@ def apply_promo_code(promo_code, amount):
         return amount, None
     
     if promo.promo_type == 'PERCENT':
-        discount = (promo.value / 100.0) * amount
-        return max(0, amount - discount), promo
+        return promo.apply_discount(amount), promo
     
     return amount, promo
 
@@ -0,0 +1,395 @@
+"""
+Модуль для работы со списком пользователей RemnaWave
+
+Полный список GET /api/users загружается один раз за период кэша и
+раскладывается в индексы для поиска за O(1) вместо перебора списка.
+"""
+import math
+import os
+import random
+import re
+import threading
+import time
+import requests
+from collections import OrderedDict
+from types import MappingProxyType
+from urllib.parse import urlparse
+
+from modules.core import get_app, get_cache, create_http_session
+
+app = get_app()
+cache = get_cache()
+
+# Общая сессия с пулом соединений для всех запросов к RemnaWave API
+remnawave_session = create_http_session()
+
+# Заголовок авторизации RemnaWave API (ADMIN_TOKEN читается один раз при запуске);
+# общий словарь защищён от изменения в обработчиках
+ADMIN_HEADERS = MappingProxyType({"Authorization": f"Bearer {os.getenv('ADMIN_TOKEN')}"})
+
+# Новое имя ключа: под 'all_live_users_map' старые версии хранили список
+# пользователей другого формата, и при смешанном деплое он читался бы как индекс
+LIVE_USERS_INDEX_KEY = 'live_users_index'
+LIVE_USERS_INDEX_TIMEOUT = 60
+
+# Не даём нескольким потокам одновременно загружать полный список
+_index_lock = threading.Lock()
+
+UUID_RE = re.compile(r'^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$')
+
+
+def is_full_uuid(value):
+    """Проверить, что значение - полный UUID (а не shortUuid)"""
+    return bool(value) and len(value) == 36 and UUID_RE.match(value) is not None
+
+
+def extract_response(payload):
+    """Достать данные из ответа RemnaWave: {"response": ...} или сами данные"""
+    if isinstance(payload, dict) and 'response' in payload:
+        return payload['response']
+    return payload
+
+
+def extract_users(payload):
+    """Достать список пользователей из ответа GET /api/users любой формы"""
+    data = extract_response(payload)
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        return data.get('users') or data.get('items') or []
+    return []
+
+
+def invalidate_user_cache(remnawave_uuid, nodes=False):
+    """
+    Сбросить кэш данных пользователя RemnaWave и индекс пользователей
+
+    Ключи удаляются одним вызовом delete_many (в Redis - одна команда DEL).
+    """
+    keys = [f'live_data_{remnawave_uuid}', LIVE_USERS_INDEX_KEY]
+    if nodes:
+        keys.append(f'nodes_{remnawave_uuid}')
+    _l1_pop(keys[0])
+    cache.delete_many(*keys)
+
+
+def invalidate_live_data(remnawave_uuid):
+    """Сбросить кэш данных пользователя RemnaWave (без индекса пользователей)"""
+    key = f'live_data_{remnawave_uuid}'
+    _l1_pop(key)
+    cache.delete(key)
+
+
+# Данные пользователя RemnaWave (live_data_{uuid}) хранятся как
+# (данные, время получения, длительность запроса)
+LIVE_DATA_TIMEOUT = 300
+# Коэффициент XFetch: больше 1 - обновлять раньше, меньше 1 - позже
+LIVE_DATA_XFETCH_BETA = 1.0
+
+
+# L1: короткоживущая копия live_data в памяти процесса перед общим кэшем (Redis).
+# Открытое мини-приложение опрашивает свои данные каждые несколько секунд -
+# такие чтения не обращаются к Redis. Удаление через invalidate_* сбрасывает
+# L1 текущего процесса, в остальных запись живёт не дольше LIVE_DATA_L1_TTL
+LIVE_DATA_L1_TTL = 10
+LIVE_DATA_L1_MAXSIZE = 4096
+_live_data_l1 = OrderedDict()  # ключ -> (истекает, запись)
+_live_data_l1_lock = threading.Lock()
+
+
+def _l1_get(key):
+    """Запись из L1 или None"""
+    with _live_data_l1_lock:
+        item = _live_data_l1.get(key)
+        if item is None:
+            return None
+        if item[0] < time.monotonic():
+            del _live_data_l1[key]
+            return None
+        _live_data_l1.move_to_end(key)
+        return item[1]
+
+
+def _l1_set(key, entry):
+    """Сохранить запись в L1, вытесняя самые давние при переполнении"""
+    with _live_data_l1_lock:
+        _live_data_l1[key] = (time.monotonic() + LIVE_DATA_L1_TTL, entry)
+        _live_data_l1.move_to_end(key)
+        while len(_live_data_l1) > LIVE_DATA_L1_MAXSIZE:
+            _live_data_l1.popitem(last=False)
+
+
+def _l1_pop(key):
+    """Удалить запись из L1"""
+    with _live_data_l1_lock:
+        _live_data_l1.pop(key, None)
+
+
+def set_live_data(remnawave_uuid, data, delta=1.0):
+    """Сохранить данные пользователя RemnaWave в кэш (delta - время запроса в секундах)"""
+    key = f'live_data_{remnawave_uuid}'
+    entry = (data, time.time(), delta)
+    _l1_set(key, entry)
+    cache.set(key, entry, timeout=LIVE_DATA_TIMEOUT)
+
+
+def get_cached_live_data(remnawave_uuid, headers=None, cookies=None):
+    """
+    Данные пользователя RemnaWave из кэша или None
+
+    Если переданы headers, ближе к истечению кэша (XFetch) с растущей вероятностью
+    запускается фоновое обновление - одно на все процессы, - и запросы не
+    обращаются к RemnaWave одновременно в момент истечения.
+    """
+    key = f'live_data_{remnawave_uuid}'
+    entry = _l1_get(key)
+    if entry is None:
+        entry = cache.get(key)
+        if not entry:
+            return None
+        _l1_set(key, entry)
+    if not isinstance(entry, tuple):
+        # Запись в прежнем формате (только данные)
+        return entry
+    data, generated_at, delta = entry
+    if headers is not None:
+        # 1 - random() лежит в (0, 1], логарифм определён
+        early = -delta * LIVE_DATA_XFETCH_BETA * math.log(1.0 - random.random())
+        if time.time() + early >= generated_at + LIVE_DATA_TIMEOUT:
+            _start_live_data_refresh(remnawave_uuid, headers, cookies)
+    return data
+
+
+def get_live_user(remnawave_uuid, headers, cookies=None):
+    """
+    Данные пользователя RemnaWave: из кэша, при промахе - GET /api/users/{uuid}
+
+    Полученные данные сохраняются в кэш (live_data_{uuid}), поэтому повторные
+    запросы мини-приложения не обращаются к RemnaWave. Возвращает None, если
+    RemnaWave ответил не 200 или UUID пуст; сетевые ошибки не перехватываются.
+    """
+    if not remnawave_uuid:
+        return None
+    data = get_cached_live_data(remnawave_uuid, headers, cookies)
+    if data:
+        return data
+    resp = remnawave_session.get(
+        f"{os.getenv('API_URL')}/api/users/{remnawave_uuid}",
+        headers=headers,
+        cookies=cookies,
+        timeout=10
+    )
+    if resp.status_code != 200:
+        return None
+    data = extract_response(app.json.loads(resp.content))
+    set_live_data(remnawave_uuid, data, delta=resp.elapsed.total_seconds())
+    return data
+
+
+def _start_live_data_refresh(remnawave_uuid, headers, cookies):
+    """Запустить фоновое обновление, если его ещё не запустил другой запрос"""
+    if not cache.add(f'live_data_lock_{remnawave_uuid}', 1, timeout=10):
+        return
+    threading.Thread(
+        target=_refresh_live_data,
+        args=(remnawave_uuid, headers, cookies),
+        daemon=True
+    ).start()
+
+
+def _refresh_live_data(remnawave_uuid, headers, cookies):
+    """Фоновое обновление кэша данных пользователя RemnaWave"""
+    with app.app_context():
+        try:
+            resp = remnawave_session.get(
+                f"{os.getenv('API_URL')}/api/users/{remnawave_uuid}",
+                headers=headers,
+                cookies=cookies,
+                timeout=10
+            )
+            if resp.status_code == 200:
+                data = extract_response(app.json.loads(resp.content))
+                set_live_data(remnawave_uuid, data, delta=resp.elapsed.total_seconds())
+        except Exception as e:
+            app.logger.warning("Could not refresh live data for %s: %s", remnawave_uuid, e)
+        finally:
+            cache.delete(f'live_data_lock_{remnawave_uuid}')
+
+
+def _candidate_short_uuids(u):
+    """Все значения shortUuid пользователя RemnaWave (каждое поле читается один раз)"""
+    for key in ('shortUuid', 'short_uuid'):
+        if u.get(key):
+            yield u[key]
+    for extra in (u.get('metadata'), u.get('customFields')):
+        if isinstance(extra, dict):
+            for key in ('shortUuid', 'short_uuid'):
+                if extra.get(key):
+                    yield extra[key]
+    # shortUuid также является последним сегментом ссылки подписки
+    subscription_url = u.get('subscriptionUrl')
+    if subscription_url:
+        yield _url_tail(subscription_url)
+    for sub in u.get('subscriptions') or []:
+        if isinstance(sub, dict):
+            sub_url = sub.get('url') or sub.get('subscription_url') or sub.get('link')
+            if sub_url:
+                yield _url_tail(sub_url)
+
+
+def _url_tail(url):
+    """Последний сегмент пути ссылки"""
+    return urlparse(url).path.rstrip('/').rsplit('/', 1)[-1]
+
+
+def build_live_users_index(users_list):
+    """
+    Построить индексы пользователей RemnaWave
+
+    Returns:
+        dict: by_uuid (uuid -> пользователь), by_email (email/username -> uuid),
+              by_telegram_id (telegram_id -> uuid), by_short_uuid (shortUuid -> uuid)
+    """
+    by_uuid = {}
+    by_email = {}
+    by_telegram_id = {}
+    by_short_uuid = {}
+    for u in users_list:
+        # Записи без корректного UUID не попадают в индексы
+        if not isinstance(u, dict) or not is_full_uuid(u.get('uuid')):
+            continue
+        uuid = u['uuid']
+        by_uuid[uuid] = u
+        # Пробуем разные поля для email/username
+        email_key = u.get('email') or u.get('username') or u.get('name')
+        if email_key:
+            by_email[email_key.lower()] = uuid
+        telegram_id = u.get('telegramId') or u.get('telegram_id')
+        if telegram_id:
+            by_telegram_id[str(telegram_id)] = uuid
+        for short_uuid in _candidate_short_uuids(u):
+            by_short_uuid.setdefault(short_uuid, uuid)
+    return {
+        'by_uuid': by_uuid,
+        'by_email': by_email,
+        'by_telegram_id': by_telegram_id,
+        'by_short_uuid': by_short_uuid
+    }
+
+
+def get_live_users_index(headers=None, cookies=None, fetch=True):
+    """
+    Получить индексы пользователей RemnaWave из кэша
+
+    При fetch=False список не загружается, и если кэш пуст, возвращается None.
+    При ошибке загрузки возвращаются пустые индексы (без кэширования).
+    """
+    index = cache.get(LIVE_USERS_INDEX_KEY)
+    if index or not fetch:
+        return index
+
+    with _index_lock:
+        # Пока ждали блокировку, индекс мог построить другой поток
+        index = cache.get(LIVE_USERS_INDEX_KEY)
+        if index:
+            return index
+        try:
+            resp = remnawave_session.get(f"{os.getenv('API_URL')}/api/users", headers=headers, cookies=cookies, timeout=10)
+            # Разбираем байты ответа напрямую (orjson через app.json), без
+            # промежуточной декодированной строки размером с весь список
+            index = build_live_users_index(extract_users(app.json.loads(resp.content)))
+            cache.set(LIVE_USERS_INDEX_KEY, index, timeout=LIVE_USERS_INDEX_TIMEOUT)
+        except Exception as e:
+            app.logger.warning("Could not fetch live users: %s", e)
+            index = build_live_users_index([])
+    return index
+
+
+# Результат поиска shortUuid кэшируется (в т.ч. отрицательный), чтобы
+# повторные запросы не обращались к RemnaWave API
+SHORT_UUID_CACHE_TIMEOUT = 300
+_SHORT_UUID_MISS = '__miss__'
+
+# Выполняющиеся в процессе поиски shortUuid: shortUuid -> threading.Event
+_short_uuid_inflight = {}
+_short_uuid_inflight_lock = threading.Lock()
+
+
+def cache_stores_results():
+    """Сохраняет ли настроенный кэш значения (False для CACHE_TYPE=null)"""
+    return app.config.get('CACHE_TYPE', 'null').lower() not in ('null', 'nullcache')
+
+
+def resolve_short_uuid(short_uuid, headers, cookies=None):
+    """
+    Найти полный UUID пользователя RemnaWave по shortUuid
+
+    Порядок: индекс пользователей из кэша -> кэш результатов поиска ->
+    GET /api/users/by-short-uuid/{shortUuid}. Одновременные запросы одного
+    shortUuid в процессе ждут первый из них (если кэш включён). Ошибки сети
+    не перехватываются.
+
+    Returns:
+        tuple: (uuid или None, данные пользователя или None)
+    """
+    index = get_live_users_index(fetch=False)
+    if index:
+        uuid = index.get('by_short_uuid', {}).get(short_uuid)
+        if uuid:
+            return uuid, index['by_uuid'].get(uuid)
+
+    cache_key = f'short_uuid_{short_uuid}'
+    cached = cache.get(cache_key)
+    if cached == _SHORT_UUID_MISS:
+        return None, None
+    if cached:
+        return cached, None
+
+    if not cache_stores_results():
+        # Кэш отключён - ждать результат другого потока бессмысленно
+        return _fetch_short_uuid(short_uuid, cache_key, headers, cookies)
+
+    with _short_uuid_inflight_lock:
+        event = _short_uuid_inflight.get(short_uuid)
+        is_leader = event is None
+        if is_leader:
+            event = threading.Event()
+            _short_uuid_inflight[short_uuid] = event
+
+    if not is_leader:
+        # Поиск уже выполняется в другом потоке - берём его результат из кэша
+        event.wait(timeout=15)
+        cached = cache.get(cache_key)
+        if cached == _SHORT_UUID_MISS:
+            return None, None
+        if cached:
+            return cached, None
+        # Результата нет (ошибка сети у первого запроса) - ищем сами
+        return _fetch_short_uuid(short_uuid, cache_key, headers, cookies)
+
+    try:
+        return _fetch_short_uuid(short_uuid, cache_key, headers, cookies)
+    finally:
+        with _short_uuid_inflight_lock:
+            _short_uuid_inflight.pop(short_uuid, None)
+        event.set()
+
+
+def _fetch_short_uuid(short_uuid, cache_key, headers, cookies):
+    """Запрос GET /api/users/by-short-uuid с кэшированием результата"""
+    resp = remnawave_session.get(
+        f"{os.getenv('API_URL')}/api/users/by-short-uuid/{short_uuid}",
+        headers=headers,
+        cookies=cookies,
+        timeout=10
+    )
+    if resp.status_code == 200:
+        user_data = extract_response(app.json.loads(resp.content))
+        found_uuid = user_data.get('uuid') if isinstance(user_data, dict) else None
+        if is_full_uuid(found_uuid):
+            cache.set(cache_key, found_uuid, timeout=SHORT_UUID_CACHE_TIMEOUT)
+            return found_uuid, user_data
+        cache.set(cache_key, _SHORT_UUID_MISS, timeout=SHORT_UUID_CACHE_TIMEOUT)
+    elif resp.status_code == 404:
+        cache.set(cache_key, _SHORT_UUID_MISS, timeout=SHORT_UUID_CACHE_TIMEOUT)
+    return None, None
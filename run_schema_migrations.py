@@ -40,6 +40,8 @@ def run_all_schema_migrations(app=None):
         ('add_squad_id_to_promo_code.py', 'add_squad_id_to_promo_code'),
         ('add_is_admin_to_ticket_message.py', 'add_is_admin_to_ticket_message'),
         ('add_telegram_message_id_to_payment.py', 'add_telegram_message_id_to_payment'),
+        ('add_has_password_to_user.py', 'add_has_password_to_user'),
+        ('add_payment_system_id_index.py', 'add_payment_system_id_index'),
     ]
     
     success_count = 0